@@ -65,6 +65,7 @@ def build(args, is_testing=False):
     BUILD_DOCKERFILE = "{}/build.Dockerfile".format(DIR_PATH)
     BUILD_PIPFILE = "{}/build.requirements.txt".format(DIR_PATH)
     CORE_PIPDEPS = "{}/src/build/core.requirements.txt".format(DIR_PATH)
+    TEST_PIPDEPS = "{}/src/build/test.requirements.txt".format(DIR_PATH)
     CORE_HEADER_DOCKER = "{}/src/build/{}-header.Dockerfile".format(
         DIR_PATH, "gpu" if args.gpu else "cpu"
     )
@@ -76,6 +77,9 @@ def build(args, is_testing=False):
 
     print("Collecting partial dependencies from selector and analyser folders...")
     pipdeps = lines_from_files([CORE_PIPDEPS])
+    # the dependencies that only the tests need, such as the moto server that stands in for S3
+    if is_testing or ("test" in args and args.test):
+        add_deps(TEST_PIPDEPS, pipdeps, should_add_pipdep)
 
     dockerlines = lines_from_files([CORE_HEADER_DOCKER, CORE_START_DOCKER])
 
@@ -303,6 +307,7 @@ def parse_args(cli_args):
     dev_p.add_argument("--gpu", action="store_true")
     dev_p.add_argument("--dry", action="store_true")
     dev_p.add_argument("--verbose", action="store_true")
+    dev_p.add_argument("--test", action="store_true")
     dev_p.add_argument("--yaml", type=str2yamlfile)
     dev_p.add_argument(
         "command",
@@ -0,0 +1,52 @@
+"""
+Compare two runs of a benchmark, such as on two commits, from the JSON files that they wrote with `--out`.
+
+Every number that is in both files and differs between them is printed with the ratio of the new value to the old,
+keyed by its path in the results. Lower is better for every timing that the benchmarks record.
+"""
+import sys
+import json
+import argparse
+
+
+def numbers(results, prefix=""):
+    if isinstance(results, dict):
+        for k, v in results.items():
+            yield from numbers(v, f"{prefix}.{k}" if prefix else k)
+    elif isinstance(results, (int, float)) and not isinstance(results, bool):
+        yield prefix, results
+
+
+def compare(old: dict, new: dict) -> list:
+    """The `(key, old, new, ratio)` of each number in both results whose value differs."""
+    olds = dict(numbers(old))
+    rows = []
+    for key, value in numbers(new):
+        if key not in olds or olds[key] == value:
+            continue
+        ratio = value / olds[key] if olds[key] != 0 else float("inf")
+        rows.append((key, olds[key], value, ratio))
+    return rows
+
+
+def main(args):
+    with open(args.old, "r") as f:
+        old = json.load(f)
+    with open(args.new, "r") as f:
+        new = json.load(f)
+    if old.get("benchmark") != new.get("benchmark"):
+        sys.exit(
+            f"cannot compare '{old.get('benchmark')}' with '{new.get('benchmark')}'"
+        )
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    rows = compare(old, new)
+    width = max([len(r[0]) for r in rows] + [0])
+    for key, before, after, ratio in rows:
+        print(f"{key:<{width}}  {before:>12.4g}  {after:>12.4g}  {ratio:>7.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("old", type=str)
+    parser.add_argument("new", type=str)
+    main(parser.parse_args())
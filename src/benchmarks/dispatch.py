@@ -0,0 +1,95 @@
+"""
+Peak memory of the dispatching process, and time to first element, for a parallel phase over a large element index.
+
+Elements are rows like those a selector streams out of its element_map.csv, produced by a generator. The phase is run
+once with elements streamed onto the work queue as the generator produces them, and once with the 'longest_first'
+schedule, which reads every element into memory before dispatching any (as all phases used to). Each run happens in a
+fresh process so that its peak RSS can be measured on its own.
+"""
+import os
+import json
+import time
+import shutil
+import resource
+import argparse
+import multiprocessing
+from types import SimpleNamespace as Ns
+from lib.common.mtmodule import MTModule
+from lib.common.storage import LocalStorage
+
+FOLDER = "media/benchmarks"
+
+
+class RowModule(MTModule):
+    in_parallel = True
+
+    @MTModule.phase("benchmark")
+    def run(self, rows):
+        for row in rows:
+            if row.id == "0":
+                with open(self.config["first_file"], "w") as f:
+                    f.write(str(time.time()))
+
+
+def rows(count, payload):
+    for idx in range(count):
+        yield Ns(id=str(idx), url=f"https://example.com/{idx}", desc="x" * payload)
+
+
+def run_once(config, count, payload, out):
+    mod = RowModule(config, "RowModule", LocalStorage(folder=FOLDER))
+    start = time.time()
+    mod.run(rows(count, payload))
+    end = time.time()
+    with open(config["first_file"], "r") as f:
+        first = float(f.read())
+    out.put(
+        {
+            "seconds": end - start,
+            "first_element": first - start,
+            # NB: ru_maxrss is in kilobytes on Linux
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+    )
+
+
+def main(args):
+    storage = LocalStorage(folder=FOLDER)
+    first_file = storage.base_dir / "first_element.txt"
+    base = {"workers": args.workers, "first_file": str(first_file)}
+    modes = {
+        "streamed": base,
+        "materialised": {**base, "schedule": "longest_first"},
+    }
+    results = {
+        "benchmark": "dispatch",
+        "elements": args.elements,
+        "payload_bytes": args.payload,
+        "workers": args.workers,
+    }
+    for name, config in modes.items():
+        out = multiprocessing.Queue()
+        p = multiprocessing.Process(
+            target=run_once, args=(config, args.elements, args.payload, out)
+        )
+        p.start()
+        results[name] = out.get()
+        p.join()
+
+    shutil.rmtree(storage.base_dir)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--elements", type=int, default=200000)
+    parser.add_argument("--payload", type=int, default=1024)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--out", type=str, default=None)
+    args = parser.parse_args()
+
+    results = main(args)
+    print(json.dumps(results, indent=2))
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,191 @@
+"""
+Bytes written by `Frames` with each of its codecs, and the throughput of a classifier that reads the frames.
+
+A synthetic 1080p video of `--seconds` seconds, made with ffmpeg's testsrc2 source, is copied into `--elements`
+elements, and `Frames` is run over them at 1 fps with each of `--options`, each a codec with an optional quality and
+max dimension, such as `bmp`, `jpg:90` or `webp:75:720`. For each option the benchmark reports:
+    bytes, bytes_per_frame: the total size of the frames written, and of each one.
+    frames_seconds: the time of the Frames phase.
+    classify_seconds, frames_per_second: the time of a phase that reads every frame as the image analysers do,
+        decoding it with PIL and resizing it to 224x224, and runs a stand-in for a model's forward pass on them.
+Requires ffmpeg and PIL, as the mtriage container has with Frames and an image analyser built.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import contextlib
+import subprocess
+import numpy as np
+from PIL import Image
+from lib.analysers.Frames.core import Frames
+from lib.common.analyser import Analyser
+from lib.common.archives import readable
+from lib.common.etypes import Etype
+from lib.common.storage import LocalStorage
+from lib.common.util import MAX_CPUS, subdirs
+from lib.etypes.cvjson import CvJson, IMG_SFXS
+from benchmarks.pipeline import commit
+
+FOLDER = "media/benchmarks/frames"
+SELECTOR = "Synthetic"
+INPUT_SIZE = (224, 224)
+
+
+class Classifier(Analyser):
+    out_etype = Etype.Any
+    in_parallel = True
+
+    def preprocess(self, img_paths):
+        return np.stack(
+            [
+                np.asarray(
+                    Image.open(readable(p)).convert("RGB").resize(INPUT_SIZE),
+                    dtype=np.float32,
+                )
+                for p in img_paths
+            ]
+        )
+
+    def get_batch_preds(self, img_paths):
+        # NB: a stand-in for a model's forward pass, so that the frames' reading and decoding is what is measured
+        scores = self.preprocess(img_paths).mean(axis=(1, 2, 3)) / 255
+        return [[("bright", float(s))] for s in scores]
+
+    def analyse_element(self, element, config):
+        return CvJson.from_preds(
+            element,
+            lambda p: self.get_batch_preds([p])[0],
+            staging=self.staging_path,
+        )
+
+    def analyse_batch(self, elements, config):
+        return CvJson.from_batch_preds(
+            elements, self.get_batch_preds, staging=self.staging_path
+        )
+
+
+def parse_option(option: str) -> dict:
+    parts = option.split(":")
+    config = {"codec": parts[0]}
+    if len(parts) > 1 and parts[1] != "":
+        config["quality"] = int(parts[1])
+    if len(parts) > 2:
+        config["max_dimension"] = int(parts[2])
+    return config
+
+
+def build_elements(storage, args):
+    video = storage.base_dir / "source.mp4"
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-y",
+            "-f",
+            "lavfi",
+            "-i",
+            f"testsrc2=size=1920x1080:rate=30:duration={args.seconds}",
+            "-pix_fmt",
+            "yuv420p",
+            str(video),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    )
+    data = storage.read_query(SELECTOR)
+    for idx in range(args.elements):
+        el_dir = data / f"{idx:05d}"
+        el_dir.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(video, el_dir / "video.mp4")
+
+
+def frame_files(storage, q: str) -> list:
+    return [
+        f for el in storage.read_elements([q]) for f in el.paths if f.suffix in IMG_SFXS
+    ]
+
+
+def run_option(option: str, args) -> dict:
+    name = option.replace(":", "_")
+    config = {"elements_in": [SELECTOR], "workers": args.workers, "fps": 1}
+    config.update(parse_option(option))
+    storage = LocalStorage(
+        folder=FOLDER, catalog=False, archive_min_files=args.archive_min_files
+    )
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        Frames(config, f"Frames_{name}", storage).start_analysing()
+        frames_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        Classifier(
+            {"elements_in": [f"{SELECTOR}/Frames_{name}"], "workers": args.workers},
+            f"Classifier_{name}",
+            storage,
+        ).start_analysing()
+        classify_seconds = time.perf_counter() - start
+
+    frames = frame_files(storage, f"{SELECTOR}/Frames_{name}")
+    written = sum(
+        os.path.getsize(f)
+        for el_dir in subdirs(storage.read_query(f"{SELECTOR}/Frames_{name}"))
+        for f in el_dir.iterdir()
+        if f.suffix != ".json"
+    )
+    return {
+        "frames": len(frames),
+        "bytes": written,
+        "bytes_per_frame": written / max(1, len(frames)),
+        "frames_seconds": frames_seconds,
+        "classify_seconds": classify_seconds,
+        "frames_per_second": len(frames) / classify_seconds,
+    }
+
+
+def main(args):
+    results = {
+        "benchmark": "frames",
+        "commit": commit(),
+        "python": platform.python_version(),
+        "cpus": MAX_CPUS,
+        "workers": args.workers,
+        "elements": args.elements,
+        "seconds": args.seconds,
+        "archive_min_files": args.archive_min_files,
+        "options": {},
+    }
+    storage = LocalStorage(folder=FOLDER, catalog=False)
+    if storage.read_query(SELECTOR).exists():
+        shutil.rmtree(storage.read_query(SELECTOR))
+    build_elements(storage, args)
+    for option in args.options:
+        print(f"Frames as {option}...", file=sys.stderr)
+        results["options"][option] = run_option(option, args)
+    shutil.rmtree(storage.base_dir)
+    return results
+
+
+if __name__ == "__main__":
+    csv = lambda cast: lambda s: [cast(x) for x in s.split(",")]
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--options",
+        type=csv(str),
+        default=["bmp", "png", "jpg:90", "jpg:75:720", "webp:90", "webp:75:720"],
+    )
+    parser.add_argument("--elements", type=int, default=20)
+    parser.add_argument("--seconds", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=MAX_CPUS)
+    parser.add_argument("--archive-min-files", type=int, default=None)
+    parser.add_argument("--out", type=str, default=None)
+    args = parser.parse_args()
+
+    results = main(args)
+    print(json.dumps(results, indent=2))
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,87 @@
+"""
+Cost of writing and reading a selector's element index, as element_map.csv and in the columnar format.
+
+A synthetic index of 4chan-like posts (an id, a thread, a time, a comment of a few hundred characters, and a filename,
+extension and URL) is streamed to `LocalStorage.write_elements_index` in each format, the columnar one being written
+along with element_map.csv as it always is, and then read back through `read_elements_index`, once with every column
+and once with only the 'id' and 'url' columns that a retriever might need. The peak memory of the process is reported
+after each format's runs.
+"""
+import json
+import time
+import random
+import shutil
+import argparse
+import resource
+from lib.common.columnar import CSV, COLUMNAR
+from lib.common.etypes import LocalElementsIndex
+from lib.common.storage import LocalStorage
+
+FOLDER = "media/benchmarks/index"
+WORDS = ["the", "thread", "image", "source", "video", "anon", "post", "reply", "bump"]
+
+
+def posts(rows: int):
+    rng = random.Random(0)
+    yield ["id", "thread_id", "datetime", "comment", "filename", "ext", "url"]
+    for idx in range(rows):
+        comment = " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 80)))
+        yield [
+            idx,
+            idx // 200,
+            1600000000 + idx,
+            comment,
+            f"{idx}.jpg",
+            ".jpg",
+            f"https://i.4cdn.org/pol/{idx}.jpg",
+        ]
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def drain(rows):
+    for _ in rows:
+        pass
+
+
+def main(args):
+    results = {
+        "benchmark": "index",
+        "rows": args.rows,
+        "seconds": {},
+        "peak_rss_mb": {},
+    }
+    for fmt in [CSV, COLUMNAR]:
+        disk = LocalStorage(folder=FOLDER, catalog=False, index_format=fmt)
+        seconds = results["seconds"].setdefault(fmt, {})
+        seconds["write"] = timed(
+            lambda: disk.write_elements_index(
+                "sel", LocalElementsIndex(posts(args.rows))
+            )
+        )
+        seconds["read"] = timed(lambda: drain(disk.read_elements_index("sel").rows))
+        seconds["read_projected"] = timed(
+            lambda: drain(disk.read_elements_index("sel", ["id", "url"]).rows)
+        )
+        results["peak_rss_mb"][fmt] = (
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        )
+        shutil.rmtree(disk.base_dir)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--out", type=str, default=None)
+    args = parser.parse_args()
+
+    results = main(args)
+    print(json.dumps(results, indent=2))
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,90 @@
+"""
+Cost of logging in a parallel phase, with per-worker log shards and with a Manager-proxied log list.
+
+A synthetic module logs a number of lines for each element, as `Frames` or `Local` do for every element or file. The
+phase is timed once logging through `MTModule.logger`, which buffers lines in each worker and writes them to that
+worker's shard, and once appending every line to a `multiprocessing.Manager().list()`, as `MTModule.logger` used to.
+The shards are timed again with a 'verbosity' of "error", so that the lines are written to the logs but not printed. A
+phase that does not log at all is timed as a baseline. Console output is discarded in all four runs.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import contextlib
+import multiprocessing
+from lib.common.mtmodule import MTModule
+from lib.common.storage import LocalStorage
+
+FOLDER = "media/benchmarks"
+
+
+class LogModule(MTModule):
+    in_parallel = True
+
+    @MTModule.phase("benchmark")
+    def run(self, elements):
+        mode, lines = self.config["mode"], self.config["lines_per_element"]
+        for element in elements:
+            for line in range(lines):
+                msg = f"line {line} for element {element}"
+                if mode in ["shards", "quiet"]:
+                    self.logger(msg)
+                elif mode == "manager":
+                    msg = f"{self.name}: {self.PHASE_KEY}: {msg}"
+                    self.config["manager_logs"].append(msg)
+                    print(msg)
+
+
+def timed(config):
+    storage = LocalStorage(folder=FOLDER)
+    mod = LogModule(config, "LogModule", storage)
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        mod.run(e for e in range(config["elements"]))
+        if config["mode"] == "manager":
+            storage.write_logs(list(config["manager_logs"]))
+        storage.flush_logs()
+    return time.perf_counter() - start
+
+
+def main(args):
+    base = {
+        "workers": args.workers,
+        "elements": args.elements,
+        "lines_per_element": args.lines,
+    }
+    manager = multiprocessing.Manager()
+    results = {"benchmark": "logs", **base, "seconds": {}}
+    for mode in ["none", "shards", "quiet", "manager"]:
+        config = {**base, "mode": mode}
+        if mode == "quiet":
+            config["verbosity"] = "error"
+        if mode == "manager":
+            config["manager_logs"] = manager.list()
+        results["seconds"][mode] = timed(config)
+
+    lines = args.elements * args.lines
+    for mode in ["shards", "quiet", "manager"]:
+        overhead = results["seconds"][mode] - results["seconds"]["none"]
+        results[f"{mode}_us_per_line"] = overhead / lines * 1e6
+
+    shutil.rmtree(LocalStorage(folder=FOLDER).base_dir)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--elements", type=int, default=2000)
+    parser.add_argument("--lines", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--out", type=str, default=None)
+    args = parser.parse_args()
+
+    results = main(args)
+    print(json.dumps(results, indent=2))
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,195 @@
+"""
+Cost of the core pipeline's storage, etype, scheduling and aggregation steps over synthetic element trees.
+
+A tree is built for each number of elements in `--sizes` and each file size in `--files`. Each element is a selected
+element with one media file under 'data', and a derived element with one cvjson predictions file under 'derived', as
+an object detection analyser would leave them. Media files in 'large' trees are sparse, so that a tree of a million
+large elements fits on disk; none of the steps timed here read media.
+
+For each tree, the following are timed, each as the best of `--repeat` runs:
+    read_elements: `LocalStorage.read_elements` of the selected elements.
+    read_elements_uncatalogued: the same, from disk rather than the element catalog. Elements are cast lazily, so this
+        is the time to list the element dirs.
+    read_all_media: `LocalStorage.read_all_media`.
+    cast: `Etype.cast` of each selected element's paths.
+    phase_<executor>: a parallel phase that does nothing with each element, for the overhead of `process_in_batches`.
+    rank, flatten: `lib.util.cvjson.rank` and `flatten` over the derived elements.
+
+Trees are slow to build at the largest sizes, so they are kept in media/benchmarks/pipeline for later runs (say, on
+another commit) unless `--clean` is passed. Compare two runs' results with `python -m benchmarks.compare`.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import platform
+import subprocess
+import contextlib
+from lib.common.mtmodule import MTModule
+from lib.common.storage import LocalStorage
+from lib.common.etypes import Etype
+from lib.common.util import MAX_CPUS
+from lib.util import cvjson
+
+TREES = "media/benchmarks/pipeline"
+PHASE_FOLDER = "media/benchmarks/phase"
+SELECTOR = "Synthetic"
+ANALYSER = "Detector"
+FILE_SIZES = {"small": 4 * 1024, "large": 64 * 1024 * 1024}
+LABELS = ["tank", "person", "vehicle"]
+
+
+class NoopModule(MTModule):
+    in_parallel = True
+
+    @MTModule.phase("benchmark")
+    def run(self, elements):
+        for _ in elements:
+            pass
+
+
+def preds(rng, frames):
+    return {
+        "labels": {
+            label: {
+                "frames": list(range(frames)),
+                "scores": [round(rng.random(), 3) for _ in range(frames)],
+            }
+            for label in LABELS
+        }
+    }
+
+
+def build_tree(folder: str, elements: int, file_size: int, frames: int):
+    """Build a tree of `elements` selected and derived elements in `folder`, unless one was built there before."""
+    storage = LocalStorage(folder=folder, catalog=True)
+    done = storage.base_dir / ".built"
+    if done.exists():
+        return storage
+    rng = random.Random(0)
+    data = storage.read_query(SELECTOR)
+    derived = storage.read_query(f"{SELECTOR}/{ANALYSER}")
+    for idx in range(elements):
+        el_id = f"{idx:07d}"
+        (data / el_id).mkdir(parents=True, exist_ok=True)
+        with open(data / el_id / f"{el_id}.jpg", "wb") as f:
+            if file_size <= FILE_SIZES["small"]:
+                f.write(os.urandom(file_size))
+            else:
+                f.truncate(file_size)
+        (derived / el_id).mkdir(parents=True, exist_ok=True)
+        with open(derived / el_id / "preds.json", "w") as f:
+            json.dump(preds(rng, frames), f)
+    done.touch()
+    return storage
+
+
+def best_of(repeat: int, fn) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_tree(storage, elements: int, args) -> dict:
+    selected = storage.read_elements([SELECTOR])
+    derived = storage.read_elements([f"{SELECTOR}/{ANALYSER}"])
+    uncatalogued = LocalStorage(folder=storage.base_dir, catalog=False)
+    quiet = lambda *a, **k: None
+
+    def cast():
+        for el in selected:
+            Etype.cast(el.id, el.paths)
+
+    seconds = {
+        "read_elements": best_of(
+            args.repeat, lambda: storage.read_elements([SELECTOR])
+        ),
+        "read_elements_uncatalogued": best_of(
+            args.repeat, lambda: uncatalogued.read_elements([SELECTOR])
+        ),
+        "read_all_media": best_of(args.repeat, storage.read_all_media),
+        "cast": best_of(args.repeat, cast),
+        "rank": best_of(args.repeat, lambda: cvjson.rank(derived, logger=quiet)),
+        "flatten": best_of(args.repeat, lambda: cvjson.flatten(derived, logger=quiet)),
+    }
+    for executor in args.executors:
+        seconds[f"phase_{executor}"] = best_of(
+            args.repeat, lambda: run_phase(elements, executor, args.workers)
+        )
+    return {
+        "seconds": seconds,
+        "us_per_element": {k: v / elements * 1e6 for k, v in seconds.items()},
+    }
+
+
+def run_phase(elements: int, executor: str, workers: int):
+    storage = LocalStorage(folder=PHASE_FOLDER)
+    mod = NoopModule({"executor": executor, "workers": workers}, "NoopModule", storage)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        mod.run(i for i in range(elements))
+    shutil.rmtree(storage.base_dir)
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(args):
+    results = {
+        "benchmark": "pipeline",
+        "commit": commit(),
+        "python": platform.python_version(),
+        "cpus": MAX_CPUS,
+        "workers": args.workers,
+        "repeat": args.repeat,
+        "frames": args.frames,
+        "trees": {},
+    }
+    for elements in args.sizes:
+        for kind in args.files:
+            folder = f"{TREES}/{elements}-{kind}"
+            print(f"{elements} {kind} elements...", file=sys.stderr)
+            storage = build_tree(folder, elements, FILE_SIZES[kind], args.frames)
+            results["trees"][f"{elements}-{kind}"] = {
+                "elements": elements,
+                "file_bytes": FILE_SIZES[kind],
+                **bench_tree(storage, elements, args),
+            }
+            if args.clean:
+                shutil.rmtree(storage.base_dir)
+    return results
+
+
+if __name__ == "__main__":
+    csv = lambda cast: lambda s: [cast(x) for x in s.split(",")]
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sizes", type=csv(int), default=[10, 10000, 1000000])
+    parser.add_argument("--files", type=csv(str), default=list(FILE_SIZES.keys()))
+    parser.add_argument("--executors", type=csv(str), default=["processes"])
+    parser.add_argument("--workers", type=int, default=MAX_CPUS)
+    parser.add_argument("--frames", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--clean", action="store_true")
+    parser.add_argument("--out", type=str, default=None)
+    args = parser.parse_args()
+
+    results = main(args)
+    print(json.dumps(results, indent=2))
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
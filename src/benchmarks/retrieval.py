@@ -0,0 +1,138 @@
+"""
+Throughput of a selector's retrieve phase against a local HTTP server standing in for a media host.
+
+The server runs in its own process and serves files of a fixed size after a fixed delay, to stand in for the latency of
+a CDN such as 4chan's or Twitter's. A selector that fetches one file per element with a blocking `urlretrieve` (as
+FourChan and Twitter used to) is timed with forked worker processes and with worker threads, and one that implements
+`retrieve_element_async` with `Selector.download` is timed on the event loop.
+"""
+import json
+import time
+import shutil
+import argparse
+import multiprocessing
+from pathlib import Path
+from urllib.request import urlretrieve
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from lib.common.selector import Selector
+from lib.common.storage import LocalStorage
+from lib.common.etypes import Etype, LocalElementsIndex
+
+FOLDER = "media/benchmarks"
+TMP = Path("/tmp/benchmarks")
+
+
+def serve(port, size, latency, ready):
+    body = b"x" * size
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    httpd.request_queue_size = 1024
+    ready.set()
+    httpd.serve_forever()
+
+
+class ServedSelector(Selector):
+    out_etype = Etype.Any
+    in_parallel = True
+
+    def index(self, config):
+        rows = [[str(i)] for i in range(config["elements"])]
+        return LocalElementsIndex([["id"]] + rows)
+
+
+class BlockingSelector(ServedSelector):
+    def retrieve_element(self, row, config):
+        base = TMP / row.id
+        base.mkdir(parents=True, exist_ok=True)
+        urlretrieve(f"{config['url']}/{row.id}.jpg", base / f"{row.id}.jpg")
+        self.disk.delete_local_on_write = True
+        return Etype.cast(row.id, base / f"{row.id}.jpg")
+
+
+class AsyncSelector(ServedSelector):
+    async def retrieve_element_async(self, row, config):
+        base = TMP / row.id
+        base.mkdir(parents=True, exist_ok=True)
+        await self.download(f"{config['url']}/{row.id}.jpg", base / f"{row.id}.jpg")
+        self.disk.delete_local_on_write = True
+        return Etype.cast(row.id, base / f"{row.id}.jpg")
+
+
+def timed(cls, config):
+    storage = LocalStorage(folder=FOLDER)
+    selector = cls(config, cls.__name__, storage)
+    selector.start_indexing()
+    start = time.perf_counter()
+    selector.start_retrieving()
+    seconds = time.perf_counter() - start
+    shutil.rmtree(storage.base_dir)
+    return seconds
+
+
+def main(args):
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(
+        target=serve, args=(args.port, args.size, args.latency, ready), daemon=True
+    )
+    server.start()
+    ready.wait()
+
+    base = {"url": f"http://127.0.0.1:{args.port}", "elements": args.elements}
+    modes = {
+        "processes": (BlockingSelector, {**base, "workers": args.processes}),
+        "threads": (
+            BlockingSelector,
+            {**base, "executor": "threads", "workers": args.concurrency},
+        ),
+        "asyncio": (
+            AsyncSelector,
+            {**base, "workers": args.concurrency, "per_host": args.per_host},
+        ),
+    }
+    results = {
+        "benchmark": "retrieval",
+        "elements": args.elements,
+        "file_bytes": args.size,
+        "latency_ms": args.latency * 1000,
+        "seconds": {},
+        "mb_per_second": {},
+    }
+    megabytes = args.elements * args.size / 1e6
+    for name, (cls, config) in modes.items():
+        seconds = timed(cls, config)
+        results["seconds"][name] = seconds
+        results["mb_per_second"][name] = megabytes / seconds
+
+    server.terminate()
+    shutil.rmtree(TMP, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--elements", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=256 * 1024)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--per_host", type=int, default=64)
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--out", type=str, default=None)
+    args = parser.parse_args()
+
+    results = main(args)
+    print(json.dumps(results, indent=2))
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,115 @@
+"""
+Makespan of a parallel phase over elements with a skewed size distribution.
+
+Each element is a single sparse file, and processing an element sleeps for a time proportional to its size, as
+transcoding or running inference on a video would. Element sizes follow a Pareto distribution, and the largest
+elements are listed together at the end, as happens when one source's long videos sort next to each other in a folder.
+
+Three layouts are compared:
+    static: one contiguous batch per worker, as `process_in_batches` used to split elements.
+    dynamic: a shared work queue from which idle workers take the next element.
+    longest_first: the shared work queue, with the largest elements queued first.
+"""
+import os
+import json
+import math
+import time
+import random
+import shutil
+import argparse
+from pathlib import Path
+from lib.common.mtmodule import MTModule
+from lib.common.storage import LocalStorage
+from lib.common.etypes import Etype
+from lib.common.scheduler import element_size
+
+FOLDER = "media/benchmarks"
+SRC = Path("/tmp/mtriage_benchmarks/scheduler")
+
+
+class SleepModule(MTModule):
+    in_parallel = True
+
+    @MTModule.phase("benchmark")
+    def run(self, elements):
+        for element in elements:
+            time.sleep(element_size(element) * self.config["seconds_per_byte"])
+
+
+def make_elements(count, seed=0):
+    rng = random.Random(seed)
+    sizes = sorted(int(rng.paretovariate(1.2) * 1024) for _ in range(count))
+    # shuffle all but the largest tenth, which stay together at the end
+    tail = max(1, count // 10)
+    head = sizes[:-tail]
+    rng.shuffle(head)
+    sizes = head + sizes[-tail:]
+
+    if SRC.exists():
+        shutil.rmtree(SRC)
+    SRC.mkdir(parents=True)
+    elements = []
+    for idx, size in enumerate(sizes):
+        fp = SRC / f"{idx:05d}.mp4"
+        with open(fp, "wb") as f:
+            f.truncate(size)
+        elements.append(Etype.Any(f"{idx:05d}", paths=[fp]))
+    return elements
+
+
+def makespan(elements, config):
+    mod = SleepModule(config, "SleepModule", LocalStorage(folder=FOLDER))
+    start = time.perf_counter()
+    mod.run(e for e in elements)
+    return time.perf_counter() - start
+
+
+def main(args):
+    elements = make_elements(args.elements, seed=args.seed)
+    total = sum(element_size(e) for e in elements)
+    seconds_per_byte = args.total_work / total
+    base = {"workers": args.workers, "seconds_per_byte": seconds_per_byte}
+
+    layouts = {
+        "static": {**base, "chunk_size": math.ceil(len(elements) / args.workers)},
+        "dynamic": base,
+        "longest_first": {**base, "schedule": "longest_first"},
+    }
+    results = {
+        "benchmark": "scheduler",
+        "elements": len(elements),
+        "workers": args.workers,
+        "total_work": args.total_work,
+        "ideal_makespan": max(
+            args.total_work / args.workers,
+            max(element_size(e) for e in elements) * seconds_per_byte,
+        ),
+        "makespan": {},
+    }
+    for name, config in layouts.items():
+        results["makespan"][name] = makespan(elements, config)
+
+    shutil.rmtree(SRC)
+    shutil.rmtree(LocalStorage(folder=FOLDER).base_dir)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--elements", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument(
+        "--total-work",
+        type=float,
+        default=8.0,
+        help="Seconds of work summed over all elements.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=str, default=None)
+    args = parser.parse_args()
+
+    results = main(args)
+    print(json.dumps(results, indent=2))
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
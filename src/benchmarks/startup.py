@@ -0,0 +1,146 @@
+"""
+Time to first element of a chain of analysers on each executor, for the cost of starting workers and loading models.
+
+A chain of `--chain` analysers is run over `--elements` selected elements, as a YAML run with an 'analyse' list would
+run it, with each analyser reading the last one's output. Each analyser loads a model in `pre_analyse`, which takes
+`--load-seconds` and holds `--model-mb` of memory, and does no more than copy each element.
+
+For each executor in `--executors`, the chain is timed from the start of each analyser's `start_analysing`:
+    first_element: until the first of its elements has been analysed, from the element's timing event.
+    total: until it has returned.
+On the processes executor the model is loaded once in the main process and inherited by the workers of each phase,
+which are started afresh for every analyser. On the forkserver executor the model is loaded once in each worker of a
+pool that is started once for the whole chain, from a forkserver that has imported the analysers beforehand.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import contextlib
+from pathlib import Path
+from lib.common.analyser import Analyser
+from lib.common.etypes import Etype
+from lib.common.storage import LocalStorage
+from lib.common.timing import ELEMENT
+from lib.common.workerpool import preload, close_pool
+from lib.common.util import MAX_CPUS
+from benchmarks.pipeline import commit
+
+FOLDER = "media/benchmarks/startup"
+SELECTOR = "Synthetic"
+
+
+class ModelAnalyser(Analyser):
+    out_etype = Etype.Any
+    in_parallel = True
+
+    def pre_analyse(self, config):
+        time.sleep(config["load_seconds"])
+        self.model = bytearray(int(config["model_mb"] * (1 << 20)))
+
+    def analyse_element(self, element, config):
+        out = Path(f"/tmp/{self.name}/{element.id}")
+        out.mkdir(parents=True, exist_ok=True)
+        shutil.copy(element.paths[0], out / element.paths[0].name)
+        return Etype.Any(element.id, out / element.paths[0].name)
+
+
+def build_elements(storage, elements: int):
+    data = storage.read_query(SELECTOR)
+    for idx in range(elements):
+        el_id = f"{idx:05d}"
+        (data / el_id).mkdir(parents=True, exist_ok=True)
+        with open(data / el_id / f"{el_id}.txt", "w") as f:
+            f.write(el_id)
+
+
+def first_elements(storage) -> dict:
+    """The start time of the first element event of each analyser in the events log."""
+    firsts = {}
+    with open(storage.base_dir / "logs/events.jsonl", "r") as f:
+        for line in f:
+            event = json.loads(line)
+            if event["cat"] != ELEMENT:
+                continue
+            name = event["module"]
+            firsts[name] = min(firsts.get(name, event["ts"]), event["ts"])
+    return firsts
+
+
+def run_chain(executor: str, args) -> list:
+    storage = LocalStorage(folder=f"{FOLDER}/{executor}")
+    build_elements(storage, args.elements)
+    elements_in = [SELECTOR]
+    starts, totals = {}, {}
+    for idx in range(args.chain):
+        name = f"Model{idx}"
+        analyser = ModelAnalyser(
+            {
+                "elements_in": elements_in,
+                "executor": executor,
+                "workers": args.workers,
+                "load_seconds": args.load_seconds,
+                "model_mb": args.model_mb,
+            },
+            name,
+            LocalStorage(folder=f"{FOLDER}/{executor}"),
+        )
+        starts[name] = time.time()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            analyser.start_analysing()
+        totals[name] = time.time() - starts[name]
+        elements_in = [f"{SELECTOR}/{name}"]
+    firsts = first_elements(storage)
+    shutil.rmtree(storage.base_dir)
+    return [
+        {
+            "analyser": name,
+            "first_element": firsts[name] - starts[name],
+            "total": totals[name],
+        }
+        for name in starts
+    ]
+
+
+def main(args):
+    results = {
+        "benchmark": "startup",
+        "commit": commit(),
+        "python": platform.python_version(),
+        "cpus": MAX_CPUS,
+        "workers": args.workers,
+        "elements": args.elements,
+        "load_seconds": args.load_seconds,
+        "model_mb": args.model_mb,
+        "executors": {},
+    }
+    preload(["benchmarks.startup"])
+    for executor in args.executors:
+        print(f"{args.chain} analysers on {executor}...", file=sys.stderr)
+        results["executors"][executor] = run_chain(executor, args)
+    close_pool()
+    return results
+
+
+if __name__ == "__main__":
+    csv = lambda cast: lambda s: [cast(x) for x in s.split(",")]
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--executors", type=csv(str), default=["processes", "forkserver"]
+    )
+    parser.add_argument("--chain", type=int, default=3)
+    parser.add_argument("--elements", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=MAX_CPUS)
+    parser.add_argument("--load-seconds", type=float, default=2.0)
+    parser.add_argument("--model-mb", type=float, default=256)
+    parser.add_argument("--out", type=str, default=None)
+    args = parser.parse_args()
+
+    results = main(args)
+    print(json.dumps(results, indent=2))
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
@@ -2,7 +2,6 @@ from lib.common.analyser import Analyser
 from lib.common.exceptions import ElementShouldSkipError
 from lib.common.etypes import Etype
 from subprocess import call, STDOUT
-from pathlib import Path
 import os
 
 
@@ -14,7 +13,7 @@ class ConvertAudio(Analyser):
         output_ext = config["output_ext"]
 
         FNULL = open(os.devnull, "w")
-        output = f"/tmp/{element.id}.{output_ext}"
+        output = self.staging_path(element) / f"{element.id}.{output_ext}"
         # TODO: error handling
         out = call(
             ["ffmpeg", "-y", "-i", element.paths[0], output],
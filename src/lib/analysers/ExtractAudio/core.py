@@ -11,7 +11,7 @@ class ExtractAudio(Analyser):
 
     def analyse_element(self, element, config):
         output_ext = config["output_ext"]
-        output = f"/tmp/{element.id}.{output_ext}"
+        output = self.staging_path(element) / f"{element.id}.{output_ext}"
         FNULL = open(os.devnull, "w")
         # TODO: add error handling
         out = call(
@@ -1,21 +1,79 @@
 import os
-from shutil import copyfile, rmtree
+from shutil import copyfile
 from subprocess import call, STDOUT
-from pathlib import Path
 from lib.common.analyser import Analyser
 from lib.common.etypes import Etype, Union
+from lib.common.exceptions import InvalidAnalyserConfigError
 from lib.common.util import files
 
 VID_SUFFIXES = [".mp4", ".mov"]
 # GLOSSED_FRAMES = Union(Etype.Image.array(), Etype.Json)
 GLOSSED_FRAMES = Etype.Any  # hack for the time being
 
+# the formats that frames can be written in. Frames are uncompressed bitmaps unless another is chosen.
+BMP = "bmp"
+JPG = "jpg"
+PNG = "png"
+WEBP = "webp"
+CODECS = [BMP, JPG, PNG, WEBP]
+DEFAULT_QUALITY = 90
 
-def ffmpeg_frames(out_folder, fp, rate):
+
+def quality_args(codec: str, quality: int) -> list:
+    """The ffmpeg options for a `quality` from 1 to 100 in `codec`. JPEG's scale runs from 2, the best, to 31, and
+    bitmaps and PNGs are lossless, so have none."""
+    if codec == JPG:
+        return ["-q:v", str(round(31 - (quality - 1) * 29 / 99))]
+    if codec == WEBP:
+        # NB: ffmpeg would otherwise encode with libwebp_anim, which writes every frame to the first file
+        return ["-c:v", "libwebp", "-quality", str(quality)]
+    return []
+
+
+def frame_codec(config) -> str:
+    codec = str(config.get("codec", BMP)).lower().lstrip(".")
+    codec = JPG if codec == "jpeg" else codec
+    if codec not in CODECS:
+        raise InvalidAnalyserConfigError(
+            f"'{codec}' is not a codec that Frames can write, use one of {', '.join(CODECS)}."
+        )
+    return codec
+
+
+def output_args(config) -> list:
+    """The ffmpeg options that write frames as the 'codec', 'quality' and 'max_dimension' in `config` ask."""
+    codec = frame_codec(config)
+    quality = int(config.get("quality", DEFAULT_QUALITY))
+    if not 1 <= quality <= 100:
+        raise InvalidAnalyserConfigError("The 'quality' of frames must be 1 to 100.")
+    args = quality_args(codec, quality)
+    if codec == JPG:
+        # NB: the full range of colours, as the MJPEG encoder is deprecated for the limited range that video has
+        args += ["-pix_fmt", "yuvj420p"]
+    if "max_dimension" in config:
+        # NB: frames are scaled down to fit in a square of the size, keeping their aspect ratio, and never scaled up
+        dim = int(config["max_dimension"])
+        args += [
+            "-vf",
+            f"scale='min(iw,{dim})':'min(ih,{dim})':force_original_aspect_ratio=decrease",
+        ]
+    return args
+
+
+def ffmpeg_frames(out_folder, fp, rate, config=None):
+    config = config or {}
     # TODO: better logs for FFMPEG process
     FNULL = open(os.devnull, "w")
     out = call(
-        ["ffmpeg", "-i", fp, "-r", str(rate), f"{out_folder}/%04d.bmp"],
+        [
+            "ffmpeg",
+            "-i",
+            fp,
+            "-r",
+            str(rate),
+            *output_args(config),
+            f"{out_folder}/%04d.{frame_codec(config)}",
+        ],
         stdout=FNULL,
         stderr=STDOUT,
     )
@@ -25,23 +83,23 @@ class Frames(Analyser):
     in_etype = Union(Etype.Json, Etype.Video)
     out_etype = GLOSSED_FRAMES
 
+    def pre_analyse(self, config):
+        # NB: a config that ffmpeg can't be called with fails here, rather than for every element
+        output_args(config)
+
     def analyse_element(self, element, config):
         fps = int(config["fps"]) if "fps" in config else 1
         jsons = [x for x in element.paths if x.suffix in ".json"]
-        dest = Path("/tmp") / element.id
-        if dest.exists():
-            rmtree(dest)
-        dest.mkdir()
+        dest = self.staging_path(element)
 
         if len(jsons) is 1:
             json = jsons[0]
             copyfile(json, dest / "meta.json")
 
         video = [x for x in element.paths if x.suffix in VID_SUFFIXES][0]
-        ffmpeg_frames(dest, video, fps)
+        ffmpeg_frames(dest, video, fps, config)
 
         self.logger(f"Frames successfully created for element {element.id}.")
-        self.disk.delete_local_on_write = True
         return GLOSSED_FRAMES(element.id, paths=files(dest))
 
 
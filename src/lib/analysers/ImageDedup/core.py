@@ -1,10 +1,13 @@
 import json
+import numpy as np
+from PIL import Image
 from pathlib import Path
 from shutil import copyfile
 from imagededup import methods
 from lib.common.exceptions import InvalidAnalyserConfigError
 from lib.common.analyser import Analyser
 from lib.common.etypes import Etype
+from lib.common.archives import readable
 
 
 class ImageDedup(Analyser):
@@ -42,11 +45,17 @@ class ImageDedup(Analyser):
         return "dry" in self.config and self.config["dry"]
 
     def analyse_element(self, element, config):
-        # NOTE: only works if all images are in same file, should probably copy for robustness.
-        basedir = element.paths[0].parent
-        encodings = self.hasher.encode_images(image_dir=basedir)
+        # NB: images are hashed one at a time, so that those in an element's archive need not be unpacked to a dir. An
+        # element's other files, such as its metadata, are left out, as they were when images were read from its dir.
+        images = Etype.Image.filter(element.paths)
+        encodings = {
+            p.name: self.hasher.encode_image(
+                image_array=np.array(Image.open(readable(p)).convert("RGB"))
+            )
+            for p in images
+        }
 
-        args = {"image_dir": basedir, "max_distance_threshold": self.threshold}
+        args = {"encoding_map": encodings, "max_distance_threshold": self.threshold}
 
         duplicates = self.hasher.find_duplicates_to_remove(**args)
 
@@ -62,7 +71,7 @@ class ImageDedup(Analyser):
 
         self.logger(f"{element.id} images deduplicated.")
 
-        deduplicated_paths = [p for p in element.paths if p.name not in duplicates]
+        deduplicated_paths = [p for p in images if p.name not in duplicates]
 
         return Etype.Image.array()(element.id, paths=deduplicated_paths)
 
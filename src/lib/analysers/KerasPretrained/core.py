@@ -5,8 +5,9 @@ from importlib import import_module
 from lib.common.exceptions import InvalidAnalyserConfigError
 from lib.common.analyser import Analyser
 from lib.common.etypes import Etype, Union, Array
+from lib.common.archives import readable
 from lib.util.cvjson import generate_meta
-from lib.etypes.cvjson import CvJson
+from lib.etypes.cvjson import CvJson, frame_batch_size
 
 KERAS_HOME = "/mtriage/data/.keras"
 os.environ["KERAS_HOME"] = KERAS_HOME
@@ -21,63 +22,78 @@ SUPPORTED_MODELS = {
 }
 
 
+def get_model_module(config):
+    MOD = SUPPORTED_MODELS.get(config["model"])
+    if MOD is None:
+        raise InvalidAnalyserConfigError(
+            f"The module '{config['model']}' either does not exist, or is not yet supported."
+        )
+    return import_module(f"tensorflow.keras.applications.{MOD['module']}")
+
+
 class KerasPretrained(Analyser):
     in_etype = Union(Array(Etype.Image), Etype.Json)
     out_etype = CvJson
-    """ Override to always run serially. Otherwise it hangs, presumably due to
-    the parallelisation that tensorflow does under the hood. """
-
-    @property
-    def in_parallel(self):
-        return False
+    """ Tensorflow hangs when it is used after a fork, presumably due to the
+    parallelisation that it does under the hood. When run in parallel, the
+    model is loaded and run in an inference server process instead, and
+    workers only decode and preprocess frames. """
 
     def pre_analyse(self, config):
         self.logger(config["model"])
         self.logger(f"Storing models in {KERAS_HOME}")
-        MOD = SUPPORTED_MODELS.get(config["model"])
-        if MOD is None:
-            raise InvalidAnalyserConfigError(
-                f"The module '{config['model']}' either does not exist, or is not yet supported."
-            )
-
-        rLabels = config["labels"]
 
         # TODO: make it so that this doesn't redownload every run.
         # i.e. refactor it into partial.Dockerfile
-        self.model_module = import_module(
-            f"tensorflow.keras.applications.{MOD['module']}"
-        )
+        self.model_module = get_model_module(config)
         impmodel = getattr(self.model_module, config["model"])
         # NB: this downloads the weights if they don't exist
         self.model = impmodel(weights="imagenet")
         self.THRESH = 0.1
 
-        def get_preds(img_path):
-            img = image.load_img(img_path, target_size=(224, 224))
-            x = image.img_to_array(img)
-            x = np.expand_dims(x, axis=0)
-            x = self.model_module.preprocess_input(x)
-            preds = self.model.predict(x)
-
-            # top field must be included or defaults to 5, huge number ensures
-            # it gets all labels
-            decoded = self.model_module.decode_predictions(preds, top=10)
-
-            # filter by labels provided in whitelist
-            filteredPreds = [p for p in decoded[0] if p[1] in rLabels]
-
-            return [
-                (x[1], float(x[2])) for x in filteredPreds if float(x[2]) >= self.THRESH
+    def preprocess(self, img_paths):
+        x = np.stack(
+            [
+                image.img_to_array(image.load_img(readable(p), target_size=(224, 224)))
+                for p in img_paths
             ]
+        )
+        return get_model_module(self.config).preprocess_input(x)
 
-        self.get_preds = get_preds
-
-    def analyse_element(self, element, _):
-        self.logger(f"Running inference on frames in {element.id}...")
-        val = Etype.CvJson.from_preds(element, self.get_preds)
-        self.logger(f"Wrote predictions JSON for {element.id}.")
-        self.disk.delete_local_on_write = True
-        return val
+    def predict(self, inputs, config):
+        rLabels = config["labels"]
+        preds = self.model.predict(inputs, batch_size=len(inputs))
+
+        # top field must be included or defaults to 5, huge number ensures
+        # it gets all labels
+        decoded = self.model_module.decode_predictions(preds, top=10)
+
+        # filter by labels provided in whitelist
+        return [
+            [
+                (p[1], float(p[2]))
+                for p in img_preds
+                if p[1] in rLabels and float(p[2]) >= self.THRESH
+            ]
+            for img_preds in decoded
+        ]
+
+    def get_batch_preds(self, img_paths):
+        return self.infer(self.preprocess(img_paths))
+
+    def analyse_element(self, element, config):
+        return self.analyse_batch([element], config)[0]
+
+    def analyse_batch(self, elements, config):
+        self.logger(f"Running inference on frames in {len(elements)} elements...")
+        vals = Etype.CvJson.from_batch_preds(
+            elements,
+            self.get_batch_preds,
+            frame_batch_size(config),
+            staging=self.staging_path,
+        )
+        self.logger(f"Wrote predictions JSON for {len(elements)} elements.")
+        return vals
 
     def post_analyse(self, elements) -> Etype.Json.as_array():
         return generate_meta(elements, logger=self.logger)
@@ -8,6 +8,8 @@ from PIL import Image
 
 from lib.common.analyser import Analyser
 from lib.common.etypes import Etype, Union, Array
+from lib.common.archives import readable
+from lib.etypes.cvjson import frame_batch_size
 from lib.analysers.ProtestsPretrained.utils import transform, modified_resnet50, decode
 
 PTH_TAR = "/mtriage/model.pth.tar"
@@ -21,10 +23,8 @@ class ProtestsPretrained(Analyser):
         Init the logging, etc
         Init the model
         """
-        rLabels = config["labels"]
         self.THRESH = 0.0
 
-        t = transform()
         model = modified_resnet50()
         model.load_state_dict(
             torch.load(
@@ -33,38 +33,55 @@ class ProtestsPretrained(Analyser):
             )["state_dict"]
         )
         model.eval()
+        self.model = model
+
+    def preprocess(self, img_paths):
+        """
+        This is were we preprocess the images, using a function defined in the model class
+        """
+        t = transform()
+        return torch.stack(
+            [t(Image.open(readable(p)).convert("RGB")) for p in img_paths]
+        ).numpy()
 
-        def get_preds(img_path):
-            """
-            Gives labelds and probabilities for a single image
-            This is were we preprocess the image, using a function defined in the model class
-            """
-            # load image
-            img = Image.open(img_path).convert("RGB")
-            # process it
-            x = t(img)
-            # get in in the right format
-            x = Variable(x).unsqueeze(0)
-            # predictions
-            output = model(x)
+    def predict(self, inputs, config):
+        """
+        Gives labels and probabilities for a batch of images, in a single forward pass
+        """
+        rLabels = config["labels"]
+        # predictions
+        with torch.no_grad():
+            output = self.model(Variable(torch.from_numpy(inputs)))
+        all_preds = []
+        for img_output in output.cpu().data.numpy():
             # decode
-            output = decode(output.cpu().data.numpy()[0])
+            preds = decode(img_output)
             # filter
-            output = [(x[0], x[1]) for x in output if x[0] in rLabels]
-            output = [(x[0], float(x[1])) for x in output if x[1] >= self.THRESH]
+            preds = [(x[0], x[1]) for x in preds if x[0] in rLabels]
+            preds = [(x[0], float(x[1])) for x in preds if x[1] >= self.THRESH]
+            all_preds.append(preds)
 
-            return output
+        return all_preds
 
-        self.get_preds = get_preds
+    def get_batch_preds(self, img_paths):
+        return self.infer(self.preprocess(img_paths))
 
     def analyse_element(
-        self, element: Union(Array(Etype.Image), Etype.Json), _
+        self, element: Union(Array(Etype.Image), Etype.Json), config
     ) -> Etype.Json:
-        self.logger(f"Running inference on frames in {element.id}...")
-        val = Etype.CvJson.from_preds(element, self.get_preds)
-        self.logger(f"Wrote predictions JSON for {element.id}.")
+        return self.analyse_batch([element], config)[0]
+
+    def analyse_batch(self, elements, config):
+        self.logger(f"Running inference on frames in {len(elements)} elements...")
+        vals = Etype.CvJson.from_batch_preds(
+            elements,
+            self.get_batch_preds,
+            frame_batch_size(config),
+            staging=self.staging_path,
+        )
+        self.logger(f"Wrote predictions JSON for {len(elements)} elements.")
         self.disk.delete_local_on_write = True
-        return val
+        return vals
 
 
 module = ProtestsPretrained
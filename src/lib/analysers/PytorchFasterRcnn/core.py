@@ -5,6 +5,8 @@ from torchvision import transforms
 from PIL import Image
 from lib.common.analyser import Analyser
 from lib.common.etypes import Etype
+from lib.common.archives import readable
+from lib.etypes.cvjson import frame_batch_size
 
 
 class PytorchFasterRcnn(Analyser):
@@ -13,31 +15,59 @@ class PytorchFasterRcnn(Analyser):
 
     def pre_analyse(self, config):
         # NB: in future this could be configurable.
-        model = torchvision.models.detection.fasterrcnn_resnet50_fpn(pretrained=False, num_classes=6)
+        model = torchvision.models.detection.fasterrcnn_resnet50_fpn(
+            pretrained=False, num_classes=6
+        )
         if torch.cuda.is_available():
             model.cuda()
             self.device = torch.device("cuda:0")
         else:
             self.device = torch.device("cpu")
-        state_dict = torch.load(self.base_path/config["model"], map_location=torch.device(self.device))
+        state_dict = torch.load(
+            self.base_path / config["model"], map_location=torch.device(self.device)
+        )
         model.load_state_dict(state_dict)
         model.eval()
         self.model = model
-        self.transforms = transforms.Compose([transforms.Resize(224), transforms.ToTensor()])
-        self.threshold = config.get('threshold') if config.get('threshold') else 0.5
+        self.transforms = transforms.Compose(
+            [transforms.Resize(224), transforms.ToTensor()]
+        )
+        self.threshold = config.get("threshold") if config.get("threshold") else 0.5
 
     def analyse_element(self, element, config):
-        def get_preds(img):
-            img = Image.open(img).convert('RGB')
-            image_tensor = self.transforms(img).float().unsqueeze_(0)
-            inp = Variable(image_tensor).to(self.device)
-            output = self.model(inp)[0]
-            labels = [config['class_map'][i.item()] for i in output.get('labels')]
-            scores = output.get('scores')
-            preds = [(x, y.item()) for x,y in zip(labels, scores) if y.item() > self.threshold]
-            return preds
-
-        self.logger(f"Running inference for {element.id}...")
-        return Etype.CvJson.from_preds(element, get_preds)
+        return self.analyse_batch([element], config)[0]
+
+    def analyse_batch(self, elements, config):
+        def get_batch_preds(imgs):
+            # NB: images are resized by their shorter side, so they are passed as a list rather than stacked
+            inp = [
+                Variable(
+                    self.transforms(Image.open(readable(img)).convert("RGB")).float()
+                ).to(self.device)
+                for img in imgs
+            ]
+            with torch.no_grad():
+                outputs = self.model(inp)
+            all_preds = []
+            for output in outputs:
+                labels = [config["class_map"][i.item()] for i in output.get("labels")]
+                scores = output.get("scores")
+                all_preds.append(
+                    [
+                        (x, y.item())
+                        for x, y in zip(labels, scores)
+                        if y.item() > self.threshold
+                    ]
+                )
+            return all_preds
+
+        self.logger(f"Running inference for {len(elements)} elements...")
+        return Etype.CvJson.from_batch_preds(
+            elements,
+            get_batch_preds,
+            frame_batch_size(config),
+            staging=self.staging_path,
+        )
+
 
 module = PytorchFasterRcnn
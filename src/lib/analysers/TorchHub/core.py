@@ -1,5 +1,6 @@
 from lib.common.analyser import Analyser
 from lib.common.etypes import Etype
+from lib.common.archives import readable
 
 from PIL import Image
 import torch
@@ -26,7 +27,7 @@ class TorchHub(Analyser):
         self.logger("Model loaded from remote.")
 
     def analyse_element(self, element, config):
-        imgs = [Image.open(x) for x in element.paths]
+        imgs = [Image.open(readable(x)) for x in element.paths]
         results = self.model(imgs).tolist()
         self.logger(f"Batched inference successfully run for element {element.id}.")
 
@@ -35,6 +36,6 @@ class TorchHub(Analyser):
             result = results[idx]
             return [cls_and_conf(p, result.names) for p in result.pred]
 
-        return Etype.CvJson.from_preds(element, get_preds)
+        return Etype.CvJson.from_preds(element, get_preds, staging=self.staging_path)
 
 module = TorchHub
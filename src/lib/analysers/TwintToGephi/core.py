@@ -4,6 +4,7 @@ import twint
 import pandas as pd
 from pathlib import Path
 from lib.common.analyser import Analyser
+from lib.common.logs import DEBUG
 from lib.common.etypes import Etype
 from lib.util.twint import to_serializable, pythonize
 
@@ -202,10 +203,10 @@ class TwintToGephi(Analyser):
                 tweets = json.load(f)
 
             initial_tweet = tweets[0]
-            self.logger(f"Adding tweet {initial_tweet['id']} to graph...")
+            self.logger(f"Adding tweet {initial_tweet['id']} to graph...", level=DEBUG)
             self.add_to_graph(initial_tweet)
             for tweet in tweets[1:]:
-                self.logger(f"Adding reply {tweet['id']} to graph...")
+                self.logger(f"Adding reply {tweet['id']} to graph...", level=DEBUG)
                 self.add_to_graph(tweet, inreplyto=initial_tweet)
 
         xlsx_path = TMP / "final.xlsx"
@@ -14,6 +14,11 @@ from lib.common.exceptions import (
     InvalidAnalyserElements,
 )
 from lib.common.mtmodule import MTModule
+from lib.common.scheduler import stream_chunks, batch_size, executor_for, worker_count
+from lib.common.executors import FORKSERVER
+from lib.common.workerpool import get_pool
+from lib.common.inference import InferenceServer, INFERENCE_SERVER
+from lib.common.timing import ELEMENT, BATCH
 from lib.common.storage import Storage
 from lib.common.etypes import LocalElement
 
@@ -29,6 +34,7 @@ class Analyser(MTModule):
 
     def __init__(self, config, module, storage=None):
         super().__init__(config, module, storage)
+        self.inference = None
 
         if not isinstance(module, str) or module == "":
             raise InvalidAnalyserConfigError(
@@ -58,6 +64,60 @@ class Analyser(MTModule):
         """
         return NotImplemented
 
+    def analyse_batch(
+        self, elements: List[LocalElement], config
+    ) -> List[Union[LocalElement, None]]:
+        """Optionally implemented by child, for analysers that work faster on many elements at once, such as those
+        that run a model's forward pass over a batch of images. Called with up to 'batch_size' elements, and should
+        return a list with one new element (or None) for each element, in the same order.
+
+        If a batch fails, its elements are analysed one at a time with `analyse_element`, so that a single bad
+        element does not fail the rest. Elements that fail to store are retried in a later batch.
+        """
+        return NotImplemented
+
+    @property
+    def analyses_batches(self):
+        return type(self).analyse_batch is not Analyser.analyse_batch
+
+    def predict(self, inputs, config) -> list:
+        """Optionally implemented by child, for analysers that load a model in `pre_analyse`. Runs the model on
+        `inputs`, an array with a row for each preprocessed input, and returns a list with the result for each row.
+        Analysers call it through `self.infer`.
+
+        When an analyser that implements `predict` runs in parallel, `pre_analyse` and `predict` run in a separate
+        inference server process (see lib/common/inference.py), which batches inputs from all workers. This can be
+        turned off by setting 'inference_server' to false in config.
+        """
+        return NotImplemented
+
+    @property
+    def uses_inference_server(self):
+        return (
+            self.in_parallel
+            and type(self).predict is not Analyser.predict
+            and self.config.get(INFERENCE_SERVER, True)
+            and not self.uses_worker_pool
+        )
+
+    @property
+    def uses_worker_pool(self):
+        """Whether elements are analysed in the forkserver pool, whose workers each load the model themselves."""
+        return (
+            self.in_parallel
+            and executor_for(self.config, "analyse", default=self.executor)
+            == FORKSERVER
+        )
+
+    def setup_worker(self):
+        self.pre_analyse(self.config)
+
+    def infer(self, inputs) -> list:
+        """Run the model on `inputs` with `predict`, through the inference server if there is one."""
+        if self.inference is None:
+            return self.predict(inputs, self.config)
+        return self.inference.infer(inputs)
+
     def pre_analyse(self, config):
         """option to set up class variables"""
 
@@ -68,7 +128,8 @@ class Analyser(MTModule):
     def start_analysing(self):
         """Primary entrypoint in the mtriage lifecycle.
 
-        1. Call user-defined `pre_analyse` if it exists.
+        1. Call user-defined `pre_analyse` if it exists, in an inference server process if the analyser implements
+            `predict` and runs in parallel, or in each worker if it runs in the forkserver pool.
         2. Read all media from disk.
         3. Call user-defined `analyse_element` in parallel (done through @phase decorator in MTModule). The option
             to bypass parallelisation is for testing.
@@ -79,8 +140,18 @@ class Analyser(MTModule):
             f"Running analysis {'in parallel' if self.in_parallel else 'serially'}"
         )
 
-        self.__pre_analyse()
-        self.__analyse()
+        if self.uses_inference_server:
+            self.__start_inference()
+        elif self.uses_worker_pool:
+            self.__start_pool()
+        else:
+            self.__pre_analyse()
+        try:
+            self.__analyse()
+        finally:
+            if self.inference is not None:
+                self.inference.close()
+                self.inference = None
         self.__post_analyse()
         cfg = self.get_full_config()
         if not self.errored:
@@ -99,6 +170,18 @@ class Analyser(MTModule):
     def __pre_analyse(self):
         self.pre_analyse(self.config)
 
+    @MTModule.phase("pre-analyse")
+    def __start_inference(self):
+        self.logger("Loading the model in an inference server")
+        self.inference = InferenceServer(self, self.config)
+        self.inference.start()
+
+    @MTModule.phase("pre-analyse")
+    def __start_pool(self):
+        workers = worker_count(self.config, "analyse", FORKSERVER)
+        get_pool(workers)
+        self.logger(f"Loading the model in each of {workers} pool workers")
+
     def __analyse(self):
         try:
             elements = self.disk.read_elements(self.config["elements_in"])
@@ -111,11 +194,12 @@ class Analyser(MTModule):
         if len(elements) == 0:
             raise InvalidAnalyserElements("No elements could be found at the location you tried to select or passed in.")
 
+        analyse = self.analyse_batches if self.analyses_batches else self.analyse
         if self.in_parallel:
-            self.analyse((e for e in elements))
+            analyse((e for e in elements))
         else:
             # analysing elements as a list will bypass parallelisation
-            self.analyse(elements)
+            analyse(elements)
 
     # getter for dest_q. NOTE: abstraction leak from mtmodule parallelisation..
     def get_dest_q(self):
@@ -135,24 +219,80 @@ class Analyser(MTModule):
         """If `elements` is a Generator, the phase decorator will run in parallel.
         If `elements` is a List, then it will run serially (which is useful for testing)."""
         for element in elements:
-            # NB: `super` infra is necessary in case a storage class overwrites
-            # the `read_query` method as LocalStorage does.
-            og_query = super(type(self.disk), self.disk).read_query(element.query)
-            self.set_dest_q(f"{og_query[0]}/{self.name}")
+            dest_q = self.__dest_q(element)
+            self.__attempt_analyse(element, dest_q)
+            self.disk.delete_local_on_write = False
 
-            self.__attempt_analyse(5, element)
+    @MTModule.phase("analyse", batched=True)
+    def analyse_batches(
+        self, elements: Union[Generator[LocalElement, None, None], List[LocalElement]]
+    ):
+        """Used in place of `analyse` for analysers that implement `analyse_batch`. When run in parallel, each call
+        receives one batch; when run serially, the list of elements is split into batches here."""
+        for batch in stream_chunks(elements, batch_size(self.config, self.PHASE_KEY)):
+            dest_qs = [self.__dest_q(element) for element in batch]
+            with self.timed(
+                f"batch of {len(batch)}", BATCH, elements=[e.id for e in batch]
+            ):
+                self.__attempt_analyse_batch(batch, dest_qs)
             self.disk.delete_local_on_write = False
 
+    def __attempt_analyse_batch(self, batch, dest_qs):
+        try:
+            new_elements = self.analyse_batch(batch, self.config)
+            if len(new_elements) != len(batch):
+                raise ElementShouldRetryError(
+                    f"'analyse_batch' returned {len(new_elements)} elements for a batch of {len(batch)}"
+                )
+        except Exception as e:
+            if self.is_dev() and not isinstance(
+                e, (ElementShouldSkipError, ElementShouldRetryError)
+            ):
+                raise e
+            self.logger(f"Batch failed ({e}), analysing its elements one at a time")
+            for element, dest_q in zip(batch, dest_qs):
+                self.__attempt_analyse(element, dest_q)
+        else:
+            for element, new_element, dest_q in zip(batch, new_elements, dest_qs):
+                if new_element is None:
+                    continue
+                if not self.disk.write_element(dest_q, new_element):
+                    self.error_logger("Unsuccessful storage - attempt retry", element)
+                    self.__retry(element)
+
+    def __dest_q(self, element):
+        dest_q = self.__query_for(element)
+        # NB: `dest_q` is set for `post_analyse`, but passed on directly, as
+        # workers that share it (threads, or processes via a manager) may
+        # be writing elements from other queries.
+        self.set_dest_q(dest_q)
+        return dest_q
+
+    def __query_for(self, element):
+        # NB: the base `read_query` is used, as storage classes overwrite it to
+        # return where a query's elements are, as LocalStorage does.
+        og_query = Storage.read_query(self.disk, element.query)
+        return f"{og_query[0]}/{self.name}"
+
+    def staging_path(self, element: LocalElement) -> Path:
+        """A scratch dir for the files of the element that is derived from `element`, on the same filesystem as the
+        place it will be written to. An element whose files are all in it is moved into place with a rename when it is
+        written (see `Storage.staging_path`)."""
+        return self.disk.staging_path(self.__query_for(element), element.id)
+
     def get_selector(self):
         sel = ""
         for q in self.config["elements_in"]:
-            selname, _ = super(type(self.disk), self.disk).read_query(q)
+            selname, _ = Storage.read_query(self.disk, q)
             sel += selname
         return sel
 
     @MTModule.phase("post-analyse")
     def __post_analyse(self):
         # TODO: is there a way to only do this work if overridden?
+        if self.get_dest_q() is None:
+            # NB: no element was analysed here, as a node of a sharded phase finds when others have done them all
+            return
         analysed_els = self.disk.read_elements([self.get_dest_q()])
         outel = self.post_analyse(analysed_els)
         if outel is None:
@@ -164,7 +304,7 @@ class Analyser(MTModule):
         # enforce `elements_in` as a single query, rather than a list of
         # queries.
         for q in self.config["elements_in"]:
-            selname, _ = super(type(self.disk), self.disk).read_query(q)
+            selname, _ = Storage.read_query(self.disk, q)
             success = self.disk.write_element(f"{selname}/{self.name}", outel)
             successes.append(success)
 
@@ -173,29 +313,31 @@ class Analyser(MTModule):
                 "Some instances of the final element produced via 'post_analyse' failed to save."
             )
 
-    def __attempt_analyse(self, attempts, element):
-        try:
-            new_element = self.analyse_element(element, self.config)
-            if new_element is None:
-                return
-            success = self.disk.write_element(self.get_dest_q(), new_element)
-            if not success:
-                raise ElementShouldRetryError("Unsuccessful storage")
-
-        except ElementShouldSkipError as e:
-            self.error_logger(str(e), element)
-        except ElementShouldRetryError as e:
-            self.error_logger(str(e), element)
-            if attempts > 1:
-                return self.__attempt_analyse(attempts - 1, element)
-            else:
-                self.error_logger(
-                    "failed after maximum retries - skipping element", element
-                )
-                self.errored = True
-        except Exception as e:
-            if self.is_dev():
-                raise e
-            else:
-                self.error_logger(f"{str(e)}: skipping element", element)
-                print(traceback.format_exc())
+    def __retry(self, element, after=None):
+        if not self.retry_later(element, after=after):
+            self.error_logger(
+                "failed after maximum retries - skipping element", element
+            )
+            self.errored = True
+
+    def __attempt_analyse(self, element, dest_q):
+        with self.timed(element.id, ELEMENT, attempt=self.attempt_of(element)):
+            try:
+                new_element = self.analyse_element(element, self.config)
+                if new_element is None:
+                    return
+                success = self.disk.write_element(dest_q, new_element)
+                if not success:
+                    raise ElementShouldRetryError("Unsuccessful storage")
+
+            except ElementShouldSkipError as e:
+                self.error_logger(str(e), element)
+            except ElementShouldRetryError as e:
+                self.error_logger(str(e), element)
+                self.__retry(element, e.after)
+            except Exception as e:
+                if self.is_dev():
+                    raise e
+                else:
+                    self.error_logger(f"{str(e)}: skipping element", element)
+                    print(traceback.format_exc())
@@ -0,0 +1,183 @@
+"""
+Sharded tar archives of the files of elements that have many of them, such as the frames that `Frames` makes.
+
+An archived element's dir holds its other files as they are, a few tar shards `members-000000.tar`,
+`members-000001.tar`, ... of up to `archive_shard_mb` each, as WebDataset lays out a dataset, and `members.idx`, which
+has the shard, offset and size of each file in them. Reading an element lists its archived files from the index as
+MemberPaths, which are read with a seek into their shard, so that modules can read them without unpacking the shards.
+"""
+import io
+import os
+import time
+import tarfile
+from pathlib import Path
+from typing import List, Tuple
+from lib.common.util import files
+from lib.common.writes import count, COPY
+
+# config keys, at the top level of the YAML, for the number of files past which an element's files are archived, and
+# the size in MB of each shard. Elements are not archived unless `archive_min_files` is set.
+ARCHIVE_MIN_FILES = "archive_min_files"
+ARCHIVE_SHARD_MB = "archive_shard_mb"
+DEFAULT_ARCHIVE_SHARD_MB = 256
+
+# the files of an element that are archived, which are images, as those are what elements have many of.
+ARCHIVE_SUFFIXES = [".bmp", ".jpg", ".jpeg", ".png", ".webp"]
+SHARD_PREFIX = "members"
+INDEX_FILE = "members.idx"
+# members are copied out of shards a chunk at a time.
+CHUNK_SIZE = 1 << 20
+
+
+def shard_name(idx: int) -> str:
+    return f"{SHARD_PREFIX}-{idx:06d}.tar"
+
+
+def is_archive_file(name: str) -> bool:
+    """Whether `name` is one of the files in an element dir that make up its archive."""
+    return name == INDEX_FILE or (
+        name.startswith(f"{SHARD_PREFIX}-") and name.endswith(".tar")
+    )
+
+
+def archivable(paths: List[Path], min_files) -> List[Path]:
+    """The files of `paths` that would be archived, or an empty list if there are fewer than `min_files` of them."""
+    if min_files is None:
+        return []
+    # NB: paths are kept as they are, as a MemberPath made into a Path is no longer one
+    ps = [Path(p) if isinstance(p, str) else p for p in paths]
+    ps = [p for p in ps if p.suffix.lower() in ARCHIVE_SUFFIXES]
+    return ps if len(ps) >= min_files else []
+
+
+class MemberPath(type(Path())):
+    """The path that a file in an element's archive would have were it in the element's dir, which is where it is
+    listed, along with the `shard` it is in and its `offset` and `size` there. `open`, `read_bytes` and `read_text`
+    read it from the shard, but libraries that open a path themselves, such as PIL, need `readable(path)` instead.
+    Paths derived from a MemberPath, such as its parent, are ordinary paths."""
+
+    shard = None
+    offset = 0
+    size = 0
+
+    def __reduce__(self):
+        return (member_path, (str(self), str(self.shard), self.offset, self.size))
+
+    def is_file(self):
+        return True if self.shard is not None else super().is_file()
+
+    def exists(self):
+        return True if self.shard is not None else super().exists()
+
+    def read_bytes(self):
+        if self.shard is None:
+            return super().read_bytes()
+        fd = os.open(self.shard, os.O_RDONLY)
+        try:
+            return os.pread(fd, self.size, self.offset)
+        finally:
+            os.close(fd)
+
+    def read_text(self, encoding=None, errors=None):
+        if self.shard is None:
+            return super().read_text(encoding, errors)
+        return self.read_bytes().decode(encoding or "utf-8", errors or "strict")
+
+    def open(self, mode="r", buffering=-1, encoding=None, errors=None, newline=None):
+        if self.shard is None:
+            return super().open(mode, buffering, encoding, errors, newline)
+        if "b" in mode:
+            return io.BytesIO(self.read_bytes())
+        return io.TextIOWrapper(
+            io.BytesIO(self.read_bytes()), encoding or "utf-8", errors, newline
+        )
+
+    def extract(self, dest):
+        """Copy the file out of its shard to `dest`."""
+        with open(self.shard, "rb") as src, open(dest, "wb") as d:
+            src.seek(self.offset)
+            remaining = self.size
+            while remaining > 0:
+                chunk = src.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                d.write(chunk)
+                remaining -= len(chunk)
+        count(COPY, self.size)
+
+
+def member_path(path, shard, offset: int, size: int) -> MemberPath:
+    p = MemberPath(path)
+    p.shard, p.offset, p.size = Path(shard), int(offset), int(size)
+    return p
+
+
+def readable(path):
+    """A path, or for a file in an archive, a file object with its bytes, that libraries such as PIL can open."""
+    if isinstance(path, MemberPath) and path.shard is not None:
+        return path.open("rb")
+    return path
+
+
+def file_size(path) -> int:
+    if isinstance(path, MemberPath) and path.shard is not None:
+        return path.size
+    return os.path.getsize(path)
+
+
+def write_archive(paths: List[Path], el_dir: Path, shard_mb=DEFAULT_ARCHIVE_SHARD_MB):
+    """Pack `paths` into tar shards of up to `shard_mb` in `el_dir`, in order, and write their index. A file larger
+    than a shard has a shard to itself. `paths` may be in the archive of another element."""
+    shard_bytes = shard_mb * 1e6
+    entries = []
+    shard, tar = -1, None
+    now = int(time.time())
+    try:
+        for p in paths:
+            size = file_size(p)
+            if tar is None or (tar.offset > 0 and tar.offset + size > shard_bytes):
+                if tar is not None:
+                    tar.close()
+                shard += 1
+                tar = tarfile.open(el_dir / shard_name(shard), "w")
+            info = tarfile.TarInfo(p.name)
+            info.size, info.mtime = size, now
+            with p.open("rb") as f:
+                tar.addfile(info, f)
+            # NB: a member's data ends its entry, padded to the next 512 byte block
+            offset = tar.offset - -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            entries.append((info.name, shard, offset, size))
+            count(COPY, size)
+    finally:
+        if tar is not None:
+            tar.close()
+    write_index(el_dir, entries)
+
+
+def write_index(el_dir: Path, entries: List[Tuple[str, int, int, int]]):
+    tmp = el_dir / f".{INDEX_FILE}.tmp"
+    with open(tmp, "w") as f:
+        for name, shard, offset, size in entries:
+            f.write(f"{name}\t{shard}\t{offset}\t{size}\n")
+    os.replace(tmp, el_dir / INDEX_FILE)
+
+
+def read_index(el_dir: Path) -> List[MemberPath]:
+    """The files in the archive of the element in `el_dir`, in the order they were written."""
+    el_dir = Path(el_dir)
+    members = []
+    with open(el_dir / INDEX_FILE, "r") as f:
+        for line in f:
+            name, shard, offset, size = line.rstrip("\n").split("\t")
+            shard = el_dir / shard_name(int(shard))
+            members.append(member_path(el_dir / name, shard, offset, size))
+    return members
+
+
+def list_files(el_dir: Path, fs: List[Path] = None) -> List[Path]:
+    """The files of the element in `el_dir`, `fs` if they have been listed already: the files in it, and if it is
+    archived, those in its archive rather than the shards and index."""
+    fs = files(el_dir) if fs is None else fs
+    if not any(f.name == INDEX_FILE for f in fs):
+        return fs
+    return [f for f in fs if not is_archive_file(f.name)] + read_index(el_dir)
@@ -0,0 +1,172 @@
+"""
+A content-addressed store of the files of a LocalStorage folder's elements, so that identical files are kept once.
+
+Report how much disk the store saves, and with --gc remove the files that no element refers to any more, with:
+    python -m lib.common.blobs media/my_folder [--gc]
+"""
+import os
+import sys
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+from lib.common.leases import node_name
+from lib.common.writes import (
+    write_file,
+    move_file,
+    count,
+    STRATEGIES,
+    HARDLINK,
+    DEDUP,
+)
+
+# the store's dir in a storage's base dir.
+BLOBS_DIR = "blobs"
+# config key, at the top level of the YAML, that turns the store on.
+BLOBS = "blobs"
+
+HASH = "sha256"
+# files are hashed a chunk at a time, so that they are never read into memory whole.
+CHUNK_SIZE = 1 << 20
+# the threads that hash an element's files at once. hashlib releases the GIL for large chunks.
+HASH_WORKERS = 4
+
+
+def hash_file(path) -> str:
+    h = hashlib.new(HASH)
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class BlobStore:
+    """Keeps each distinct file body once, in `blobs/<hash>`, and puts it in the dirs of the elements that have it as
+    hardlinks. Element dirs are ordinary dirs of ordinary files as far as reading them goes, so that
+    `read_elements` and modules need not know of the store.
+
+    As the files of elements are shared, they must not be changed in place, which mtriage never does. An element that
+    is removed leaves its blobs in the store until they are collected with `gc`. A blob is written to a temporary file
+    and renamed into place, so that several processes can write to one store at once."""
+
+    def __init__(self, path, strategies=None):
+        self.path = Path(path)
+        self.strategies = strategies
+        self.pool = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # NB: the hashing threads can't be pickled, nor used in a forked process, so each process starts its own
+        return {"path": self.path, "strategies": self.strategies}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["strategies"])
+
+    def blob_path(self, digest: str) -> Path:
+        # NB: a level of dirs by the hash's first two characters, so that no dir holds too many files
+        return self.path / digest[:2] / digest
+
+    def hash_files(self, paths: List[Path]) -> List[str]:
+        if len(paths) < 2:
+            return [hash_file(p) for p in paths]
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pool, self.pid = ThreadPoolExecutor(HASH_WORKERS), os.getpid()
+            pool = self.pool
+        return list(pool.map(hash_file, paths))
+
+    def put(self, src: Path, digest: str, move=False) -> Path:
+        """Add the file at `src` to the store, unless a file with the same content is already there, and return its
+        blob."""
+        blob = self.blob_path(digest)
+        size = os.stat(src).st_size
+        if blob.exists():
+            count(DEDUP, size)
+            if move:
+                os.remove(src)
+            return blob
+        os.makedirs(blob.parent, exist_ok=True)
+        tmp = blob.with_name(f".{digest}.{node_name()}.{threading.get_ident()}.tmp")
+        if move:
+            move_file(src, tmp, self.strategies)
+        else:
+            # NB: a blob is never hardlinked to its source, which may change, as blobs are shared
+            strategies = [s for s in self.strategies or STRATEGIES if s != HARDLINK]
+            write_file(src, tmp, strategies)
+        os.replace(tmp, blob)
+        return blob
+
+    def write_paths(self, paths: List[Path], base: Path, move=False):
+        """Write the files at `paths` into the element dir `base`, through the store."""
+        paths = [Path(p) for p in paths]
+        for src, digest in zip(paths, self.hash_files(paths)):
+            blob = self.put(src, digest, move=move)
+            dest = base / src.name
+            if os.path.lexists(dest):
+                os.remove(dest)
+            try:
+                os.link(blob, dest)
+            except OSError:
+                # NB: say a filesystem with no hardlinks, or a blob that has as many links as it can have
+                write_file(blob, dest, self.strategies)
+
+    def blobs(self):
+        for d in sorted(self.path.iterdir()) if self.path.is_dir() else []:
+            if d.is_dir():
+                for blob in d.iterdir():
+                    if not blob.name.startswith("."):
+                        yield blob
+
+    def report(self) -> dict:
+        """The blobs in the store, and the bytes of them that are referred to by elements, that are stored, and that
+        the store saves by keeping each once."""
+        report = {"blobs": 0, "unreferenced": 0, "referenced_bytes": 0}
+        report["stored_bytes"] = report["unreferenced_bytes"] = 0
+        for blob in self.blobs():
+            st = os.stat(blob)
+            report["blobs"] += 1
+            report["stored_bytes"] += st.st_size
+            report["referenced_bytes"] += st.st_size * (st.st_nlink - 1)
+            if st.st_nlink == 1:
+                report["unreferenced"] += 1
+                report["unreferenced_bytes"] += st.st_size
+        report["saved_bytes"] = report["referenced_bytes"] - (
+            report["stored_bytes"] - report["unreferenced_bytes"]
+        )
+        return report
+
+    def gc(self) -> int:
+        """Remove the blobs that no element refers to. Returns the number removed."""
+        removed = 0
+        for blob in list(self.blobs()):
+            if os.stat(blob).st_nlink == 1:
+                os.remove(blob)
+                removed += 1
+        return removed
+
+
+def format_report(report: dict) -> str:
+    mb = lambda k: report[k] / 1e6
+    return (
+        f"{report['blobs']} blobs, {mb('stored_bytes'):.1f}MB stored for {mb('referenced_bytes'):.1f}MB of element "
+        f"files, {mb('saved_bytes'):.1f}MB saved. {report['unreferenced']} blobs "
+        f"({mb('unreferenced_bytes'):.1f}MB) are not referred to by any element."
+    )
+
+
+if __name__ == "__main__":
+    from lib.common.storage import LocalStorage
+
+    args = [a for a in sys.argv[1:] if a != "--gc"]
+    if len(args) != 1:
+        print(__doc__.strip())
+        sys.exit(1)
+    store = BlobStore(LocalStorage(folder=args[0]).base_dir / BLOBS_DIR)
+    print(format_report(store.report()))
+    if "--gc" in sys.argv:
+        print(f"{store.gc()} blobs removed")
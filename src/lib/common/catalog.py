@@ -0,0 +1,234 @@
+"""
+An index of the elements in a LocalStorage folder, so that elements can be read without listing every element dir.
+
+Reconcile a folder's catalog with what is on disk with:
+    python -m lib.common.catalog media/my_folder
+"""
+import os
+import sys
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List
+from lib.common.etypes import (
+    Etype,
+    LocalElement,
+    LazyLocalElement,
+    etype_name,
+    from_name,
+)
+from lib.common.exceptions import EtypeCastError
+from lib.common.util import subdirs, files
+from lib.common.archives import list_files, INDEX_FILE
+
+# the catalog's file in a storage's base dir.
+CATALOG_FILE = ".catalog.db"
+# how long a process waits on another that is writing to the catalog, in seconds.
+BUSY_TIMEOUT = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS elements (
+    query TEXT NOT NULL,
+    id TEXT NOT NULL,
+    etype TEXT,
+    files TEXT NOT NULL,
+    paths TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (query, id)
+);
+CREATE TABLE IF NOT EXISTS stages (
+    query TEXT PRIMARY KEY,
+    mtime INTEGER NOT NULL
+);
+"""
+
+
+def stage_mtime(stage_dir: Path):
+    """The modification time of a stage's dir, which changes whenever an element dir is added to or removed from it,
+    or None if it does not exist."""
+    try:
+        return os.stat(stage_dir).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def element_row(query: str, el_dir: Path) -> tuple:
+    """The catalog row of the element in `el_dir`: its etype as `read_elements` would cast it, every file in it
+    with its size, and the names of the files that its etype keeps, which for an archived element are those in its
+    archive rather than its shards."""
+    fs = files(el_dir)
+    sizes = [[f.name, f.stat().st_size] for f in fs]
+    try:
+        el = Etype.cast(el_dir.name, list_files(el_dir, fs))
+        et, paths = etype_name(el.et), [p.name for p in el.paths]
+    except EtypeCastError:
+        # NB: an element with no files can't be read, but is kept so that it is still listed
+        et, paths = None, []
+    return (
+        query,
+        el_dir.name,
+        et,
+        json.dumps(sizes),
+        json.dumps(paths),
+        sum(size for _, size in sizes),
+    )
+
+
+class Catalog:
+    """An SQLite index of the elements in each stage (the 'data' dir of a selector, or the 'derived' dir of an
+    analyser) of a folder: each element's id, etype, files and their sizes. It is kept up to date by
+    `LocalStorage.write_element` and `remove_element`, so that `read_elements` can be served from it.
+
+    A stage that has been changed other than through the storage, say by copying element dirs into it, is noticed by
+    its dir's modification time, and rescanned from disk the next time it is read. Changes to the files within an
+    element dir are not noticed, which is what `reconcile` is for.
+
+    Each process (and each thread, in turn) uses the catalog through a connection of its own, so that it can be used
+    from worker processes. Writes from several processes are serialised by SQLite."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+
+    def __getstate__(self):
+        # NB: connections can't be pickled, nor shared with a forked process, so each process opens its own
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    @contextmanager
+    def connect(self):
+        """This process' connection, for the calling thread to use alone until the block ends."""
+        if self.pid != os.getpid():
+            # NB: a forked process inherits the lock in whatever state it was in, and a connection it can't use
+            self.lock, self.conn, self.pid = threading.Lock(), None, os.getpid()
+        with self.lock:
+            if self.conn is None:
+                self.conn = sqlite3.connect(
+                    str(self.path), timeout=BUSY_TIMEOUT, check_same_thread=False
+                )
+                self.conn.execute("PRAGMA synchronous=NORMAL")
+                self.conn.executescript(SCHEMA)
+            yield self.conn
+
+    def __synced(self, conn, query: str, mtime) -> bool:
+        row = conn.execute(
+            "SELECT mtime FROM stages WHERE query = ?", (query,)
+        ).fetchone()
+        return row is not None and row[0] == mtime
+
+    def is_synced(self, query: str, stage_dir: Path) -> bool:
+        """Whether the catalog holds every element of a stage. A stage that does not exist yet is empty, and so
+        synced once its rows are cleared."""
+        mtime = stage_mtime(stage_dir)
+        with self.connect() as conn:
+            if mtime is None:
+                with conn:
+                    conn.execute("DELETE FROM elements WHERE query = ?", (query,))
+                    conn.execute("DELETE FROM stages WHERE query = ?", (query,))
+                return True
+            return self.__synced(conn, query, mtime)
+
+    def put(self, query: str, stage_dir: Path, el_dir: Path, synced: bool):
+        """Record the element in `el_dir`, once it has been written. If the stage was `synced` before it was written,
+        it still is."""
+        row = element_row(query, el_dir)
+        with self.connect() as conn:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO elements VALUES (?, ?, ?, ?, ?, ?)", row
+                )
+                if synced:
+                    self.__stamp(conn, query, stage_mtime(stage_dir))
+
+    def remove(self, query: str, stage_dir: Path, el_id: str, synced: bool):
+        with self.connect() as conn:
+            with conn:
+                conn.execute(
+                    "DELETE FROM elements WHERE query = ? AND id = ?", (query, el_id)
+                )
+                if synced:
+                    self.__stamp(conn, query, stage_mtime(stage_dir))
+
+    def __stamp(self, conn, query: str, mtime):
+        if mtime is not None:
+            conn.execute("INSERT OR REPLACE INTO stages VALUES (?, ?)", (query, mtime))
+
+    def reconcile_stage(self, query: str, stage_dir: Path) -> int:
+        """Rebuild a stage's rows from disk. Returns the number of elements in it."""
+        # NB: the time is taken before the scan, so that elements added during it are picked up on the next read
+        mtime = stage_mtime(stage_dir)
+        rows = [element_row(query, el) for el in subdirs(stage_dir)]
+        with self.connect() as conn:
+            with conn:
+                conn.execute("DELETE FROM elements WHERE query = ?", (query,))
+                conn.executemany("INSERT INTO elements VALUES (?, ?, ?, ?, ?, ?)", rows)
+                self.__stamp(conn, query, mtime)
+        return len(rows)
+
+    def __rows(self, query: str, stage_dir: Path, columns: str) -> list:
+        if not self.is_synced(query, stage_dir):
+            self.reconcile_stage(query, stage_dir)
+        with self.connect() as conn:
+            return conn.execute(
+                f"SELECT {columns} FROM elements WHERE query = ? ORDER BY id", (query,)
+            ).fetchall()
+
+    def ids(self, query: str, stage_dir: Path) -> List[str]:
+        return [r[0] for r in self.__rows(query, stage_dir, "id")]
+
+    def elements(self, query: str, stage_dir: Path) -> List[LocalElement]:
+        """The elements of a stage, as `LocalStorage.read_elements` casts them from disk."""
+        els = []
+        rows = self.__rows(query, stage_dir, "id, etype, paths, files")
+        for el_id, et, paths, fs in rows:
+            if et is None:
+                raise EtypeCastError("Paths cannot be empty.")
+            el_dir = stage_dir / el_id
+            if f'"{INDEX_FILE}"' in fs:
+                # NB: the files in an archive are listed from its index by the worker that first uses them
+                el = LazyLocalElement(id=el_id, query=query, el_dir=el_dir)
+                el.et = from_name(et)
+                els.append(el)
+                continue
+            els.append(
+                LocalElement(
+                    id=el_id,
+                    query=query,
+                    paths=[el_dir / p for p in json.loads(paths)],
+                    et=from_name(et),
+                )
+            )
+        return els
+
+    def clear(self):
+        with self.connect() as conn:
+            with conn:
+                conn.execute("DELETE FROM elements")
+                conn.execute("DELETE FROM stages")
+
+
+def reconcile(storage) -> dict:
+    """Rebuild the catalog of a LocalStorage from disk. Returns the number of elements in each stage."""
+    storage.catalog.clear()
+    counts = {}
+    for q, stage_dir in storage.stages():
+        counts[q] = storage.catalog.reconcile_stage(q, stage_dir)
+    return counts
+
+
+if __name__ == "__main__":
+    from lib.common.storage import LocalStorage
+
+    if len(sys.argv) != 2:
+        print(__doc__.strip())
+        sys.exit(1)
+    counts = reconcile(LocalStorage(folder=sys.argv[1], catalog=True))
+    for q, n in counts.items():
+        print(f"{q}: {n} elements")
+    print(f"{sum(counts.values())} elements in {len(counts)} stages")
@@ -0,0 +1,135 @@
+"""
+A columnar format for the element index of a selector, which can be written a row group at a time, read a column at a
+time, and is memory-mapped rather than read whole.
+
+Add a columnar index to a selector's element_map.csv, or remove it, with:
+    python -m lib.common.columnar media/my_folder MySelector --to csv|columnar
+"""
+import os
+import sys
+import json
+import shutil
+import numpy as np
+from pathlib import Path
+from itertools import islice
+from types import SimpleNamespace as Ns
+from typing import Iterable, List
+
+# config key, at the top level of the YAML, for the format that element indexes are written in.
+INDEX_FORMAT = "index_format"
+CSV = "csv"
+COLUMNAR = "columnar"
+INDEX_FORMATS = [CSV, COLUMNAR]
+
+# the rows that are buffered before they are written out as one group of column files.
+ROW_GROUP_SIZE = 65536
+META_FILE = "meta.json"
+
+
+def encode(values: List[str]):
+    """A column of strings as the offsets of each one's end in, and the UTF-8 bytes of, all of them, as Arrow lays
+    out a string column. Both can be memory-mapped."""
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(v) for v in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def decode(offsets, data) -> List[str]:
+    # NB: sliced from one bytes object, as slicing a memory-mapped array for every value is far slower
+    body, offs = data.tobytes(), offsets.tolist()
+    return [body[offs[i] : offs[i + 1]].decode("utf-8") for i in range(len(offs) - 1)]
+
+
+def as_str(value) -> str:
+    # NB: as the csv module writes values, so that an index reads the same in either format
+    return "" if value is None else str(value)
+
+
+def write_columnar(path, rows: Iterable, row_group_size=ROW_GROUP_SIZE) -> int:
+    """Write `rows`, the first of which is the header, to a columnar index at `path`, replacing any that is there.
+    Rows are consumed a group at a time, so that an index need never be held in memory whole. Returns the number of
+    rows written, not counting the header."""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+    rows = iter(rows)
+    columns = [as_str(c) for c in next(rows, [])]
+    groups = []
+    while True:
+        # NB: rows may be any sequence, such as the values of a dict
+        group = [list(row) for row in islice(rows, row_group_size)]
+        if len(group) == 0:
+            break
+        for idx, column in enumerate(columns):
+            values = [as_str(row[idx]) if idx < len(row) else "" for row in group]
+            offsets, data = encode(values)
+            np.save(tmp / f"{len(groups)}.{idx}.offsets.npy", offsets)
+            np.save(tmp / f"{len(groups)}.{idx}.data.npy", data)
+        groups.append(len(group))
+    with open(tmp / META_FILE, "w") as f:
+        json.dump({"columns": columns, "groups": groups}, f)
+    if path.exists():
+        shutil.rmtree(path)
+    os.rename(tmp, path)
+    return sum(groups)
+
+
+def as_lists(rows: Iterable[Ns]):
+    """Rows read from an element index as the lists that it is written from, header first."""
+    for idx, row in enumerate(rows):
+        if idx == 0:
+            yield list(vars(row).keys())
+        yield list(vars(row).values())
+
+
+class ColumnarIndex:
+    """An element index written by `write_columnar`: a dir with one pair of arrays for each column in each row group.
+    Only the columns that are asked for are read, from memory-mapped files, a row group at a time."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / META_FILE, "r") as f:
+            meta = json.load(f)
+        self.columns = meta["columns"]
+        self.groups = meta["groups"]
+
+    def __len__(self):
+        return sum(self.groups)
+
+    def column(self, name: str, group: int) -> List[str]:
+        idx = self.columns.index(name)
+        load = lambda part: np.load(
+            self.path / f"{group}.{idx}.{part}.npy", mmap_mode="r"
+        )
+        return decode(load("offsets"), load("data"))
+
+    def rows(self, columns=None):
+        """The rows of the index, each as a namespace of the values of `columns` (all of them by default)."""
+        if columns is None:
+            columns = self.columns
+        columns = [c for c in self.columns if c in columns]
+        for group in range(len(self.groups)):
+            values = [self.column(c, group) for c in columns]
+            for row in zip(*values):
+                yield Ns(**dict(zip(columns, row)))
+
+
+if __name__ == "__main__":
+    from lib.common.storage import LocalStorage
+    from lib.common.etypes import LocalElementsIndex
+
+    args = sys.argv[1:]
+    if len(args) != 4 or args[2] != "--to" or args[3] not in INDEX_FORMATS:
+        print(__doc__.strip())
+        sys.exit(1)
+    folder, selector, _, to = args
+    disk = LocalStorage(folder=folder, index_format=to)
+    if disk.elements_index_format(selector) == to:
+        print(f"The element index of {selector} is already {to}")
+        sys.exit(0)
+    rows = disk.read_elements_index(selector).rows
+    disk.write_elements_index(selector, LocalElementsIndex(as_lists(rows)))
+    print(f"Wrote the element index of {selector} as {to}")
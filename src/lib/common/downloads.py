@@ -0,0 +1,93 @@
+import time
+import asyncio
+import aiohttp
+from pathlib import Path
+from urllib.parse import urlparse
+from email.utils import parsedate_to_datetime
+from lib.common.exceptions import ElementShouldRetryError
+
+# config option for the number of downloads from a single host that can be in flight at once.
+PER_HOST = "per_host"
+DEFAULT_PER_HOST = 8
+# the size of the pieces in which a download is written to disk.
+DOWNLOAD_CHUNK = 1 << 16
+# the status of a response that asks the client to slow down, which, as with server errors, is retried.
+TOO_MANY_REQUESTS = 429
+
+
+def per_host_limit(config) -> int:
+    return int(config.get(PER_HOST, DEFAULT_PER_HOST))
+
+
+def retry_after(value) -> float:
+    """The seconds that a Retry-After header of `value` asks a client to wait, whether it is given in seconds or as a
+    date, or None if there is no header or it can't be read."""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+class DownloadPool:
+    """What a selector's downloads on an event loop share: a semaphore for each host, so that at most `per_host`
+    requests to the same host are in flight at once, and an aiohttp session, so that connections to a host are reused
+    from one download to the next. Both are created lazily, by tasks on the event loop that they belong to, as a
+    phase's retries may run on another loop than its first attempts. `close` closes the session of the loop that it
+    is called on."""
+
+    def __init__(self, per_host: int):
+        self.per_host = per_host
+        self.hosts = {}
+        self.sessions = {}
+
+    def __call__(self, url: str) -> asyncio.Semaphore:
+        key = (asyncio.get_event_loop(), urlparse(url).netloc)
+        if key not in self.hosts:
+            self.hosts[key] = asyncio.Semaphore(self.per_host)
+        return self.hosts[key]
+
+    def session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_event_loop()
+        if loop not in self.sessions:
+            self.sessions[loop] = aiohttp.ClientSession()
+        return self.sessions[loop]
+
+    async def close(self):
+        loop = asyncio.get_event_loop()
+        self.hosts = {k: s for k, s in self.hosts.items() if k[0] is not loop}
+        session = self.sessions.pop(loop, None)
+        if session is not None:
+            await session.close()
+
+
+async def download(url: str, path: Path, pool: DownloadPool) -> int:
+    """Download `url` to `path` without blocking the event loop, and return the number of bytes written. Connection
+    errors, timeouts, and responses that ask the client to try again later (429 and 5xx) are raised as
+    `ElementShouldRetryError`, which waits as long as any Retry-After header asks. Other error responses are raised as
+    they are."""
+    written = 0
+    try:
+        async with pool(url):
+            async with pool.session().get(url) as resp:
+                resp.raise_for_status()
+                with open(path, "wb") as f:
+                    async for chunk in resp.content.iter_chunked(DOWNLOAD_CHUNK):
+                        f.write(chunk)
+                        written += len(chunk)
+    except aiohttp.ClientResponseError as e:
+        if e.status != TOO_MANY_REQUESTS and e.status < 500:
+            raise e
+        after = retry_after(e.headers.get("Retry-After") if e.headers else None)
+        raise ElementShouldRetryError(
+            f"could not download {url}: {e.status} {e.message}", after=after
+        )
+    except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+        raise ElementShouldRetryError(f"could not download {url}: {e}")
+    return written
@@ -8,6 +8,7 @@ from typing import Union as _Union, List, TypeVar
 from abc import abstractmethod
 from lib.common.exceptions import EtypeCastError
 from lib.common.get import get_custom_etypes
+from lib.common.archives import list_files
 
 
 class LocalElement:
@@ -23,6 +24,55 @@ class LocalElement:
         self.et = et
 
 
+class LazyLocalElement(LocalElement):
+    """A LocalElement read from its element dir, whose files are only listed, and whose etype is only cast, when its
+    `paths` or `et` are first used. Elements are read this way so that reading them costs the main process next to
+    nothing, and the work is done in the worker that processes each one. An element whose files can't be cast raises
+    an EtypeCastError when they are first used, rather than when it is read."""
+
+    def __init__(self, id=None, query=None, el_dir=None):
+        self.id = id
+        self.query = query
+        self.el_dir = Path(el_dir)
+        self._paths = None
+        self._et = None
+
+    def list_files(self):
+        # NB: the files in an element's archive are listed rather than its shards (see lib/common/archives.py)
+        return list_files(self.el_dir)
+
+    def __resolve(self):
+        el = cast(self.id, self.list_files())
+        if self._paths is None:
+            self._paths = el.paths
+        if self._et is None:
+            self._et = el.et
+
+    @property
+    def is_resolved(self) -> bool:
+        return self._paths is not None and self._et is not None
+
+    @property
+    def paths(self):
+        if self._paths is None:
+            self.__resolve()
+        return self._paths
+
+    @paths.setter
+    def paths(self, paths):
+        self._paths = paths
+
+    @property
+    def et(self):
+        if self._et is None:
+            self.__resolve()
+        return self._et
+
+    @et.setter
+    def et(self, et):
+        self._et = et
+
+
 class LocalElementsIndex:
     """Similar to LocalElement, on the same comp as mtriage is running.
     Initialised with an array of arrays, where each inner array represents one element to be retrieved."""
@@ -48,6 +98,20 @@ class Et:
     def __str__(self):
         return self.__repr__()
 
+    def __getstate__(self):
+        # NB: the core etypes filter with lambdas, which can't be pickled. Drop
+        # them here and look them up by name when unpickling, so that elements
+        # can be sent to worker processes.
+        state = self.__dict__.copy()
+        if getattr(state.get("filter_func"), "__name__", None) == "<lambda>":
+            state["filter_func"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.filter_func is None:
+            self.filter_func = getattr(Etype, self.id).filter_func
+
     def __get_etype(self):
         for etype in Etype:
             if self.name == etype.name:
@@ -200,9 +264,28 @@ def cast(el_id, paths: _Union[List[Pth], Pth], to: Et = None) -> LocalElement:
         return Union(*valid)(el_id, paths)
 
 
+def etype_name(et: Et) -> str:
+    """A name for `et` that `from_name` turns back into it, so that etypes can be stored alongside elements."""
+    if et.is_union:
+        return f"Union({','.join(etype_name(x) for x in et.ets)})"
+    if et.is_array:
+        return f"Array({et.id})"
+    return et.id
+
+
+def from_name(name: str) -> Et:
+    if name.startswith("Union("):
+        return Union(*[from_name(x) for x in name[len("Union(") : -1].split(",")])
+    if name.startswith("Array("):
+        return Array(from_name(name[len("Array(") : -1]))
+    return getattr(Etype, name)
+
+
 class Etype:
     Any = Et("Any", lambda ps: ps)
-    Image = Et("Image", lambda ps: fglob(ps, [".bmp", ".jpg", ".jpeg", ".png"]))
+    Image = Et(
+        "Image", lambda ps: fglob(ps, [".bmp", ".jpg", ".jpeg", ".png", ".webp"])
+    )
     Video = Et("Video", lambda ps: fglob(ps, [".mp4", ".mov"]))
     Audio = Et("Audio", lambda ps: fglob(ps, [".mp3", ".wav", ".m4a", ".aac"]))
     Json = Et("Json", lambda ps: fglob(ps, [".json"]))
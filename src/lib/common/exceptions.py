@@ -47,8 +47,10 @@ class ElementShouldSkipError(Exception):
 
 
 class ElementShouldRetryError(Exception):
-    def __init__(self, msg):
+    def __init__(self, msg, after=None):
         super().__init__(f"{msg} - attempt retry")
+        # the least number of seconds to wait before the retry, if the element was asked to wait, say by a server
+        self.after = after
 
 
 class SelectorIndexError(Exception):
@@ -108,3 +110,18 @@ class InvalidElementIndex(Exception):
 class InvalidStorageQuery(Exception):
     def __init__(self, query, msg):
         super().__init__(f"The query '{query}' is invalid: {msg}")
+
+
+class InvalidSchedulerConfigError(Exception):
+    def __init__(self, msg):
+        super().__init__(f"Invalid scheduler config - {msg}")
+
+
+class InferenceServerError(Exception):
+    def __init__(self, msg):
+        super().__init__(f"Inference server failed - {msg}")
+
+
+class InvalidStorageConfigError(Exception):
+    def __init__(self, msg):
+        super().__init__(f"Invalid storage config - {msg}")
@@ -0,0 +1,352 @@
+import sys
+import queue
+import asyncio
+import threading
+import multiprocessing
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from lib.common.exceptions import InvalidSchedulerConfigError
+from lib.common.workers import DONE, KILLED, RETIRED
+from lib.common.workerpool import get_pool, innards_ref
+
+SERIAL = "serial"
+THREADS = "threads"
+PROCESSES = "processes"
+ASYNCIO = "asyncio"
+FORKSERVER = "forkserver"
+EXECUTORS = [SERIAL, THREADS, PROCESSES, ASYNCIO, FORKSERVER]
+
+
+class Executor(ABC):
+    """Runs a parallel phase's chunks of elements on some kind of worker. The dispatcher in
+    `MTModule.process_in_batches` calls `submit` with each chunk, which may block until a worker is free, and then
+    `close`, which returns once every chunk has been processed.
+
+    Each chunk is a list of `(record, element, attempt)` items. Once an element has been processed, its journal record
+    is put on `done_queue`, whichever executor processed it, unless it has been sent back to be retried.
+
+    Items that workers send back to be retried are put on the module's `retry_queue`, unless the executor had to take
+    them off it itself, in which case they are returned by `take_retries`.
+
+    Once closed, `summaries` holds what each worker process reported of itself when it exited (see
+    lib/common/workers.py)."""
+
+    def __init__(
+        self, module, innards, done_queue, shard_prefix, other_args, workers, queue_size
+    ):
+        self.module = module
+        self.innards = innards
+        self.done_queue = done_queue
+        self.shard_prefix = shard_prefix
+        self.other_args = other_args
+        self.workers = workers
+        self.queue_size = queue_size
+        self.summaries = []
+        self.retried = []
+
+    def take_retries(self) -> list:
+        """The items sent back to be retried that the executor has taken off the module's `retry_queue` since the last
+        call."""
+        retried, self.retried = self.retried, []
+        return retried
+
+    @abstractmethod
+    def submit(self, items: list):
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+
+class SerialExecutor(Executor):
+    """Processes each chunk in the calling process, as soon as it is submitted."""
+
+    def submit(self, items):
+        self.module.process_items(self.innards, items, self.done_queue, self.other_args)
+
+    def close(self):
+        pass
+
+
+class QueueExecutor(Executor):
+    """Workers take chunks from a bounded work queue, starting as chunks are submitted, up to `workers` of them."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.work_queue = self.make_queue(self.queue_size)
+        self.running = []
+
+    @abstractmethod
+    def make_queue(self, maxsize):
+        pass
+
+    @abstractmethod
+    def start_worker(self):
+        pass
+
+    def submit(self, items):
+        if len(self.running) < self.workers:
+            self.running.append(self.start_worker())
+        # NB: blocks while the queue is full, until a worker takes a chunk.
+        self.work_queue.put(items)
+
+    def close(self):
+        for _ in self.running:
+            self.work_queue.put(None)
+        for w in self.running:
+            w.join()
+
+
+class ProcessExecutor(QueueExecutor):
+    """Workers are forked processes, each of which gets its own copy of the module. Best suited to CPU-bound
+    phases.
+
+    A worker that reaches one of the module's `worker_limits` exits once it has finished its chunk, and a worker that
+    is killed (say, by the OOM killer) loses only its chunk. Either way, a fresh worker is started in its place.
+
+    A worker process can't exit until the items it sent back to be retried have been read from the retry queue's pipe,
+    so they are taken off it whenever the executor waits on its workers."""
+
+    # how long to wait on a worker or the work queue before checking whether any worker has exited.
+    POLL = 0.1
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.summary_queue = multiprocessing.Queue()
+        self.closing = False
+        self.stops = 0
+
+    def make_queue(self, maxsize):
+        return multiprocessing.Queue(maxsize=maxsize)
+
+    def start_worker(self):
+        p = multiprocessing.Process(target=self.run_worker)
+        p.start()
+        return p
+
+    def run_worker(self):
+        summary = self.module.process_queue(
+            self.innards,
+            self.work_queue,
+            self.done_queue,
+            self.shard_prefix,
+            self.other_args,
+            limits=self.module.worker_limits,
+        )
+        self.summary_queue.put(summary)
+        if summary["exit"] != DONE:
+            sys.exit(RETIRED)
+
+    def replace_exited(self):
+        """Start a fresh worker in place of each that exited before it was told to stop."""
+        self.collect_summaries()
+        self.collect_retries()
+        for idx, p in enumerate(self.running):
+            if p.exitcode is None or p.exitcode == 0:
+                continue
+            p.join()
+            if p.exitcode != RETIRED:
+                self.summaries.append(
+                    {"pid": p.pid, "elements": None, "peak_rss": None, "exit": KILLED}
+                )
+            if self.closing:
+                # NB: a killed worker may have taken its `None` already, and a spare one is harmless
+                self.stops += 1
+            self.running[idx] = self.start_worker()
+
+    def collect_summaries(self):
+        while True:
+            try:
+                self.summaries.append(self.summary_queue.get_nowait())
+            except queue.Empty:
+                return
+
+    def collect_retries(self, timeout=None):
+        """Take the items that workers have sent back to be retried off the retry queue, waiting up to `timeout` for
+        the first if there are none yet."""
+        retry_queue = self.module.retry_queue
+        try:
+            if timeout is not None:
+                self.retried.append(retry_queue.get(timeout=timeout))
+            while True:
+                self.retried.append(retry_queue.get_nowait())
+        except queue.Empty:
+            return
+
+    def submit(self, items):
+        self.replace_exited()
+        if len(self.running) < self.workers:
+            self.running.append(self.start_worker())
+        # NB: workers may exit while the queue is full, so they are replaced while waiting
+        while True:
+            try:
+                self.work_queue.put(items, timeout=self.POLL)
+                return
+            except queue.Full:
+                self.replace_exited()
+
+    def close(self):
+        self.closing = True
+        self.stops = len(self.running)
+        while True:
+            self.replace_exited()
+            while self.stops > 0:
+                try:
+                    self.work_queue.put_nowait(None)
+                    self.stops -= 1
+                except queue.Full:
+                    break
+            alive = [p for p in self.running if p.exitcode is None]
+            if len(alive) == 0:
+                break
+            # NB: rather than joining a worker, which may be waiting on its retries to be read before it can exit
+            self.collect_retries(timeout=self.POLL)
+        self.collect_summaries()
+        self.collect_retries()
+
+
+class ThreadExecutor(QueueExecutor):
+    """Workers are threads in the calling process, each working on a copy of the module (see
+    `MTModule.worker_copy`). Best suited to phases that spend most of their time waiting on the network or disk.
+
+    A chunk that raises an exception is logged and lost, as a worker process's chunk is when it dies, and its worker
+    goes on to the next, so that the work queue is never left without workers to take from it."""
+
+    def make_queue(self, maxsize):
+        return queue.Queue(maxsize=maxsize)
+
+    def start_worker(self):
+        worker = self.module.worker_copy(self.shard_prefix)
+        t = threading.Thread(
+            target=worker.process_queue,
+            args=(
+                self.innards,
+                self.work_queue,
+                self.done_queue,
+                self.shard_prefix,
+                self.other_args,
+            ),
+            kwargs={"recover": True},
+            daemon=True,
+        )
+        t.start()
+        return t
+
+
+class AsyncioExecutor(Executor):
+    """Chunks are processed as tasks on an event loop running in a background thread, at most `workers` at once. If
+    the phase's function is a coroutine function it is awaited on the loop; otherwise it runs in a thread pool of
+    the same size. Each chunk is processed on its own copy of the module. A chunk that raises an exception is logged and
+    lost, as it is with threads."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.slots = threading.Semaphore(self.workers)
+        self.loop = asyncio.new_event_loop()
+        self.pool = ThreadPoolExecutor(max_workers=self.workers)
+        self.loop.set_default_executor(self.pool)
+        self.futures = []
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    async def run(self, items):
+        worker = self.module
+        try:
+            worker = self.module.worker_copy(self.shard_prefix)
+            for batch in worker.batches_of(items):
+                worker.begin_batch(batch)
+                elements = [i for _, i, _ in batch]
+                if asyncio.iscoroutinefunction(self.innards):
+                    await self.innards(worker, elements, *self.other_args)
+                else:
+                    await self.loop.run_in_executor(
+                        None, self.innards, worker, elements, *self.other_args
+                    )
+                worker.end_batch(batch, self.done_queue)
+        except Exception as e:
+            worker.error_logger(f"Worker lost a chunk of {len(items)} elements: {e}")
+        finally:
+            if worker is not self.module:
+                worker.flush_logs()
+            self.slots.release()
+
+    def submit(self, items):
+        # NB: blocks while `workers` chunks are in flight, until one finishes.
+        self.slots.acquire()
+        self.futures.append(
+            asyncio.run_coroutine_threadsafe(self.run(items), self.loop)
+        )
+        pending = []
+        for f in self.futures:
+            if f.done():
+                # raises the chunk's exception, if it had one
+                f.result()
+            else:
+                pending.append(f)
+        self.futures = pending
+
+    def close(self):
+        for f in self.futures:
+            f.result()
+        asyncio.run_coroutine_threadsafe(self.module.close_loop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.pool.shutdown()
+        self.loop.close()
+
+
+class PoolExecutor(Executor):
+    """Chunks are sent to the shared pool of long-lived worker processes (see lib/common/workerpool.py), which is
+    started from a forkserver with the run's modules already imported, and outlives the phase. Suited to CPU-bound
+    phases of modules with heavy imports or models, and to frameworks that can't be used after a fork."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.pool = get_pool(self.workers)
+        module = self.module
+        self.task = {
+            "module": (type(module), module.config, module.name, module.disk),
+            "unique_id": module.UNIQUE_ID,
+            "innards": innards_ref(module, self.innards),
+            "phase": module.PHASE_KEY,
+            "batched": module.BATCHED,
+            "shard_prefix": self.shard_prefix,
+            "args": self.other_args,
+            "limits": module.worker_limits,
+            "shared": {"dest_q": module.dest_q},
+        }
+
+    def submit(self, items):
+        # NB: blocks while `queue_size` chunks are waiting on top of one per worker, until one finishes.
+        while len(self.pool.pending) >= self.workers + self.queue_size:
+            self.finish(self.pool.poll())
+        self.pool.submit({**self.task, "items": items})
+        self.finish(self.pool.poll(block=False))
+
+    def finish(self, finished):
+        for records, retries in finished:
+            for record in records:
+                self.done_queue.put(record)
+            for item in retries:
+                self.module.retry_queue.put(item)
+
+    def close(self):
+        while len(self.pool.pending) > 0:
+            self.finish(self.pool.poll())
+        self.summaries = self.pool.take_summaries()
+
+
+def make_executor(kind: str, *args) -> Executor:
+    executors = {
+        SERIAL: SerialExecutor,
+        THREADS: ThreadExecutor,
+        PROCESSES: ProcessExecutor,
+        ASYNCIO: AsyncioExecutor,
+        FORKSERVER: PoolExecutor,
+    }
+    if kind not in executors:
+        raise InvalidSchedulerConfigError(
+            f"the executor '{kind}' is not one of {EXECUTORS}"
+        )
+    return executors[kind](*args)
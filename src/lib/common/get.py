@@ -1,12 +1,11 @@
 from pathlib import Path
+from functools import lru_cache
 from importlib import import_module
 from lib.common.util import files
 
 
-def get_module(_from, key):
-    """Dynamically loads in all analysers from the analysers folder, generating a dictionary in which the folder name
-    is the key, and the export from 'main' is the value.
-    """
+def module_path(_from, key):
+    """The import path of the 'core' of the selector or analyser `key`."""
     if _from == "select":
         module_folder = f"lib.selectors"
     elif _from == "analyse":
@@ -14,14 +13,22 @@ def get_module(_from, key):
     else:
         raise ImportError("The phase argument must be either 'select' or 'analyse'")
 
-    pth = f"{module_folder}.{key}.core"
-    mod = import_module(pth)
+    return f"{module_folder}.{key}.core"
+
+
+def get_module(_from, key):
+    """Dynamically loads in all analysers from the analysers folder, generating a dictionary in which the folder name
+    is the key, and the export from 'main' is the value.
+    """
+    mod = import_module(module_path(_from, key))
     return mod.module
 
 
+@lru_cache(maxsize=None)
 def get_custom_etypes():
+    """The etypes in lib/etypes, looked up once per process, as they are needed whenever an element is cast."""
     base_import = "lib.etypes"
     module_folder = Path("/mtriage/src/lib/etypes")
     all_etypes = [t.stem for t in files(module_folder)]
     imports = [f"{base_import}.{p}" for p in all_etypes]
-    return [import_module(mod).etype for mod in imports]
+    return tuple(import_module(mod).etype for mod in imports)
@@ -0,0 +1,162 @@
+import os
+import sys
+import time
+import queue
+import multiprocessing
+import numpy as np
+from lib.common.util import MAX_CPUS
+from lib.common.exceptions import InferenceServerError
+
+# config options for an analyser's inference server.
+INFERENCE_SERVER = "inference_server"
+INFERENCE_BATCH_SIZE = "inference_batch_size"
+INFERENCE_WAIT_MS = "inference_wait_ms"
+INFERENCE_THREADS = "inference_threads"
+INFERENCE_SLOTS = "inference_slots"
+INFERENCE_SLOT_MB = "inference_slot_mb"
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_WAIT_MS = 5
+DEFAULT_SLOTS = 16
+DEFAULT_SLOT_MB = 16
+
+
+def set_intra_op_threads(threads: int):
+    """Set the number of threads that the model's ops use, for the frameworks that mtriage's analysers use. Must be
+    called before the model is loaded."""
+    for var in ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "TF_NUM_INTRAOP_THREADS"]:
+        os.environ[var] = str(threads)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+
+
+class InferenceServer:
+    """A single process that owns an analyser's model, so that parallel workers can decode and preprocess elements
+    while the model runs in one place. Useful for frameworks that can't be used after a fork, such as TensorFlow, and
+    for models too large to hold in every worker.
+
+    Inputs are passed from workers through a fixed pool of shared memory slots, which are allocated before any
+    workers are started. A worker copies its input array into a free slot and puts a request on a queue; the server
+    gathers requests for up to 'inference_wait_ms', or until it has 'inference_batch_size' rows, and calls the
+    analyser's `predict` once with all of their rows. Each row's result is sent back on the queue for the request's
+    slot, which the worker then frees.
+    """
+
+    def __init__(self, analyser, config):
+        self.analyser = analyser
+        self.batch_size = int(config.get(INFERENCE_BATCH_SIZE, DEFAULT_BATCH_SIZE))
+        self.wait = float(config.get(INFERENCE_WAIT_MS, DEFAULT_WAIT_MS)) / 1000
+        self.threads = int(config.get(INFERENCE_THREADS, MAX_CPUS + 1))
+        self.slots = int(config.get(INFERENCE_SLOTS, DEFAULT_SLOTS))
+        self.slot_bytes = int(config.get(INFERENCE_SLOT_MB, DEFAULT_SLOT_MB)) << 20
+
+        self.memory = multiprocessing.RawArray("b", self.slots * self.slot_bytes)
+        self.requests = multiprocessing.Queue()
+        self.responses = [multiprocessing.SimpleQueue() for _ in range(self.slots)]
+        self.free = multiprocessing.Queue()
+        for slot in range(self.slots):
+            self.free.put(slot)
+        self.ready = multiprocessing.SimpleQueue()
+        self.process = None
+
+    def slot_view(self, slot: int, shape, dtype) -> np.ndarray:
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape))
+        arr = np.frombuffer(
+            self.memory, dtype=dtype, count=count, offset=slot * self.slot_bytes
+        )
+        return arr.reshape(shape)
+
+    def start(self):
+        """Fork the server, which loads the model with the analyser's `pre_analyse`. Returns once the model is
+        loaded, or raises if loading failed."""
+        self.process = multiprocessing.Process(target=self.serve, daemon=True)
+        self.process.start()
+        err = self.ready.get()
+        if err is not None:
+            self.process.join()
+            raise InferenceServerError(err)
+
+    def close(self):
+        self.requests.put(None)
+        self.process.join()
+
+    def infer(self, inputs: np.ndarray) -> list:
+        """Run the model on `inputs`, an array with one row per input, and return a list with the result for each
+        row. Called from workers. Inputs larger than a slot are sent in several requests."""
+        inputs = np.ascontiguousarray(inputs)
+        if len(inputs) == 0:
+            return []
+        row_bytes = max(1, inputs[0].nbytes)
+        per_slot = self.slot_bytes // row_bytes
+        if per_slot < 1:
+            raise InferenceServerError(
+                f"an input of {row_bytes} bytes is larger than a slot, see '{INFERENCE_SLOT_MB}'"
+            )
+        results = []
+        for start in range(0, len(inputs), per_slot):
+            results += self.__request(inputs[start : start + per_slot])
+        return results
+
+    def __request(self, rows: np.ndarray) -> list:
+        slot = self.free.get()
+        try:
+            self.slot_view(slot, rows.shape, rows.dtype)[...] = rows
+            self.requests.put((slot, rows.shape, rows.dtype.str))
+            ok, result = self.responses[slot].get()
+        finally:
+            self.free.put(slot)
+        if not ok:
+            raise InferenceServerError(result)
+        return result
+
+    def serve(self):
+        set_intra_op_threads(self.threads)
+        try:
+            self.analyser.pre_analyse(self.analyser.config)
+        except Exception as e:
+            self.ready.put(f"could not load the model: {e}")
+            return
+        finally:
+            self.analyser.flush_logs()
+        self.ready.put(None)
+
+        closing = False
+        while not closing:
+            req = self.requests.get()
+            if req is None:
+                break
+            batch, rows = [req], req[1][0]
+            deadline = time.monotonic() + self.wait
+            # gather requests that arrive in the meantime, to fill the model's forward pass
+            while rows < self.batch_size:
+                try:
+                    timeout = max(0, deadline - time.monotonic())
+                    req = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if req is None:
+                    closing = True
+                    break
+                batch.append(req)
+                rows += req[1][0]
+            self.__predict(batch)
+
+    def __predict(self, batch):
+        try:
+            inputs = np.concatenate(
+                [self.slot_view(slot, shape, dtype) for slot, shape, dtype in batch]
+            )
+            outputs = self.analyser.predict(inputs, self.analyser.config)
+            if len(outputs) != len(inputs):
+                raise InferenceServerError(
+                    f"'predict' returned {len(outputs)} results for {len(inputs)} inputs"
+                )
+        except Exception as e:
+            for slot, _, _ in batch:
+                self.responses[slot].put((False, str(e)))
+            return
+        start = 0
+        for slot, shape, _ in batch:
+            self.responses[slot].put((True, list(outputs[start : start + shape[0]])))
+            start += shape[0]
@@ -0,0 +1,136 @@
+import os
+import time
+import hashlib
+from queue import Empty
+
+# each record is the MD5 digest of a done element's key.
+RECORD_SIZE = hashlib.md5().digest_size
+
+# config keys that set the journal's flush policy. By default every record is
+# flushed as soon as it is written, which is the safest (and slowest) policy.
+FLUSH_EVERY = "journal_flush_every"
+FLUSH_MS = "journal_flush_ms"
+FSYNC = "journal_fsync"
+
+
+def journal_policy(config: dict) -> dict:
+    """Read the journal's flush policy from a module config."""
+    every = config.get(FLUSH_EVERY)
+    ms = config.get(FLUSH_MS)
+    return {
+        "every": int(every) if every else 1,
+        "interval": (float(ms) / 1000) if ms else None,
+        "fsync": bool(config.get(FSYNC, False)),
+    }
+
+
+def element_key(element) -> str:
+    """The key that identifies an element in the journal: its query and id, or for elements without an id, its
+    string representation. Keys do not depend on the order of elements or on how they were split across workers, so
+    a journal can be resumed from after the element list has changed, or on a machine with a different core count.
+    """
+    _id = getattr(element, "id", None)
+    if _id is None:
+        return str(element)
+    query = getattr(element, "query", None)
+    return f"{query}/{_id}" if query is not None else str(_id)
+
+
+def journal_record(element) -> bytes:
+    return hashlib.md5(element_key(element).encode("utf-8")).digest()
+
+
+def read_journal(dbfile) -> set:
+    """Read a journal into a set of records, so that whether an element is done can be checked in constant time. A
+    journal that does not exist yet is an empty set. A torn record at the end of the file (from a run that was killed
+    mid-write) is ignored."""
+    if not os.path.exists(dbfile):
+        return set()
+    with open(dbfile, "rb") as f:
+        data = f.read()
+    end = len(data) - len(data) % RECORD_SIZE
+    return {data[i : i + RECORD_SIZE] for i in range(0, end, RECORD_SIZE)}
+
+
+def journal_run(dbfile, q, stats_q, every=1, interval=None, fsync=False, leases=None):
+    """Append done records from `q` to `dbfile` until a `None` sentinel is received.
+
+    The writer blocks on the queue rather than polling it. Once a record arrives, everything else already waiting
+    is drained with it, and pending records are committed together (a group commit) when `every` records are pending,
+    when `interval` seconds have passed since the oldest pending record arrived, or when the journal is closed. If
+    `fsync` is set, each commit is also synced to disk.
+
+    When the journal closes, a dict of counters is put on `stats_q`: the number of records and commits, the total and
+    maximum latency from a record being dequeued to it being committed, and the CPU time used by the writer.
+
+    In a sharded phase, each element is also published to the phase's `leases` (see lib/common/leases.py) once its
+    record is committed, so that other nodes know it is done.
+    """
+    cpu_start = time.process_time()
+    stats = {"records": 0, "commits": 0, "latency": 0.0, "max_latency": 0.0}
+    pending = []
+    oldest = None
+    closing = False
+
+    def commit(f):
+        if len(pending) == 0:
+            return
+        f.write(b"".join(pending))
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+        if leases is not None:
+            for record in pending:
+                leases.publish(record)
+        now = time.monotonic()
+        latency = now - oldest
+        stats["records"] += len(pending)
+        stats["commits"] += 1
+        stats["latency"] += latency * len(pending)
+        stats["max_latency"] = max(stats["max_latency"], latency)
+        pending.clear()
+
+    with open(dbfile, "ab") as f:
+        while not closing:
+            timeout = None
+            if interval is not None and len(pending) > 0:
+                timeout = max(0, interval - (time.monotonic() - oldest))
+            try:
+                batch = [q.get(timeout=timeout)]
+            except Empty:
+                batch = []
+            # drain whatever else has already been queued
+            while True:
+                try:
+                    batch.append(q.get_nowait())
+                except Empty:
+                    break
+
+            for record in batch:
+                if record is None:
+                    closing = True
+                    continue
+                if len(pending) == 0:
+                    oldest = time.monotonic()
+                pending.append(record)
+                if len(pending) >= every:
+                    commit(f)
+
+            if interval is not None and len(pending) > 0:
+                if time.monotonic() - oldest >= interval:
+                    commit(f)
+
+        commit(f)
+
+    stats["cpu"] = time.process_time() - cpu_start
+    stats_q.put(stats)
+
+
+def format_stats(stats: dict) -> str:
+    records = stats["records"]
+    mean = (stats["latency"] / records * 1000) if records > 0 else 0
+    return (
+        f"checkpoint journal: {records} records in {stats['commits']} commits, "
+        f"mean latency {mean:.2f}ms, max latency {stats['max_latency'] * 1000:.2f}ms, "
+        f"{stats['cpu']:.3f}s CPU"
+    )
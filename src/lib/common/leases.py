@@ -0,0 +1,232 @@
+"""
+Leases through which several mtriage processes, on one host or several, share the elements of a sharded phase.
+
+A phase's done markers are kept once it has finished, so that a process that runs it later skips its elements. Reset
+the sharded phases of a folder, so that they run afresh, with:
+    python -m lib.common.leases media/my_folder
+"""
+import os
+import sys
+import time
+import shutil
+import socket
+import threading
+from pathlib import Path
+
+# config keys for sharding a module's parallel phases across several mtriage processes that share a folder.
+SHARD = "shard"
+LEASE_TTL_S = "lease_ttl_s"
+# config key for the name of a node, which is its host's name by default.
+NODE = "node"
+
+DEFAULT_LEASE_TTL_S = 300
+# how often a node checks on the elements that other nodes hold, once it has claimed all that it can.
+POLL_S = 1.0
+# the folder in a storage's base dir that holds the lease dirs of sharded phases.
+LEASES_DIR = ".leases"
+
+# what became of an attempt to claim an element.
+CLAIMED = "claimed"
+HELD = "held"
+DONE = "done"
+
+
+def sharding_enabled(config) -> bool:
+    return bool(config.get(SHARD, False))
+
+
+def lease_ttl(config) -> float:
+    return float(config.get(LEASE_TTL_S, DEFAULT_LEASE_TTL_S))
+
+
+def node_id(config) -> str:
+    """Identifies a node across runs, unlike `node_name`: the 'node' in `config`, or else the host's name."""
+    return str(config.get(NODE) or socket.gethostname())
+
+
+def node_name() -> str:
+    """Identifies this process among all of the processes, on any host, that share a lease dir."""
+    return f"{socket.gethostname()}.{os.getpid()}"
+
+
+class LeaseDir:
+    """Claims on the elements of one phase, shared by every mtriage process that runs the phase over the same folder,
+    on one host or several that mount it over NFS. There is no coordinator: each element is claimed by creating its
+    lease file exclusively, and published as done by renaming a marker into place. Both are atomic on local
+    filesystems and on NFS, so only one process holds an element's lease at a time.
+
+    A process renews the leases it holds (see `LeaseKeeper`) until their elements are done. A lease that has not been
+    renewed for `ttl` seconds, say because its process died, has expired, and is reclaimed by the next process that
+    tries to claim its element. As expiry is judged from file times, the hosts' clocks should be kept in sync.
+
+    Each process joins the dir as a node when it starts the phase and leaves it when it has finished. The done markers
+    are kept after the last node has left, so that a node that starts the phase late skips the elements that are done,
+    until the dir is reset."""
+
+    def __init__(self, path, ttl=DEFAULT_LEASE_TTL_S, owner=None):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.owner = owner or node_name()
+        self.nodes = self.path / "nodes"
+
+    def lease_file(self, record: bytes) -> Path:
+        return self.path / f"{record.hex()}.lease"
+
+    def done_file(self, record: bytes) -> Path:
+        return self.path / f"{record.hex()}.done"
+
+    def join(self):
+        os.makedirs(self.nodes, exist_ok=True)
+        (self.nodes / self.owner).touch()
+
+    def leave(self):
+        try:
+            os.remove(self.nodes / self.owner)
+        except FileNotFoundError:
+            pass
+
+    def reset(self) -> bool:
+        """Remove the dir and its done markers, so that the next run of the phase starts afresh, unless a node is still
+        in it. Returns whether it was removed."""
+        try:
+            if self.nodes.exists() and len(os.listdir(self.nodes)) > 0:
+                return False
+            # NB: renamed first, so that a node that joins in the meantime starts a fresh dir rather than one that is
+            # half removed
+            trash = self.path.with_name(f"{self.path.name}.{self.owner}.removed")
+            os.rename(self.path, trash)
+        except FileNotFoundError:
+            return False
+        shutil.rmtree(trash, ignore_errors=True)
+        return True
+
+    def is_done(self, record: bytes) -> bool:
+        return self.done_file(record).exists()
+
+    def claim(self, record: bytes) -> str:
+        """Try to take the lease on an element: CLAIMED if this node now holds it, DONE if the element has been
+        published by any node, or HELD if another node holds an unexpired lease on it."""
+        lease = self.lease_file(record)
+        for _ in range(2):
+            if self.is_done(record):
+                return DONE
+            try:
+                fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if not self.__reclaim(lease):
+                    return HELD
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(self.owner)
+            # NB: the last holder publishes before it lets go of its lease, so it may have published in between
+            if self.is_done(record):
+                self.release(record)
+                return DONE
+            return CLAIMED
+        return HELD
+
+    def __reclaim(self, lease: Path) -> bool:
+        """Remove `lease` if it has expired, and return whether it is gone. Of the nodes that find it expired at
+        once, only the one whose rename succeeds removes it."""
+        try:
+            if time.time() - os.stat(lease).st_mtime < self.ttl:
+                return False
+            stale = lease.with_name(f"{lease.name}.{self.owner}.stale")
+            os.rename(lease, stale)
+        except FileNotFoundError:
+            # published or released by its holder, or reclaimed by another node, in the meantime
+            return True
+        if time.time() - os.stat(stale).st_mtime < self.ttl:
+            # NB: another node reclaimed it first, and the fresh lease it took was moved aside here. It is put back,
+            # unless a third node has taken the lease since.
+            try:
+                os.link(stale, lease)
+            except FileExistsError:
+                pass
+            os.remove(stale)
+            return False
+        os.remove(stale)
+        return True
+
+    def renew(self, records) -> list:
+        """Renew the leases on `records`, and return those that are no longer leased, as they have been published."""
+        gone = []
+        for record in records:
+            try:
+                os.utime(self.lease_file(record))
+            except FileNotFoundError:
+                gone.append(record)
+        return gone
+
+    def publish(self, record: bytes):
+        """Mark an element as done for every node, and let go of its lease."""
+        done = self.done_file(record)
+        tmp = done.with_name(f"{done.name}.{self.owner}.tmp")
+        with open(tmp, "w") as f:
+            f.write(self.owner)
+        os.rename(tmp, done)
+        self.release(record)
+
+    def release(self, record: bytes):
+        """Let go of the lease on an element, unless it has expired and been claimed by another node since."""
+        lease = self.lease_file(record)
+        try:
+            with open(lease, "r") as f:
+                if f.read() != self.owner:
+                    return
+            os.remove(lease)
+        except FileNotFoundError:
+            pass
+
+
+class LeaseKeeper:
+    """Renews the leases that a node holds from a background thread, every third of their time to live, until their
+    elements are published."""
+
+    def __init__(self, leases: LeaseDir):
+        self.leases = leases
+        self.held = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def add(self, record: bytes):
+        with self.lock:
+            self.held.add(record)
+
+    def __run(self):
+        while not self.stopped.wait(self.leases.ttl / 3):
+            with self.lock:
+                held = list(self.held)
+            gone = self.leases.renew(held)
+            with self.lock:
+                self.held.difference_update(gone)
+
+    def stop(self):
+        """Stop renewing, and release the leases of elements that were not published, such as those of a worker that
+        was killed, so that other nodes can claim them."""
+        self.stopped.set()
+        self.thread.join()
+        for record in self.held:
+            if not self.leases.is_done(record):
+                self.leases.release(record)
+        self.held = set()
+
+
+if __name__ == "__main__":
+    from lib.common.storage import LocalStorage
+
+    if len(sys.argv) != 2:
+        print(__doc__.strip())
+        sys.exit(1)
+    leases = LocalStorage(folder=sys.argv[1]).base_dir / LEASES_DIR
+    phases = (
+        sorted(p for p in leases.iterdir() if p.is_dir()) if leases.exists() else []
+    )
+    for path in phases:
+        reset = LeaseDir(path).reset()
+        print(f"{path.name}: {'reset' if reset else 'still running, kept'}")
+    print(f"{len(phases)} sharded phases")
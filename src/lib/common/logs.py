@@ -0,0 +1,192 @@
+"""
+The records that modules log, and the thread that writes them to a folder's logs.
+
+Each record is written twice: as a line of JSON to `logs/logs.jsonl`, with its level, module, phase, element and time,
+and rendered as text to `logs/logs.txt`, as mtriage has always written its logs. Records are written in a background
+thread, so that logging never waits on the disk, and a log file that grows past a size is compressed and rotated out.
+"""
+import os
+import sys
+import gzip
+import time
+import queue
+import atexit
+import shutil
+import threading
+from json.encoder import encode_basestring
+from typing import List, Tuple
+
+DEBUG = 10
+INFO = 20
+ERROR = 40
+LEVELS = {"debug": DEBUG, "info": INFO, "error": ERROR}
+LEVEL_NAMES = {v: k for k, v in LEVELS.items()}
+
+# config key, in a module's config, for the least level of record that is printed to the console.
+VERBOSITY = "verbosity"
+# config keys, at the top level of the YAML, for the size in MB past which a log file is rotated, and the number of
+# compressed files that are kept.
+LOG_MAX_MB = "log_max_mb"
+LOG_BACKUPS = "log_backups"
+DEFAULT_LOG_MAX_MB = 100
+DEFAULT_LOG_BACKUPS = 5
+
+TEXT_FILE = "logs.txt"
+JSONL_FILE = "logs.jsonl"
+SEPARATOR = "-" * 77
+
+
+def console_level(config: dict) -> int:
+    verbosity = config.get(VERBOSITY, "info")
+    return LEVELS[verbosity] if isinstance(verbosity, str) else int(verbosity)
+
+
+def record(msg: str, level=INFO, module=None, phase=None, element=None) -> dict:
+    return {
+        "ts": time.time(),
+        "level": LEVEL_NAMES.get(level, level),
+        "module": module,
+        "phase": phase,
+        "element": element,
+        "msg": msg,
+    }
+
+
+def as_record(r) -> dict:
+    # NB: a bare string, as `write_logs` has always taken, is a record with no context
+    return record(r) if isinstance(r, str) else r
+
+
+def context(r: dict) -> str:
+    parts = [r.get("module"), r.get("phase"), r.get("element")]
+    return "".join(f"{p}: " for p in parts if p is not None)
+
+
+def render_text(r: dict) -> List[str]:
+    """The lines of logs.txt for a record: its message after its context, and errors set apart."""
+    line = f"{context(r)}{r['msg']}"
+    if r.get("level") == "error":
+        return ["", SEPARATOR, f"ERROR: {line}", SEPARATOR, ""]
+    return [line]
+
+
+def encode(r: dict) -> str:
+    """A record as a line of logs.jsonl. Records have the same fields, which are written in order without
+    `json.dumps`, as that is several times slower and this is done for every line logged."""
+    s = lambda v: "null" if v is None else encode_basestring(str(v))
+    return (
+        f'{{"ts": {r["ts"]:.6f}, "level": {s(r["level"])}, "module": {s(r["module"])}, '
+        f'"phase": {s(r["phase"])}, "element": {s(r["element"])}, "msg": {s(r["msg"])}}}'
+    )
+
+
+def render(r: dict) -> Tuple[str, str]:
+    """A record as it is written to logs.txt and to logs.jsonl."""
+    return "\n".join(render_text(r)), encode(r)
+
+
+def render_console(r: dict) -> str:
+    line = f"{context(r)}{r['msg']}"
+    if r.get("level") == "error":
+        return f"\033[91mERROR: {line}\033[0m"
+    return line
+
+
+def rotate(path: str, backups: int):
+    """Compress the log file at `path` to `path.1.gz`, shifting older files along, and dropping the oldest."""
+    for idx in range(backups - 1, 0, -1):
+        if os.path.exists(f"{path}.{idx}.gz"):
+            os.replace(f"{path}.{idx}.gz", f"{path}.{idx + 1}.gz")
+    if backups > 0:
+        with open(path, "rb") as src, gzip.open(f"{path}.1.gz.tmp", "wb") as dest:
+            shutil.copyfileobj(src, dest)
+        os.replace(f"{path}.1.gz.tmp", f"{path}.1.gz")
+    os.remove(path)
+
+
+class LogWriter:
+    """Writes batches of records to a logs dir in a background thread. `write` only queues a batch, and `flush` waits
+    until every batch queued has been written. The batches queued while one is written are rendered and appended to
+    the files in one write, and a file that is then past `max_mb` is rotated (see `rotate`), so that a long run keeps
+    at most `backups` compressed files of its logs along with the current one."""
+
+    def __init__(
+        self, logs_dir, max_mb=DEFAULT_LOG_MAX_MB, backups=DEFAULT_LOG_BACKUPS
+    ):
+        self.logs_dir = str(logs_dir)
+        self.max_mb = max_mb
+        self.backups = backups
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # NB: the thread can't be pickled, nor used in a forked process, so each process starts its own
+        return {
+            "logs_dir": self.logs_dir,
+            "max_mb": self.max_mb,
+            "backups": self.backups,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(state["logs_dir"], state["max_mb"], state["backups"])
+
+    def __start(self):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.queue, self.pid = queue.Queue(), os.getpid()
+                self.thread = threading.Thread(target=self.__run, daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+        return self.queue
+
+    def write(self, records: List):
+        """Queue records, or strings, to be rendered and written."""
+        records = [r for r in records if r is not None]
+        if len(records) > 0:
+            self.__start().put((False, records))
+
+    def write_rendered(self, entries: List[Tuple[str, str]]):
+        """Queue records that were rendered elsewhere, such as in the workers of a parallel phase (see `render`)."""
+        if len(entries) > 0:
+            self.__start().put((True, entries))
+
+    def flush(self):
+        if self.pid == os.getpid():
+            self.queue.join()
+
+    def __run(self):
+        q = self.queue
+        while True:
+            batches = [q.get()]
+            while True:
+                try:
+                    batches.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.write_now(
+                    [
+                        e if rendered else render(as_record(e))
+                        for rendered, entries in batches
+                        for e in entries
+                    ]
+                )
+            except Exception as e:
+                # NB: logging must never take a run down with it
+                print(f"Could not write logs: {e}", file=sys.stderr)
+            for _ in batches:
+                q.task_done()
+
+    def write_now(self, entries: List[Tuple[str, str]]):
+        """Append rendered records to the log files, rotating any file that is then too large."""
+        text = "".join(f"{t}\n" for t, _ in entries)
+        jsonl = "".join(f"{j}\n" for _, j in entries)
+        for name, body in [(TEXT_FILE, text), (JSONL_FILE, jsonl)]:
+            path = os.path.join(self.logs_dir, name)
+            with open(path, "a") as f:
+                f.write(body)
+                size = f.tell()
+            if self.max_mb and size > self.max_mb * 1e6:
+                rotate(path, self.backups)
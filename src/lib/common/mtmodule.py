@@ -1,53 +1,122 @@
 from abc import ABC, abstractmethod
 import os
-import struct
+import copy
+import time
 import yaml
+import queue
+import socket
+import asyncio
+import threading
 import multiprocessing
 from functools import partial, wraps
+from contextlib import contextmanager
 from types import GeneratorType
 from typing import Generator
 from itertools import islice, chain
 from pathlib import Path
 
-from lib.common.util import hashdict, get_batch_size, batch
+from lib.common.util import hashdict
 from lib.common.exceptions import ImproperLoggedPhaseError
 from lib.common.util import MAX_CPUS
+from lib.common.journal import (
+    journal_run,
+    journal_policy,
+    journal_record,
+    read_journal,
+    format_stats,
+)
+from lib.common.scheduler import (
+    executor_for,
+    worker_limits,
+    worker_count,
+    chunk_size,
+    batch_size,
+    queue_size,
+    stream_chunks,
+    order_elements,
+    schedule_for,
+    SCHEDULE_LONGEST_FIRST,
+)
+from lib.common.executors import make_executor, PROCESSES, ASYNCIO
+from lib.common.leases import (
+    LeaseDir,
+    LeaseKeeper,
+    sharding_enabled,
+    lease_ttl,
+    node_id,
+    LEASES_DIR,
+    NODE,
+    POLL_S,
+    CLAIMED,
+    HELD,
+)
+from lib.common.workers import summary, DONE, format_stats as format_workers
+from lib.common.retries import RetryQueue, retry_policy, format_stats as format_retries
+from lib.common.writes import (
+    write_stats,
+    diff_stats,
+    add_stats,
+    format_stats as format_writes,
+)
+from lib.common.logs import (
+    record,
+    render_console,
+    console_level,
+    INFO,
+    ERROR,
+)
+from lib.common.timing import (
+    Timer,
+    timing_enabled,
+    add_counters,
+    format_event,
+    THREAD,
+    PROCESS,
+    PHASE,
+    WORKER,
+)
 
-TWO_INTS = "II"
 RET_VAL_TESTS_ONLY = "no error"
 CONFIG_PATH = "/run_args.yaml"
-
-
-def db_run(dbfile, q, batches_running):
-    with open(dbfile, "ab") as f:
-        while batches_running.value is not 0:
-            try:
-                done_info = q.get_nowait()
-                f.write(struct.pack("II", *done_info))
-                f.flush()
-            except:
-                pass
-        while q.qsize() > 0:
-            done_info = q.get()
-            f.write(struct.pack("II", *done_info))
-            f.flush()
-
-        f.close()
+# the number of log lines a worker buffers before appending them to its shard.
+LOG_SHARD_BUFFER = 256
 
 
 class MTModule(ABC):
     """Handles parallelisation and component-specific logging.  Invoked primarily through the @MTModule.phase decorator
     on a method, which parallelises based on the function signature."""
 
+    # the default executor for this module's parallel phases. Can be overridden by the 'executor' option in config.
+    executor = None
+
     def __init__(self, config, name, storage):
         self.config = config
         self.name = name
         self.disk = storage
         self.base_path = Path("/mtriage")
 
-        self.UNIQUE_ID = hashdict(config)
+        # NB: the nodes of a sharded phase are named apart, and share its leases all the same
+        self.UNIQUE_ID = hashdict({k: v for k, v in config.items() if k != NODE})
         self.PHASE_KEY = None
+        self.BATCHED = False
+        self.ATTEMPTS = {}
+        self.retry_queue = None
+        self.journal_stats = None
+        self.retry_stats = None
+        self.worker_stats = None
+        self.worker_limits = None
+        self.shard_stats = None
+        self.phase_event = None
+        self.worker_events = []
+        self.__DEFERRED = set()
         self.__LOGS = []
+        self.__EVENTS = []
+        self.__MANAGER = None
+        self.__SET_UP = False
+        self.__LOG_SHARD = None
+        # NB: elements are published whole, as other nodes may be reading the folder while they are written
+        if sharding_enabled(config):
+            self.disk.atomic_writes = True
 
     def get_full_config(self):
         with open(CONFIG_PATH, "r") as c:
@@ -65,84 +134,380 @@ class MTModule(ABC):
     def in_parallel(self, boolean):
         return boolean
 
-    def process_batch(self, innards, done_dict, done_queue, batch_num, c, other_args):
-        for idx, i in enumerate(c):
-            if idx not in done_dict:
-                innards(self, [i], *other_args)
-                done_queue.put((batch_num, idx))
-            else:
-                print("Batch %d item %d already done, skipping job." % (batch_num, idx))
+    def worker_copy(self, shard_prefix):
+        """A shallow copy of this module for a worker thread or task to use, with its own storage object and log
+        buffer, so that state set while processing an element (such as `disk.delete_local_on_write`) is not shared
+        between workers. Worker processes get their copy by forking."""
+        worker = copy.copy(self)
+        worker.disk = copy.copy(self.disk)
+        worker.start_worker(shard_prefix)
+        return worker
+
+    def start_worker(self, shard_prefix):
+        """Switch to buffering logs for a shard of the log that belongs to this worker alone."""
+        self.__LOGS = []
+        self.__EVENTS = []
+        self.__LOG_SHARD = shard_prefix
+
+    def batches_of(self, items):
+        """The groups in which a chunk of `(record, element, attempt)` items is passed to the phase's function: the
+        whole chunk at once in a batched phase, and otherwise one element at a time."""
+        if self.BATCHED:
+            return [items]
+        return [[item] for item in items]
+
+    def begin_batch(self, batch):
+        self.ATTEMPTS = {record: attempt for record, _, attempt in batch}
+        self.__DEFERRED = set()
+
+    def end_batch(self, batch, done_queue):
+        """Journal the elements in a batch that are done, leaving out those that are waiting to be retried."""
+        for record, _, _ in batch:
+            if record not in self.__DEFERRED:
+                done_queue.put(record)
+
+    def process_items(self, innards, items, done_queue, other_args):
+        for batch in self.batches_of(items):
+            self.begin_batch(batch)
+            innards(self, [i for _, i, _ in batch], *other_args)
+            self.end_batch(batch, done_queue)
+
+    def attempt_of(self, element) -> int:
+        """Which attempt at `element` this is, counting from 1."""
+        return self.ATTEMPTS.get(journal_record(element), 1)
+
+    def retry_later(self, element, after=None) -> bool:
+        """Send `element` back to the scheduler to be attempted again after a backoff delay (see
+        lib/common/retries.py), or after `after` seconds if that is longer, so that the worker can move on in the
+        meantime. Returns False if the element has already had all of its attempts."""
+        attempt = self.attempt_of(element)
+        if attempt >= retry_policy(self.config)["attempts"]:
+            return False
+        record = journal_record(element)
+        self.__DEFERRED.add(record)
+        self.retry_queue.put((record, element, attempt + 1, after))
+        return True
+
+    def __drain_retries(self, retries: RetryQueue, pool=None):
+        def push(item):
+            record, element, attempt, after = item
+            retries.push((record, element, attempt), after)
+
+        if pool is not None:
+            for item in pool.take_retries():
+                push(item)
+        while True:
+            try:
+                push(self.retry_queue.get_nowait())
+            except queue.Empty:
+                return
+
+    def process_queue(
+        self,
+        innards,
+        work_queue,
+        done_queue,
+        shard_prefix,
+        other_args,
+        limits=None,
+        recover=False,
+    ):
+        """Run in each worker process or thread. Takes the next chunk of elements from `work_queue` until it receives
+        `None`, so that a worker that finishes early goes on to the next chunk rather than sitting idle. A worker
+        process with `limits` stops early once it reaches one of them. A worker that can `recover` logs an exception
+        raised while processing a chunk and goes on to the next, so that only that chunk is lost, as it would be were
+        a worker process to die. Returns a summary of the worker.
+        """
+        self.start_worker(shard_prefix)
+        elements, exit = 0, DONE
+        writes = write_stats()
+        with self.timed(WORKER, WORKER) as timer:
+            while True:
+                items = work_queue.get()
+                if items is None:
+                    break
+                try:
+                    self.process_items(innards, items, done_queue, other_args)
+                except Exception as e:
+                    if not recover:
+                        raise e
+                    self.error_logger(
+                        f"Worker lost a chunk of {len(items)} elements: {e}"
+                    )
+                elements += len(items)
+                reached = limits.reached(elements) if limits is not None else None
+                if reached is not None:
+                    exit = reached
+                    break
+            worker = summary(elements, exit)
+            if timer is not None:
+                timer.args["elements"] = elements
+                timer.args["writes"] = diff_stats(write_stats(), writes)
+                if limits is not None:
+                    timer.args["peak_rss"] = worker["peak_rss"]
+        self.flush_logs()
+        return worker
+
+    async def close_loop(self):
+        """Called on the event loop that a phase's coroutines ran on, before the loop is closed, so that the module can
+        release what they kept open on it, such as connections."""
+        pass
 
-    def process_in_batches(self, args, process_element, remove_db=True):
+    def setup_worker(self):
+        """Called in a worker of the forkserver pool (see lib/common/workerpool.py) before it processes its first
+        chunk for this module, as the worker does not inherit any state that the module set up in the main process.
         """
-        Process elements in parallel using multiprocessing. Automatically applied to a phase that takes a single
-        Generator argument, `all_elements`.
+        pass
+
+    def run_pool_task(self, task: dict):
+        """Process a chunk sent to a worker of the forkserver pool, on the worker's own instance of this module, and
+        return the journal records of the elements that are done and the items that are to be retried."""
+        self.PHASE_KEY = task["phase"]
+        self.BATCHED = task["batched"]
+        for attr, value in task["shared"].items():
+            setattr(self, attr, value)
+        self.start_worker(task["shard_prefix"])
+        if not self.__SET_UP:
+            self.setup_worker()
+            self.__SET_UP = True
+        cls, name = task["innards"]
+        innards = getattr(cls, name).__wrapped__
+        done, self.retry_queue = queue.Queue(), queue.Queue()
+        writes = write_stats()
+        with self.timed(WORKER, WORKER) as timer:
+            self.process_items(innards, task["items"], done, task["args"])
+            if timer is not None:
+                timer.args["writes"] = diff_stats(write_stats(), writes)
+        self.flush_logs()
+        return list(done.queue), list(self.retry_queue.queue)
 
-        `all_elements` is split into a number of batches, depending on the available CPU power of the machine on which
-        mtriage is running. `process_element` is then run on each element in each batch, in parallel by number of
-        batches. The results are collected together and return as a single list of results.
+    def process_in_batches(
+        self, args, process_element, remove_db=True, executor=PROCESSES, batched=False
+    ):
+        """
+        Process elements in parallel. Automatically applied to a phase that takes a single Generator argument,
+        `all_elements`.
+
+        `all_elements` is streamed in small chunks (of 'chunk_size' elements, one by default) to an executor (see
+        lib/common/executors.py), which runs `process_element` on each element using serial, thread, process or
+        asyncio workers. Only a few chunks are queued at once however many elements there are, and workers are started
+        as the first chunks are queued. Each worker takes the next chunk as soon as it has finished the last. With the
+        'longest_first' schedule, all elements are read up front so that the largest can be queued first. In a
+        batched phase, each chunk is a batch of 'batch_size' elements, and `process_element` is called with the whole
+        batch at once.
+
+        With 'shard' set, the phase can be run by several mtriage processes over the same folder at once, on one host or
+        many. Each process only queues the elements that it claims a lease on (see lib/common/leases.py), and once it
+        has claimed all that it can, waits on the elements that others hold, reclaiming those whose leases expire.
         """
 
-        all_elements = list(args[0])
-        batch_size = get_batch_size(len(all_elements))
+        all_elements = args[0]
+        # NB: the schedule is checked before any element is read, so that an unknown one fails the phase at once
+        if schedule_for(self.config, self.PHASE_KEY) == SCHEDULE_LONGEST_FIRST:
+            all_elements = iter(
+                order_elements(list(all_elements), self.config, self.PHASE_KEY)
+            )
         other_args = args[1:]
-        # each chunk is a generator
-        cs = batch(all_elements, n=batch_size)
 
-        manager = multiprocessing.Manager()
+        # NB: the manager's server process is started once, and shared by all of the module's phases
+        if self.__MANAGER is None:
+            self.__MANAGER = multiprocessing.Manager()
+        manager = self.__MANAGER
 
-        # switch logs to multiprocess access list
-        self.__LOGS = manager.list()
+        # logs from before the phase are written first, as workers write theirs to shards
+        self.flush_logs()
+        shard_prefix = f"{self.UNIQUE_ID}.{socket.gethostname()}.{os.getpid()}"
         # NOTE: abstraction leak to getter/setter in analyser.py...
         self.dest_q = manager.Value("i", None)
-        done_queue = manager.Queue()
-        batches_running = manager.Value("i", 1)
+        done_queue = multiprocessing.Queue()
+        stats_queue = multiprocessing.Queue()
 
         dbfile = f"{self.disk.base_dir}/{self.UNIQUE_ID}.db"
-
-        done_dict = {}
-        try:
-            with open(dbfile, "rb") as f:
-                _bytes = f.read(8)  # 8 bytes = two unsiged ints
-                while _bytes:
-                    fst, snd = struct.unpack(TWO_INTS, _bytes)
-                    if fst not in done_dict:
-                        done_dict[fst] = {}
-                    done_dict[fst][snd] = 1
-                    _bytes = f.read(8)
-                f.close()
-        except:
-            pass
+        leases, keeper = None, None
+        if sharding_enabled(self.config):
+            leases = LeaseDir(
+                self.disk.base_dir / LEASES_DIR / f"{self.UNIQUE_ID}.{self.PHASE_KEY}",
+                ttl=lease_ttl(self.config),
+            )
+            leases.join()
+            keeper = LeaseKeeper(leases)
+            keeper.start()
+            # NB: each node keeps a journal of its own, as appends from several hosts to one file can interleave. It
+            # is named for the node rather than the process, so that a node that is run again resumes from it.
+            dbfile = f"{self.disk.base_dir}/{self.UNIQUE_ID}.{node_id(self.config)}.db"
+        done = read_journal(dbfile)
 
         db_process = multiprocessing.Process(
-            target=db_run, args=(dbfile, done_queue, batches_running)
+            target=journal_run,
+            args=(dbfile, done_queue, stats_queue),
+            kwargs={**journal_policy(self.config), "leases": leases},
         )
         db_process.start()
 
-        processes = []
-        for idx, c in enumerate(cs):
-            _done_dict = {}
-            if idx in done_dict:
-                _done_dict = done_dict[idx]
-            p = multiprocessing.Process(
-                target=self.process_batch,
-                args=(process_element, _done_dict, done_queue, idx, c, other_args),
+        self.BATCHED = batched
+        # NB: elements put on a multiprocessing queue only reach it once a feeder thread flushes them, so only
+        # worker processes, which flush when they exit, use one.
+        self.retry_queue = (
+            multiprocessing.Queue() if executor == PROCESSES else queue.Queue()
+        )
+        retries = RetryQueue(retry_policy(self.config))
+        self.worker_limits = worker_limits(self.config, self.PHASE_KEY)
+        summaries = []
+
+        def new_pool():
+            return make_executor(
+                executor,
+                self,
+                process_element,
+                done_queue,
+                shard_prefix,
+                other_args,
+                worker_count(self.config, self.PHASE_KEY, executor),
+                queue_size(self.config, self.PHASE_KEY, executor),
             )
-            p.start()
-            processes.append(p)
 
-        for p in processes:
-            p.join()
+        pool = new_pool()
+        skipped = 0
+        shard = {"claimed": 0, "elsewhere": 0, "waited": 0}
+        held = []
+        size = (
+            batch_size(self.config, self.PHASE_KEY)
+            if batched
+            else chunk_size(self.config, self.PHASE_KEY)
+        )
+
+        def claim(chunk):
+            nonlocal skipped
+            items = []
+            for i in chunk:
+                record = journal_record(i)
+                if record in done:
+                    skipped += 1
+                    continue
+                if leases is not None:
+                    claimed = leases.claim(record)
+                    if claimed == HELD:
+                        held.append(i)
+                        continue
+                    if claimed != CLAIMED:
+                        shard["elsewhere"] += 1
+                        continue
+                    keeper.add(record)
+                    shard["claimed"] += 1
+                items.append((record, i, 1))
+            return items
+
+        def submit_due():
+            # retries that have come due are queued between new elements
+            self.__drain_retries(retries, pool)
+            for due in stream_chunks(retries.pop_due(), size):
+                pool.submit(due)
+
+        for chunk in stream_chunks(all_elements, size):
+            items = claim(chunk)
+            if len(items) > 0:
+                pool.submit(items)
+            submit_due()
+
+        # elements that other nodes held are waited on, until they are published or their leases expire
+        shard["waited"] = len(held)
+        while len(held) > 0:
+            time.sleep(POLL_S)
+            waiting, held = held, []
+            for items in stream_chunks(claim(waiting), size):
+                pool.submit(items)
+            submit_due()
+
+        if skipped > 0:
+            self.__print(f"{skipped} elements already done in a previous run, skipped.")
+        pool.close()
+        summaries += pool.summaries
+
+        # once every element has had its first attempt, wait out the remaining retries. Elements retried in a round
+        # may fail again, which calls for another round.
+        self.__drain_retries(retries, pool)
+        while len(retries) > 0:
+            pool = new_pool()
+            while len(retries) > 0:
+                retries.wait()
+                for due in stream_chunks(retries.pop_due(), size):
+                    pool.submit(due)
+            pool.close()
+            summaries += pool.summaries
+            self.__drain_retries(retries, pool)
+
+        self.retry_stats = retries.stats()
+        self.__print(
+            f"{self.name}: {self.PHASE_KEY}: {format_retries(self.retry_stats)}"
+        )
+        self.worker_stats = summaries
+        if len(summaries) > 0:
+            self.__print(f"{self.name}: {self.PHASE_KEY}: {format_workers(summaries)}")
 
-        batches_running.value = 0
+        done_queue.put(None)
+        self.journal_stats = stats_queue.get()
         db_process.join()
+        self.__print(
+            f"{self.name}: {self.PHASE_KEY}: {format_stats(self.journal_stats)}"
+        )
+
+        if leases is not None:
+            keeper.stop()
+            leases.leave()
+            self.shard_stats = shard
+            self.__print(
+                f"{self.name}: {self.PHASE_KEY}: shard: {shard['claimed']} elements claimed, "
+                f"{shard['elsewhere']} done by other nodes, {shard['waited']} waited on"
+            )
 
         if remove_db:
-            os.remove(dbfile)
+            # NB: processes on one host share its journal, so another may have removed it already
+            try:
+                os.remove(dbfile)
+            except FileNotFoundError:
+                pass
 
-        self.flush_logs()
+        self.disk.merge_log_shards(shard_prefix)
+        # the time and bytes of worker processes count towards the phase's
+        self.worker_events = self.disk.merge_event_shards(
+            shard_prefix, keep=lambda e: e["cat"] == WORKER and e["pid"] != os.getpid()
+        )
         return RET_VAL_TESTS_ONLY
 
+    def process_serially(self, function, args):
+        """Apply a phase's function directly. Elements that the function sends back with `retry_later` are passed to
+        it again in rounds once they are due, as `process_in_batches` would retry them."""
+
+        async def run(args):
+            try:
+                return await function(self, *args)
+            finally:
+                await self.close_loop()
+
+        def call(args):
+            if asyncio.iscoroutinefunction(function):
+                return asyncio.run(run(args))
+            return function(self, *args)
+
+        self.retry_queue = queue.Queue()
+        self.ATTEMPTS = {}
+        retries = RetryQueue(retry_policy(self.config))
+        ret_val = call(args)
+        self.__drain_retries(retries)
+        while len(retries) > 0:
+            retries.wait()
+            due = retries.pop_due()
+            self.ATTEMPTS = {record: attempt for record, _, attempt in due}
+            call([[i for _, i, _ in due], *args[1:]])
+            self.__drain_retries(retries)
+        self.ATTEMPTS = {}
+        if retries.retries > 0:
+            self.retry_stats = retries.stats()
+            self.__print(
+                f"{self.name}: {self.PHASE_KEY}: {format_retries(self.retry_stats)}"
+            )
+        return ret_val
+
     @staticmethod
     def phase(phase_key: str, **kwargs):
         """
@@ -153,7 +518,14 @@ class MTModule(ABC):
 
         If the first argument to the decorator function is a generator, then the application of the function is
         deferred to `process_in_batches`. This can be disabled by explicitly setting 'is_parallel' to False in the
-        `options` argument.
+        `options` argument. The executor that runs the phase is, in order of precedence, the 'executor' option in the
+        module's config, the `executor` keyword argument to this decorator, the module's `executor` attribute, or
+        processes. A phase written as a coroutine always runs on the asyncio executor, or on an event loop of its own
+        when it is not run in parallel. With `batched=True`, the function is called with batches of 'batch_size'
+        elements rather than one element at a time when run in parallel, and should handle any number of elements.
+
+        The phase's wall time, CPU time and bytes read and written, including those of its worker processes, are
+        recorded as an event in the storage's event log and trace (see `timed`).
         """
 
         def decorator(function):
@@ -165,56 +537,141 @@ class MTModule(ABC):
                 if not isinstance(self, MTModule):
                     raise ImproperLoggedPhaseError(function.__name__)
 
-                if (
-                    self.in_parallel
-                    and (len(args) >= 1)
-                    and isinstance(args[0], GeneratorType)
-                ):
-                    _remove_db = kwargs.get("remove_db", True)
-                    ret_val = self.process_in_batches(
-                        args, function, remove_db=_remove_db
+                self.worker_events = []
+                writes = write_stats()
+                timer = Timer(
+                    phase_key, PHASE, scope=PROCESS, module=self.name, phase=phase_key
+                )
+                with timer:
+                    if (
+                        self.in_parallel
+                        and (len(args) >= 1)
+                        and isinstance(args[0], GeneratorType)
+                    ):
+                        _remove_db = kwargs.get("remove_db", True)
+                        _batched = kwargs.get("batched", False)
+                        if asyncio.iscoroutinefunction(function):
+                            _executor = ASYNCIO
+                        else:
+                            _executor = executor_for(
+                                self.config,
+                                phase_key,
+                                default=kwargs.get("executor") or self.executor,
+                            )
+                        ret_val = self.process_in_batches(
+                            args,
+                            function,
+                            remove_db=_remove_db,
+                            executor=_executor,
+                            batched=_batched,
+                        )
+
+                    else:
+                        ret_val = self.process_serially(function, args)
+
+                if timing_enabled(self.config):
+                    # NB: files written by worker threads are counted in this process, and those written by worker
+                    # processes in their events
+                    writes = diff_stats(write_stats(), writes)
+                    for e in self.worker_events:
+                        add_counters(timer.event, e)
+                        add_stats(writes, e.get("writes", {}))
+                    timer.event["writes"] = writes
+                    self.phase_event = timer.event
+                    self.record_event(timer.event)
+                    self.__print(
+                        f"{self.name}: {phase_key}: {format_event(timer.event)}"
                     )
-
-                else:
-                    ret_val = function(self, *args)
-
+                    if len(writes) > 0:
+                        self.__print(
+                            f"{self.name}: {phase_key}: {format_writes(writes)}"
+                        )
                 self.flush_logs()
+                # NB: the phase's logs are on disk when it returns, though they are written in the background
+                self.disk.flush_logs()
                 return ret_val
 
             return wrapper
 
         return decorator
 
+    @contextmanager
+    def timed(self, name, cat, scope=THREAD, counters=True, **args):
+        """Time the work done in the block, and record it as an event of the current phase: its wall time, and the
+        CPU time and bytes read and written of the thread (or with `scope=PROCESS`, the process) that runs it. See
+        lib/common/timing.py. Does nothing if 'timing' is false in config."""
+        if not timing_enabled(self.config):
+            yield None
+            return
+        timer = Timer(
+            name,
+            cat,
+            scope=scope,
+            counters=counters,
+            module=self.name,
+            phase=self.PHASE_KEY,
+            **args,
+        )
+        with timer:
+            yield timer
+        self.record_event(timer.event)
+
+    def record_event(self, event: dict):
+        self.__EVENTS.append(event)
+        if len(self.__EVENTS) >= LOG_SHARD_BUFFER:
+            self.__flush_events()
+
     def flush_logs(self):
+        self.__flush_events()
+        if self.__LOG_SHARD is not None:
+            return self.__flush_shard()
         self.disk.write_logs(self.__LOGS)
         self.__LOGS = []
 
-    def logger(self, msg, element=None):
-        context = self.__get_context(element)
-        msg = f"{context}{msg}"
-        self.__LOGS.append(msg)
-        print(msg)
+    def __shard_name(self):
+        # NB: one shard per thread, as worker copies may share a thread under asyncio
+        return f"{self.__LOG_SHARD}.{os.getpid()}.{threading.get_ident()}"
 
-    def error_logger(self, msg, element=None):
-        context = self.__get_context(element)
-        err_msg = f"ERROR: {context}{msg}"
-        self.__LOGS.append("")
-        self.__LOGS.append(
-            "-----------------------------------------------------------------------------"
-        )
-        self.__LOGS.append(err_msg)
-        self.__LOGS.append(
-            "-----------------------------------------------------------------------------"
+    def __flush_shard(self):
+        self.disk.write_log_shard(self.__shard_name(), self.__LOGS)
+        self.__LOGS = []
+
+    def __flush_events(self):
+        if self.__LOG_SHARD is not None:
+            self.disk.write_event_shard(self.__shard_name(), self.__EVENTS)
+        else:
+            self.disk.write_events(self.__EVENTS)
+        self.__EVENTS = []
+
+    def __log(self, r: dict):
+        if self.__LOG_SHARD is None:
+            self.__LOGS.append(r)
+            return
+        # in a worker, records are written with their time so that shards can be merged in order
+        self.__LOGS.append((r["ts"], r))
+        if len(self.__LOGS) >= LOG_SHARD_BUFFER:
+            self.__flush_shard()
+
+    def __print(self, msg, level=INFO):
+        if level >= console_level(self.config):
+            print(msg)
+
+    def logger(self, msg, element=None, level=INFO):
+        """Log `msg`, about `element` if given, as a record of the current phase (see lib/common/logs.py). Records
+        are all written to the logs, and printed if `level` is at least the module's 'verbosity'."""
+        r = record(
+            msg,
+            level=level,
+            module=self.name,
+            phase=self.PHASE_KEY,
+            element=element.id if element is not None else None,
         )
-        self.__LOGS.append("")
-        err_msg = f"\033[91m{err_msg}\033[0m"
-        print(err_msg)
-
-    def __get_context(self, element):
-        context = f"{self.name}: {self.PHASE_KEY}: "
-        if element != None:
-            context = context + f"{element.id}: "
-        return context
+        self.__log(r)
+        if level >= console_level(self.config):
+            print(render_console(r))
+
+    def error_logger(self, msg, element=None):
+        self.logger(msg, element=element, level=ERROR)
 
     def is_dev(self):
         return "dev" in self.config and self.config["dev"]
@@ -0,0 +1,88 @@
+import time
+import heapq
+import random
+
+# config keys that control how failed elements are retried.
+RETRY_ATTEMPTS = "retry_attempts"
+RETRY_DELAY_MS = "retry_delay_ms"
+RETRY_MAX_DELAY_MS = "retry_max_delay_ms"
+
+DEFAULT_ATTEMPTS = 5
+DEFAULT_DELAY_MS = 500
+DEFAULT_MAX_DELAY_MS = 60000
+
+
+def retry_policy(config) -> dict:
+    """How many times an element is attempted in all, and the delays in seconds before the first retry and the
+    longest delay between retries."""
+    return {
+        "attempts": int(config.get(RETRY_ATTEMPTS, DEFAULT_ATTEMPTS)),
+        "delay": float(config.get(RETRY_DELAY_MS, DEFAULT_DELAY_MS)) / 1000,
+        "max_delay": float(config.get(RETRY_MAX_DELAY_MS, DEFAULT_MAX_DELAY_MS)) / 1000,
+    }
+
+
+def backoff_delay(attempt: int, delay: float, max_delay: float, rand=random.random):
+    """The delay before an element's `attempt`th attempt (so 2 for its first retry). The delay doubles with each
+    attempt up to `max_delay`, and a random half of it is jittered away, so that elements that failed together (say,
+    from a rate limit) do not all come back at once."""
+    d = min(max_delay, delay * 2 ** (attempt - 2))
+    return d / 2 + rand() * d / 2
+
+
+class RetryQueue:
+    """Elements waiting to be retried, ordered by when they are due. Each entry is a `(record, element, attempt)`
+    item, as it is queued for workers. An element that was asked to wait `after` seconds, such as by a server's
+    Retry-After header, waits at least that long, up to the longest delay."""
+
+    def __init__(self, policy: dict):
+        self.policy = policy
+        self.heap = []
+        self.seq = 0
+        self.retries = 0
+        self.delay = 0.0
+        self.max_delay = 0.0
+        self.records = set()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, item, after=None):
+        record, _, attempt = item
+        delay = backoff_delay(attempt, self.policy["delay"], self.policy["max_delay"])
+        if after is not None:
+            delay = max(delay, min(after, self.policy["max_delay"]))
+        # NB: the sequence number keeps elements, which can't be compared, out of the ordering
+        heapq.heappush(self.heap, (time.monotonic() + delay, self.seq, item))
+        self.seq += 1
+        self.retries += 1
+        self.delay += delay
+        self.max_delay = max(self.max_delay, delay)
+        self.records.add(record)
+
+    def pop_due(self) -> list:
+        now = time.monotonic()
+        due = []
+        while len(self.heap) > 0 and self.heap[0][0] <= now:
+            due.append(heapq.heappop(self.heap)[2])
+        return due
+
+    def wait(self):
+        """Sleep until the next element is due."""
+        if len(self.heap) > 0:
+            time.sleep(max(0, self.heap[0][0] - time.monotonic()))
+
+    def stats(self) -> dict:
+        return {
+            "retries": self.retries,
+            "elements": len(self.records),
+            "delay": self.delay,
+            "max_delay": self.max_delay,
+        }
+
+
+def format_stats(stats: dict) -> str:
+    return (
+        f"retries: {stats['retries']} retries of {stats['elements']} elements, "
+        f"{stats['delay']:.2f}s total backoff, longest {stats['max_delay']:.2f}s"
+    )
@@ -0,0 +1,425 @@
+"""
+A Storage that keeps a folder's elements in an S3-compatible object store, such as S3 or MinIO, so that mtriage can run
+on machines that do not share a filesystem.
+"""
+import os
+import json
+import time
+import shutil
+import threading
+import boto3
+from botocore.config import Config
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, List, Tuple
+from lib.common.etypes import LazyLocalElement, LocalElement, LocalElementsIndex
+from lib.common.exceptions import InvalidStorageConfigError
+from lib.common.columnar import COLUMNAR, CSV, META_FILE
+from lib.common.storage import LocalStorage, STORAGE, LOCAL, S3
+from lib.common.blobs import BLOBS_DIR
+from lib.common.archives import INDEX_FILE
+
+# the connections that a process keeps open to the store, shared by all of its threads.
+MAX_CONNECTIONS = 32
+# files larger than this are uploaded and downloaded in parts of MULTIPART_CHUNK_MB, several at once.
+MULTIPART_THRESHOLD_MB = 16
+MULTIPART_CHUNK_MB = 16
+# the keys asked for in each request when listing a stage. S3 returns at most 1000.
+LIST_PAGE_SIZE = 1000
+# the elements that are downloaded ahead of the one that is handed to a worker.
+PREFETCH = 8
+# the dir in the local folder that records which elements have been downloaded, and as what.
+FETCHED_DIR = ".fetched"
+# the seconds that a process waits on another that is downloading the same element, before it downloads it itself.
+FETCH_WAIT_S = 300
+
+
+class Connections:
+    """A process's client of the store, the transfer manager that uploads and downloads files over its connections,
+    and the threads that prefetch elements. They are shared by every storage and element in the process with the
+    same options (see `connections`), as none of them can be pickled, or used in a forked process."""
+
+    def __init__(self, options: dict):
+        self.client = boto3.session.Session().client(
+            "s3",
+            endpoint_url=options["endpoint_url"],
+            region_name=options["region"],
+            config=Config(
+                max_pool_connections=options["max_connections"],
+                retries={"max_attempts": 5, "mode": "standard"},
+            ),
+        )
+        mb = 1 << 20
+        self.transfers = create_transfer_manager(
+            self.client,
+            TransferConfig(
+                multipart_threshold=options["multipart_threshold_mb"] * mb,
+                multipart_chunksize=options["multipart_chunk_mb"] * mb,
+                max_concurrency=options["max_connections"],
+            ),
+        )
+        self.pool = ThreadPoolExecutor(max(1, options["prefetch"]))
+        # the downloads of elements under way in this process, by their marker
+        self.fetches = {}
+        self.lock = threading.Lock()
+
+
+# the connections of this process, by their options.
+CONNECTIONS = {}
+CONNECTIONS_LOCK = threading.Lock()
+
+
+def connections(options: dict) -> Connections:
+    key = (os.getpid(), tuple(sorted(options.items())))
+    with CONNECTIONS_LOCK:
+        if key not in CONNECTIONS:
+            CONNECTIONS[key] = Connections(options)
+        return CONNECTIONS[key]
+
+
+class RemoteElement(LazyLocalElement):
+    """An element in the store, whose files are downloaded to its dir in the local folder when its `paths` or `et`
+    are first used, unless they have been already. `size` is the total size of its files, as listed."""
+
+    def __init__(self, id=None, query=None, el_dir=None, objects=None, storage=None):
+        super().__init__(id=id, query=query, el_dir=el_dir)
+        self.objects = objects or []
+        self.size = sum(o["Size"] for o in self.objects)
+        self.storage = storage
+
+    def list_files(self):
+        self.storage.fetch(self)
+        return super().list_files()
+
+
+class Prefetching(list):
+    """The elements read from the store, which are downloaded in the background, `ahead` at a time beyond the one
+    that is being handed out, as they are iterated over. As a phase hands elements to its workers a few chunks ahead
+    of them, most elements are on local disk by the time a worker uses them."""
+
+    def __init__(self, elements: List[RemoteElement], storage, ahead=PREFETCH):
+        super().__init__(elements)
+        self.storage = storage
+        self.ahead = ahead
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            # NB: the window ahead is filled at first, and then one more element is started for each handed out
+            start = idx + self.ahead if idx > 0 else 0
+            for nxt in range(start, min(idx + self.ahead + 1, len(self))):
+                self.storage.prefetch(self[nxt])
+            yield self[idx]
+
+
+class S3Storage(LocalStorage):
+    """Keeps the elements, element indexes and batch metadata of a folder as objects in a bucket, under `prefix`
+    (the folder's name by default) with the same layout as a LocalStorage folder. The local folder is kept as a cache:
+    elements are written to it as a LocalStorage would, and then uploaded, and elements that are read are downloaded
+    to it, once. Logs, timing events, journals and staging dirs are kept in the local folder alone.
+
+    Files are uploaded and downloaded several at once, and those larger than `multipart_threshold_mb` in parts, over
+    the `max_connections` of each process. Stages are listed `list_page_size` keys to a request, so that reading the
+    elements of a stage costs one request per page rather than one per element."""
+
+    def __init__(
+        self,
+        folder=None,
+        bucket=None,
+        prefix=None,
+        endpoint_url=None,
+        region=None,
+        max_connections=MAX_CONNECTIONS,
+        multipart_threshold_mb=MULTIPART_THRESHOLD_MB,
+        multipart_chunk_mb=MULTIPART_CHUNK_MB,
+        list_page_size=LIST_PAGE_SIZE,
+        prefetch=PREFETCH,
+        **kwargs,
+    ):
+        if bucket is None:
+            raise InvalidStorageConfigError(f"an '{S3}' storage needs a 'bucket'")
+        # NB: the catalog indexes the local folder, which only holds the elements that this node has seen
+        kwargs["catalog"] = False
+        super().__init__(folder=folder, **kwargs)
+        self.bucket = bucket
+        self.prefix = (folder if prefix is None else prefix).strip("/")
+        self.list_page_size = list_page_size
+        self.prefetch_ahead = prefetch
+        self.options = {
+            "endpoint_url": endpoint_url,
+            "region": region,
+            "max_connections": max_connections,
+            "multipart_threshold_mb": multipart_threshold_mb,
+            "multipart_chunk_mb": multipart_chunk_mb,
+            "prefetch": prefetch,
+        }
+
+    @property
+    def s3(self) -> Connections:
+        return connections(self.options)
+
+    def key(self, path) -> str:
+        """The key of the object for a path in the local folder."""
+        rel = Path(path).relative_to(self.base_dir).as_posix()
+        return f"{self.prefix}/{rel}" if self.prefix else rel
+
+    def local_path(self, key: str) -> Path:
+        return self.base_dir / (key[len(self.prefix) + 1 :] if self.prefix else key)
+
+    def list_objects(self, path, delimiter=None) -> Iterable[dict]:
+        """The objects under a path in the local folder, and with a `delimiter`, the prefixes of those below the next
+        level as dicts with only a 'Prefix', a page at a time."""
+        paginator = self.s3.client.get_paginator("list_objects_v2")
+        pages = paginator.paginate(
+            Bucket=self.bucket,
+            Prefix=f"{self.key(path)}/",
+            PaginationConfig={"PageSize": self.list_page_size},
+            **({"Delimiter": delimiter} if delimiter is not None else {}),
+        )
+        for page in pages:
+            yield from page.get("CommonPrefixes", [])
+            yield from page.get("Contents", [])
+
+    def exists(self, path) -> bool:
+        key = self.key(path)
+        res = self.s3.client.list_objects_v2(Bucket=self.bucket, Prefix=key, MaxKeys=1)
+        return any(o["Key"] == key for o in res.get("Contents", []))
+
+    def upload(self, paths: List[Path]):
+        futures = [
+            self.s3.transfers.upload(str(p), self.bucket, self.key(p)) for p in paths
+        ]
+        for f in futures:
+            f.result()
+
+    def download(self, keys: List[str]):
+        futures = []
+        for key in keys:
+            dest = self.local_path(key)
+            os.makedirs(dest.parent, exist_ok=True)
+            # NB: the transfer manager writes to a temporary file and renames it into place
+            futures.append(self.s3.transfers.download(self.bucket, key, str(dest)))
+        for f in futures:
+            f.result()
+
+    def delete(self, keys: List[str]):
+        keys = list(keys)
+        for idx in range(0, len(keys), 1000):
+            self.s3.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": k} for k in keys[idx : idx + 1000]]},
+            )
+
+    def __sync(self, path: Path, local: List[Path]):
+        """Upload the files `local` under `path`, remove any other objects under it, and return what is there."""
+        self.upload(local)
+        keys = set(self.key(p) for p in local)
+        objects = [o for o in self.list_objects(path) if "Key" in o]
+        self.delete(o["Key"] for o in objects if o["Key"] not in keys)
+        return [o for o in objects if o["Key"] in keys]
+
+    # element indexes
+
+    def elements_index_format(self, q: str):
+        dest = self.read_query(q)
+        if self.exists(dest / self.ELEMENTS_INDEX_COLUMNS / META_FILE):
+            return COLUMNAR
+        if self.exists(dest / self.ELEMENTS_INDEX_FILE):
+            return CSV
+        return None
+
+    def read_elements_index(self, q: str, columns=None) -> LocalElementsIndex:
+        """Download the element index of `q`, or with `columns`, only the files of those columns, and read it."""
+        dest = self.read_query(q)
+        fmt = self.elements_index_format(q)
+        if fmt == COLUMNAR:
+            cols = dest / self.ELEMENTS_INDEX_COLUMNS
+            if cols.exists():
+                shutil.rmtree(cols)
+            self.download([self.key(cols / META_FILE)])
+            keys = [o["Key"] for o in self.list_objects(cols)]
+            keys = [k for k in keys if not k.endswith(f"/{META_FILE}")]
+            if columns is not None:
+                with open(cols / META_FILE, "r") as f:
+                    names = json.load(f)["columns"]
+                # NB: the files of a column are named '<group>.<column>.<part>.npy'
+                wanted = set(str(idx) for idx, c in enumerate(names) if c in columns)
+                keys = [k for k in keys if k.split("/")[-1].split(".")[1] in wanted]
+            self.download(keys)
+        elif fmt == CSV:
+            self.download([self.key(dest / self.ELEMENTS_INDEX_FILE)])
+        return super().read_elements_index(q, columns)
+
+    def write_elements_index(self, q: str, eidx: LocalElementsIndex):
+        super().write_elements_index(q, eidx)
+        dest = self.read_query(q)
+        cols = dest / self.ELEMENTS_INDEX_COLUMNS
+        self.upload([dest / self.ELEMENTS_INDEX_FILE])
+        if self.index_format == COLUMNAR:
+            # NB: the meta file is uploaded last, as an index is only read once it is there
+            self.__sync(cols, [p for p in cols.iterdir() if p.name != META_FILE])
+            self.upload([cols / META_FILE])
+        else:
+            self.delete(o["Key"] for o in self.list_objects(cols))
+
+    # elements
+
+    def write_element(self, q: str, element: LocalElement) -> bool:
+        """Write an element to the local folder, as a LocalStorage would, and then upload its files, replacing those
+        of any element with its id that is already in the store."""
+        super().write_element(q, element)
+        el_dir = self.read_query(q) / element.id
+        names = set(Path(p).name for p in element.paths)
+        if (el_dir / INDEX_FILE).exists():
+            # NB: an archived element's dir is written whole, with its shards rather than the files in them
+            names = set(f.name for f in el_dir.iterdir())
+        for f in list(el_dir.iterdir()):
+            # NB: files of an earlier write of the element that this one does not have
+            if f.name not in names:
+                shutil.rmtree(f) if f.is_dir() else os.remove(f)
+        objects = self.__sync(el_dir, [el_dir / n for n in sorted(names)])
+        # NB: the element is as it is in the store, so it need not be downloaded to be read on this node
+        self.__mark(q, element.id, objects)
+        return True
+
+    def remove_element(self, q: str, id: str):
+        super().remove_element(q, id)
+        el_dir = self.read_query(q) / id
+        self.delete(o["Key"] for o in self.list_objects(el_dir))
+        marker = self.__marker(q, id)
+        if marker.exists():
+            os.remove(marker)
+
+    def write_meta(self, q: str, meta: dict):
+        super().write_meta(q, meta)
+        self.upload([self.read_query(q) / self.META_FILE])
+
+    def read_elements(self, qs: List[str]) -> List[LocalElement]:
+        """The elements of the stages `qs`, listed from the store, whose files are downloaded as they are used. The
+        returned list prefetches them as it is iterated over (see `Prefetching`)."""
+        els = []
+        for q in qs:
+            stage_dir = self.read_query(q)
+            by_id = {}
+            for o in self.list_objects(stage_dir):
+                rel = self.local_path(o["Key"]).relative_to(stage_dir)
+                if len(rel.parts) > 1 and not rel.parts[0].startswith("."):
+                    by_id.setdefault(rel.parts[0], []).append(o)
+            for el_id, objects in by_id.items():
+                els.append(
+                    RemoteElement(
+                        id=el_id,
+                        query=q,
+                        el_dir=stage_dir / el_id,
+                        objects=objects,
+                        storage=self,
+                    )
+                )
+        return Prefetching(els, self, self.prefetch_ahead)
+
+    def element_ids(self, q: str, stage_dir: Path) -> List[str]:
+        return [
+            Path(o["Prefix"]).name
+            for o in self.list_objects(stage_dir, delimiter="/")
+            if "Prefix" in o and not Path(o["Prefix"]).name.startswith(".")
+        ]
+
+    def stages(self) -> Iterable[Tuple[str, Path]]:
+        root = self.s3.client.get_paginator("list_objects_v2").paginate(
+            Bucket=self.bucket,
+            Prefix=f"{self.prefix}/" if self.prefix else "",
+            Delimiter="/",
+        )
+        selectors = sorted(
+            Path(p["Prefix"]).name
+            for page in root
+            for p in page.get("CommonPrefixes", [])
+        )
+        for selector in selectors:
+            if selector in ["logs", BLOBS_DIR] or selector.startswith("."):
+                continue
+            data_dir = self.base_dir / selector / self.RETRIEVED_EXT
+            if next(iter(self.list_objects(data_dir, delimiter="/")), None):
+                yield selector, data_dir
+            derived_dir = self.base_dir / selector / self.ANALYSED_EXT
+            for p in self.list_objects(derived_dir, delimiter="/"):
+                if "Prefix" in p:
+                    analyser = Path(p["Prefix"]).name
+                    yield f"{selector}/{analyser}", derived_dir / analyser
+
+    # downloads
+
+    def __marker(self, q: str, element_id: str) -> Path:
+        return self.base_dir / FETCHED_DIR / f"{q.replace('/', '.')}.{element_id}"
+
+    def __mark(self, q: str, element_id: str, objects: List[dict]):
+        marker = self.__marker(q, element_id)
+        os.makedirs(marker.parent, exist_ok=True)
+        tmp = marker.with_name(f".{marker.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            f.write(version(objects))
+        os.replace(tmp, marker)
+
+    def __is_fetched(self, element: RemoteElement) -> bool:
+        marker = self.__marker(element.query, element.id)
+        try:
+            with open(marker, "r") as f:
+                return f.read() == version(element.objects)
+        except FileNotFoundError:
+            return False
+
+    def prefetch(self, element: RemoteElement):
+        """Start to download an element in the background, unless it is already on local disk."""
+        if isinstance(element, RemoteElement) and not self.__is_fetched(element):
+            self.__fetch_future(element)
+
+    def fetch(self, element: RemoteElement):
+        """Download an element to the local folder, unless it is there already, and wait until it is."""
+        if not self.__is_fetched(element):
+            self.__fetch_future(element).result()
+
+    def __fetch_future(self, element: RemoteElement):
+        marker = self.__marker(element.query, element.id)
+        with self.s3.lock:
+            future = self.s3.fetches.get(marker)
+            if future is None or (future.done() and not self.__is_fetched(element)):
+                future = self.s3.pool.submit(self.__download_element, element)
+                self.s3.fetches[marker] = future
+        return future
+
+    def __download_element(self, element: RemoteElement):
+        """Download an element's files, unless another process is doing so already, in which case wait on it."""
+        marker = self.__marker(element.query, element.id)
+        os.makedirs(marker.parent, exist_ok=True)
+        lock = marker.with_name(f".{marker.name}.lock")
+        while True:
+            if self.__is_fetched(element):
+                return
+            try:
+                os.close(os.open(lock, os.O_CREAT | os.O_EXCL))
+                break
+            except FileExistsError:
+                pass
+            try:
+                waited = time.time() - os.path.getmtime(lock)
+            except FileNotFoundError:
+                # NB: the other process has finished in the meantime, and either fetched the element or gave up
+                continue
+            if waited >= FETCH_WAIT_S:
+                # NB: the other process died, or is stuck
+                break
+            time.sleep(0.05)
+        try:
+            # NB: files that the element no longer has in the store are not left in its dir
+            if element.el_dir.exists():
+                shutil.rmtree(element.el_dir)
+            self.download([o["Key"] for o in element.objects])
+            self.__mark(element.query, element.id, element.objects)
+        finally:
+            if os.path.exists(lock):
+                os.remove(lock)
+
+
+def version(objects: List[dict]) -> str:
+    """What an element's files in the store are, as a marker of the version of it that has been downloaded."""
+    return "\n".join(sorted(f"{o['Key']} {o['ETag']}" for o in objects))
@@ -0,0 +1,137 @@
+from pathlib import Path
+from itertools import islice
+from lib.common.util import MAX_CPUS
+from lib.common.archives import file_size
+from lib.common.exceptions import InvalidSchedulerConfigError
+from lib.common.executors import EXECUTORS, PROCESSES, FORKSERVER
+from lib.common.workers import WorkerLimits
+
+# config keys that control how elements are scheduled across workers.
+EXECUTOR = "executor"
+WORKERS = "workers"
+CHUNK_SIZE = "chunk_size"
+QUEUE_SIZE = "queue_size"
+BATCH_SIZE = "batch_size"
+SCHEDULE = "schedule"
+WORKER_MAX_ELEMENTS = "worker_max_elements"
+WORKER_MAX_RSS_MB = "worker_max_rss_mb"
+
+SCHEDULE_IN_ORDER = "in_order"
+SCHEDULE_LONGEST_FIRST = "longest_first"
+SCHEDULES = [SCHEDULE_IN_ORDER, SCHEDULE_LONGEST_FIRST]
+
+# the default number of workers for executors that wait on I/O rather than CPU.
+IO_WORKERS = 32
+# the default number of elements passed at once to a batched phase.
+DEFAULT_BATCH_SIZE = 16
+
+
+def phase_option(config: dict, key: str, phase_key: str = None):
+    """Scheduling options can either be set once for all of a module's phases, or per phase with a dict keyed by
+    the phase, e.g. `executor: {retrieve: threads}`."""
+    val = config.get(key)
+    if isinstance(val, dict):
+        return val.get(phase_key)
+    return val
+
+
+def executor_for(config: dict, phase_key: str = None, default: str = None) -> str:
+    """The executor to run a parallel phase with. The 'executor' option in a module's config takes precedence over
+    the `default` set in code, and the fallback is to use processes."""
+    executor = phase_option(config, EXECUTOR, phase_key) or default or PROCESSES
+    if executor not in EXECUTORS:
+        raise InvalidSchedulerConfigError(
+            f"the executor '{executor}' is not one of {EXECUTORS}"
+        )
+    return executor
+
+
+def schedule_for(config: dict, phase_key: str = None) -> str:
+    """The order in which a parallel phase queues its elements, 'in_order' unless the 'schedule' option says
+    otherwise (see `order_elements`)."""
+    schedule = phase_option(config, SCHEDULE, phase_key) or SCHEDULE_IN_ORDER
+    if schedule not in SCHEDULES:
+        raise InvalidSchedulerConfigError(
+            f"the schedule '{schedule}' is not one of {SCHEDULES}"
+        )
+    return schedule
+
+
+def worker_count(config: dict, phase_key: str = None, executor=PROCESSES) -> int:
+    """The number of workers to run a parallel phase with. By default, this is one process per CPU, or `IO_WORKERS`
+    for threads and asyncio."""
+    workers = phase_option(config, WORKERS, phase_key)
+    if workers:
+        return int(workers)
+    return MAX_CPUS + 1 if executor in [PROCESSES, FORKSERVER] else IO_WORKERS
+
+
+def chunk_size(config: dict, phase_key: str = None) -> int:
+    """The number of elements a worker takes from the work queue at a time. Small chunks balance load best; larger
+    chunks cut down on queue traffic when there are very many cheap elements."""
+    size = phase_option(config, CHUNK_SIZE, phase_key)
+    return max(1, int(size)) if size else 1
+
+
+def batch_size(config: dict, phase_key: str = None) -> int:
+    """The number of elements a batched phase is called with at once, such as the elements passed to
+    `Analyser.analyse_batch`. In a parallel phase, a batch is also the chunk that a worker takes from the queue."""
+    size = phase_option(config, BATCH_SIZE, phase_key)
+    return max(1, int(size)) if size else DEFAULT_BATCH_SIZE
+
+
+def queue_size(config: dict, phase_key: str = None, executor=PROCESSES) -> int:
+    """The number of chunks that can wait on the work queue before the dispatcher blocks. Defaults to two per
+    worker, which is enough to keep every worker busy without reading far ahead of them.
+    """
+    size = phase_option(config, QUEUE_SIZE, phase_key)
+    return max(1, int(size)) if size else 2 * worker_count(config, phase_key, executor)
+
+
+def worker_limits(config: dict, phase_key: str = None) -> WorkerLimits:
+    """The number of elements a worker process takes on, and the resident memory in megabytes it can reach, before it
+    is replaced by a fresh process. Neither is limited by default."""
+    return WorkerLimits(
+        elements=phase_option(config, WORKER_MAX_ELEMENTS, phase_key),
+        rss_mb=phase_option(config, WORKER_MAX_RSS_MB, phase_key),
+    )
+
+
+def stream_chunks(elements, size: int):
+    """Lazily split an iterable of elements into lists of `size` elements."""
+    it = iter(elements)
+    while True:
+        chunk = list(islice(it, size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+def element_size(element) -> int:
+    """The total size in bytes of the files in an element's `paths`, used as an estimate of how long the element
+    will take to process. Elements without paths, such as the rows of an element index, have size 0.
+    """
+    # NB: elements in an object store know their size from the listing, without being downloaded
+    if isinstance(getattr(element, "size", None), int):
+        return element.size
+    paths = getattr(element, "paths", None)
+    if paths is None:
+        return 0
+    if isinstance(paths, (str, Path)):
+        paths = [paths]
+    size = 0
+    for p in paths:
+        try:
+            size += file_size(p)
+        except OSError:
+            pass
+    return size
+
+
+def order_elements(elements: list, config: dict, phase_key: str = None) -> list:
+    """Order elements for the work queue according to the 'schedule' option. 'in_order' (the default) keeps the
+    order in which the elements were given. 'longest_first' sorts them by `element_size`, largest first, so that the
+    longest jobs do not start last and hold up the end of the phase."""
+    if schedule_for(config, phase_key) == SCHEDULE_LONGEST_FIRST:
+        return sorted(elements, key=element_size, reverse=True)
+    return elements
@@ -1,9 +1,11 @@
 import os
 import csv
 import shutil
+import asyncio
 from abc import abstractmethod
 from typing import Dict, Generator, Union, List
 from types import SimpleNamespace
+from pathlib import Path
 from lib.common.mtmodule import MTModule
 from lib.common.exceptions import (
     InvalidElementIndex,
@@ -14,18 +16,35 @@ from lib.common.exceptions import (
 from lib.common.etypes import LocalElement, LocalElementsIndex
 from lib.common.storage import Storage, LocalStorage
 from lib.common.util import MAX_CPUS
+from lib.common.downloads import DownloadPool, download, per_host_limit
+from lib.common.timing import ELEMENT
 
 
 class Selector(MTModule):
     """A Selector implements the indexing and retrieving of media for a platform or otherwise distinct space.
 
-    'index' and 'retrieve_element' are abstract methods that need to be defined on selectors. Other attributes and
-    methods in the class should not have to be explicitly referenced by selectors, as all data necessary is passed in
-    the arguments of exposed methods.
+    'index' is an abstract method that needs to be defined on selectors, as does exactly one of 'retrieve_element' or
+    'retrieve_element_async'. Other attributes and methods in the class should not have to be explicitly referenced by
+    selectors, as all data necessary is passed in the arguments of exposed methods.
     """
 
+    # the columns of the element index that `retrieve_element` uses, so that only those are read, or None for all
+    index_columns = None
+
     def __init__(self, config, module, storage):
+        # NB: checked here rather than with `abstractmethod`, as either of the two methods will do
+        retrieves = [
+            name
+            for name in ["retrieve_element", "retrieve_element_async"]
+            if getattr(type(self), name) is not getattr(Selector, name)
+        ]
+        if len(retrieves) != 1:
+            raise TypeError(
+                f"Can't instantiate selector {type(self).__name__}, which must implement exactly one of "
+                f"'retrieve_element' and 'retrieve_element_async', not {retrieves}"
+            )
         super().__init__(config, module, storage=storage)
+        self.hosts = None
 
     @abstractmethod
     def index(self, config) -> LocalElementsIndex:
@@ -41,13 +60,33 @@ class Selector(MTModule):
         """
         raise NotImplementedError
 
-    @abstractmethod
     def retrieve_element(self, row: SimpleNamespace, config) -> LocalElement:
         """Retrieve takes a single row from LocalElementsIndex as an argument, which was produced by the 'index'
         method. Data that has already been retrieved will not be retrieved again. The method should return
         a LocalElement, which mtriage will then persist to an instance of `Storage`."""
         raise NotImplementedError
 
+    async def retrieve_element_async(
+        self, row: SimpleNamespace, config
+    ) -> LocalElement:
+        """Optionally implemented by child instead of 'retrieve_element', for selectors that spend most of their time
+        downloading. Elements are then retrieved concurrently on an asyncio event loop, at most 'workers' at once.
+        Media should be fetched with `self.download`, which limits the requests in flight to any one host."""
+        raise NotImplementedError
+
+    @property
+    def retrieves_async(self):
+        return type(self).retrieve_element_async is not Selector.retrieve_element_async
+
+    async def download(self, url: str, path) -> int:
+        """Download `url` to `path` from `retrieve_element_async`, with at most 'per_host' downloads from the same
+        host in flight at once. Returns the number of bytes written."""
+        return await download(url, path, self.hosts)
+
+    async def close_loop(self):
+        if self.hosts is not None:
+            await self.hosts.close()
+
     # optionally implemented by child
     # both ELEMENT_DIR and config are implicitly available on self, but passed explicitily for convenience
     def pre_retrieve(self, config: Dict):
@@ -68,13 +107,19 @@ class Selector(MTModule):
         )
 
         self.__pre_retrieve()
-        elements = self.disk.read_elements_index(self.name).rows
+        elements = self.disk.read_elements_index(
+            self.name, columns=self.index_columns
+        ).rows
         if not self.in_parallel:
             try:
                 elements = [e for e in elements]
             except:
                 raise InvalidElementIndex()
-        self.__retrieve(elements)
+        if self.retrieves_async:
+            self.hosts = DownloadPool(per_host_limit(self.config))
+            self.__retrieve_async(elements)
+        else:
+            self.__retrieve(elements)
         self.__post_retrieve()
         self.disk.write_meta(
             self.name,
@@ -92,37 +137,72 @@ class Selector(MTModule):
     @MTModule.phase("retrieve")
     def __retrieve(self, element_indices: Union[List, Generator]):
         for element_index in element_indices:
-            self.__attempt_retrieve(5, element_index)
+            self.__attempt_retrieve(element_index)
+            self.disk.delete_local_on_write = False
+
+    @MTModule.phase("retrieve")
+    async def __retrieve_async(self, element_indices: Union[List, Generator]):
+        for element_index in element_indices:
+            await self.__attempt_retrieve_async(element_index)
             self.disk.delete_local_on_write = False
 
     @MTModule.phase("post-retrieve")
     def __post_retrieve(self):
         self.post_retrieve(self.config)
 
-    def __attempt_retrieve(self, attempts, element_index):
-        try:
-            new_element = self.retrieve_element(element_index, self.config)
-            if new_element is None:
-                return
-            success = self.disk.write_element(self.name, new_element)
-            if not success:
-                raise ElementShouldRetryError("Unsuccessful storage")
-
-        except ElementShouldSkipError as e:
+    def __attempt_retrieve(self, element_index):
+        with self.timed(
+            element_index.id, ELEMENT, attempt=self.attempt_of(element_index)
+        ):
+            try:
+                self.__store(self.retrieve_element(element_index, self.config))
+            except Exception as e:
+                self.__handle_error(e, element_index)
+
+    async def __attempt_retrieve_async(self, element_index):
+        # NB: only wall time is measured, as other elements' tasks run on the same thread in the meantime
+        with self.timed(
+            element_index.id,
+            ELEMENT,
+            counters=False,
+            attempt=self.attempt_of(element_index),
+        ):
+            try:
+                new_element = await self.retrieve_element_async(
+                    element_index, self.config
+                )
+                # NB: writing copies media, so it is kept off the event loop
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(None, self.__store, new_element)
+            except Exception as e:
+                self.__handle_error(e, element_index)
+
+    def staging_path(self, element) -> Path:
+        """A scratch dir for the files of the element retrieved from the element index `element`, on the same
+        filesystem as the place it will be written to. An element whose files are all in it is moved into place with a
+        rename when it is written (see `Storage.staging_path`)."""
+        return self.disk.staging_path(self.name, element.id)
+
+    def __store(self, new_element):
+        if new_element is None:
+            return
+        success = self.disk.write_element(self.name, new_element)
+        if not success:
+            raise ElementShouldRetryError("Unsuccessful storage")
+
+    def __handle_error(self, e, element_index):
+        if isinstance(e, ElementShouldSkipError):
             self.error_logger(str(e), element_index)
-        except ElementShouldRetryError as e:
+        elif isinstance(e, ElementShouldRetryError):
             self.error_logger(str(e), element_index)
-            if attempts > 1:
-                return self.__attempt_retrieve(attempts - 1, element_index)
-            else:
+            if not self.retry_later(element_index, after=e.after):
                 self.error_logger(
                     "failed after maximum retries - skipping element", element_index
                 )
         # TODO: flag to turn this off during development should be passed during run
-        except Exception as e:
-            if self.is_dev():
-                raise e
-            else:
-                self.error_logger(
-                    "unknown exception raised - skipping element", element_index
-                )
+        elif self.is_dev():
+            raise e
+        else:
+            self.error_logger(
+                "unknown exception raised - skipping element", element_index
+            )
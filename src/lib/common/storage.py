@@ -3,15 +3,50 @@ import csv
 import shutil
 import datetime
 import json
+import heapq
+from itertools import islice
+from json.encoder import encode_basestring
 from pathlib import Path
 from types import GeneratorType, SimpleNamespace as Ns
 from typing import Tuple, Union, List, Iterable, Dict
-from lib.common.etypes import Etype, LocalElement, LocalElementsIndex
+from lib.common.etypes import LocalElement, LazyLocalElement, LocalElementsIndex
 from lib.common.exceptions import InvalidStorageQuery
-from lib.common.util import subdirs, files
+from lib.common.util import subdirs
+from lib.common.timing import trace_event
+from lib.common.leases import node_name
+from lib.common.catalog import Catalog, CATALOG_FILE
+from lib.common.writes import write_file, move_file, count, MOVE
+from lib.common.blobs import BlobStore, BLOBS_DIR
+from lib.common.columnar import (
+    write_columnar,
+    ColumnarIndex,
+    CSV,
+    COLUMNAR,
+    META_FILE as COLUMNS_META_FILE,
+)
+from lib.common.archives import (
+    MemberPath,
+    archivable,
+    write_archive,
+    DEFAULT_ARCHIVE_SHARD_MB,
+)
+from lib.common.logs import (
+    LogWriter,
+    render,
+    as_record,
+    DEFAULT_LOG_MAX_MB,
+    DEFAULT_LOG_BACKUPS,
+)
 from abc import ABC, abstractmethod
 
 Component = Tuple[str, str]
+# config key, at the top level of the YAML, for the storage that a folder's elements are kept in, as a dict with a
+# 'type' of LOCAL or S3, and the options of the S3Storage (see lib/common/s3storage.py).
+STORAGE = "storage"
+LOCAL = "local"
+S3 = "s3"
+# the number of merged events that are held before they are written.
+EVENTS_BUFFER = 4096
 
 
 class Storage(ABC):
@@ -57,6 +92,12 @@ class Storage(ABC):
     def write_meta(self, q: str, meta: dict):
         pass
 
+    @abstractmethod
+    def staging_path(self, q: str, element_id: str) -> Path:
+        """ Returns an empty scratch dir in which a module can make the files of an element that it is about to write
+        to `q`, on the same filesystem as the element's place, so that it can be committed with a rename. """
+        pass
+
 
 class LocalStorage(Storage):
     """
@@ -66,23 +107,71 @@ class LocalStorage(Storage):
     RETRIEVED_EXT = "data"
     ANALYSED_EXT = "derived"
     ELEMENTS_INDEX_FILE = "element_map.csv"
-
-    def __init__(self, folder=None):
+    ELEMENTS_INDEX_COLUMNS = "element_map.cols"
+    STAGING_DIR = ".staging"
+    META_FILE = ".mtbatch"
+
+    def __init__(
+        self,
+        folder=None,
+        catalog=False,
+        write_strategies=None,
+        blobs=False,
+        index_format=CSV,
+        log_max_mb=DEFAULT_LOG_MAX_MB,
+        log_backups=DEFAULT_LOG_BACKUPS,
+        archive_min_files=None,
+        archive_shard_mb=DEFAULT_ARCHIVE_SHARD_MB,
+    ):
         self.base_dir = Path("/mtriage") / folder
+        # an index of the folder's elements (see lib/common/catalog.py), or None to always read them from disk. It is
+        # off by default, as SQLite's locking can't be relied on when a folder is shared over NFS.
+        self.catalog = Catalog(self.base_dir / CATALOG_FILE) if catalog else None
 
         # selecting
         self.ELEMENT_DIR = lambda name: self.base_dir / name / self.RETRIEVED_EXT
         self.ELEMENT_MAP = lambda name: self.base_dir / name / self.ELEMENTS_INDEX_FILE
         self.headers = []
+        # the format that element indexes are written in: CSV, or COLUMNAR (see lib/common/columnar.py) as well as CSV
+        self.index_format = index_format
         self.delete_local_on_write = False
+        # whether elements are written to a staging dir and renamed into place, so that they appear whole
+        self.atomic_writes = False
+        # the ways that files may be written into the folder (see lib/common/writes.py), or None for all of them
+        self.write_strategies = write_strategies
+        # a store that keeps each distinct file once (see lib/common/blobs.py), or None to write files as they are
+        self.blobs = (
+            BlobStore(self.base_dir / BLOBS_DIR, write_strategies) if blobs else None
+        )
+        # the number of images past which an element's images are written to tar shards (see lib/common/archives.py),
+        # or None to always write them as they are
+        self.archive_min_files = archive_min_files
+        self.archive_shard_mb = archive_shard_mb
 
         # logging
         self.__LOGS_DIR = f"{self.base_dir}/logs"
         self.__LOGS_FILE = f"{self.__LOGS_DIR}/logs.txt"
-        self.__META_FILE = ".mtbatch"
+        self.__SHARDS_DIR = f"{self.__LOGS_DIR}/shards"
+        self.__EVENTS_FILE = f"{self.__LOGS_DIR}/events.jsonl"
+        self.__TRACE_FILE = f"{self.__LOGS_DIR}/trace.json"
+        self.__META_FILE = self.META_FILE
 
         if not os.path.exists(self.__LOGS_DIR):
             os.makedirs(self.__LOGS_DIR)
+        # writes log records in a background thread (see lib/common/logs.py)
+        self.log_writer = LogWriter(self.__LOGS_DIR, log_max_mb, log_backups)
+
+    def __getstate__(self):
+        # NB: the path helpers are lambdas, which can't be pickled. They are dropped here and made again when
+        # unpickling, so that storage can be sent to pool workers along with its module.
+        state = self.__dict__.copy()
+        del state["ELEMENT_DIR"], state["ELEMENT_MAP"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.ELEMENT_DIR = lambda name: self.base_dir / name / self.RETRIEVED_EXT
+        self.ELEMENT_MAP = lambda name: self.base_dir / name / self.ELEMENTS_INDEX_FILE
 
     def read_query(self, query: str) -> Path:
         """ Override parent `read_query` to return the valid Path """
@@ -93,8 +182,28 @@ class LocalStorage(Storage):
         else:
             return self.base_dir / cmp[0] / self.ANALYSED_EXT / cmp[1]
 
-    def read_elements_index(self, q: str) -> LocalElementsIndex:
+    def elements_index_format(self, q: str):
+        """The format of the element index of `q`, or None if it has none. A columnar index is read in place of the
+        element_map.csv that was written along with it, unless the CSV has been changed since, say by hand."""
+        dest = self.read_query(q)
+        csv_file = dest / self.ELEMENTS_INDEX_FILE
+        meta = dest / self.ELEMENTS_INDEX_COLUMNS / COLUMNS_META_FILE
+        if meta.exists() and (
+            not csv_file.exists()
+            or os.stat(meta).st_mtime_ns >= os.stat(csv_file).st_mtime_ns
+        ):
+            return COLUMNAR
+        if csv_file.exists():
+            return CSV
+        return None
+
+    def read_elements_index(self, q: str, columns=None) -> LocalElementsIndex:
+        """Read the element index of `q`, with only `columns` in each row if they are given."""
         dest = self.read_query(q)
+        if self.elements_index_format(q) == COLUMNAR:
+            index = ColumnarIndex(dest / self.ELEMENTS_INDEX_COLUMNS)
+            self.headers = index.columns
+            return LocalElementsIndex(rows=index.rows(columns))
 
         def get_rows():
             with open(dest / self.ELEMENTS_INDEX_FILE, "r", encoding="utf-8") as f:
@@ -103,11 +212,10 @@ class LocalStorage(Storage):
                     if idx == 0:
                         self.headers = row
                         continue
-                    obj = Ns()
                     allvls = dict(zip(self.headers, row))
-                    obj = Ns(**allvls)
-
-                    yield obj
+                    if columns is not None:
+                        allvls = {k: v for k, v in allvls.items() if k in columns}
+                    yield Ns(**allvls)
 
         return LocalElementsIndex(rows=get_rows())
 
@@ -117,10 +225,26 @@ class LocalStorage(Storage):
         if not dest.exists():
             dest.mkdir(parents=True, exist_ok=True)
 
+        # NB: element_map.csv is always written, as users and other tools read it. A columnar index is written from the
+        # same stream of rows, and otherwise an earlier one is removed, so that it is not read in place of the CSV.
+        cols = dest / self.ELEMENTS_INDEX_COLUMNS
         with open(dest / self.ELEMENTS_INDEX_FILE, "w") as f:
             writer = csv.writer(f, delimiter=",")
-            for line in eidx.rows:
-                writer.writerow(line)
+
+            def written():
+                for line in eidx.rows:
+                    writer.writerow(line)
+                    yield line
+                # the CSV is done before the columnar index is, so that it is not taken to have been changed since
+                f.flush()
+
+            if self.index_format == COLUMNAR:
+                write_columnar(cols, written())
+                return
+            for _ in written():
+                pass
+        if cols.exists():
+            shutil.rmtree(cols)
 
     def read_element(self, q: str, id: str) -> LocalElement:
         pass
@@ -129,37 +253,247 @@ class LocalStorage(Storage):
         """Write a LocalElement to persistent storage, deleting the LocalElement afterwards.
         Returns True if successful, false if otherwise."""
         dest = self.read_query(q)
-        if not os.path.exists(dest):
-            os.makedirs(dest)
-
-        base = dest / element.id
-        if not os.path.exists(base):
-            os.makedirs(base)
+        # NB: the stage is made first, as a stage that is missing when one thread checks it may be made and written to
+        # by another before the first writes. A stage that is new is not synced, and so is read from disk once.
+        os.makedirs(dest, exist_ok=True)
+        synced = self.catalog is not None and self.catalog.is_synced(q, dest)
+
+        staging = self.__staged_in(q, element)
+        members = archivable(element.paths, self.archive_min_files)
+        if len(members) > 0:
+            self.__publish_archive(dest, element, members, move=staging is not None)
+        elif staging is not None and self.blobs is None:
+            self.__commit_staged(dest, element, staging)
+        elif self.atomic_writes:
+            self.__publish_element(dest, element, move=staging is not None)
+        else:
+            base = dest / element.id
+            if not os.path.exists(base):
+                os.makedirs(base)
+            self.__write_paths(element.paths, base, move=staging is not None)
+        if staging is not None and staging.exists():
+            shutil.rmtree(staging)
+
+        if self.catalog is not None:
+            self.catalog.put(q, dest, dest / element.id, synced)
+        return True
 
-        for idx, e in enumerate(element.paths):
+    def staging_path(self, q: str, element_id: str) -> Path:
+        """A scratch dir in the folder's hidden staging dir. Anything left in it by an earlier attempt at the element
+        is removed. An element whose files are all in it is renamed into place whole by `write_element`."""
+        staging = self.__staging_dir(q, element_id)
+        if staging.exists():
+            shutil.rmtree(staging)
+        os.makedirs(staging)
+        return staging
+
+    def __staging_dir(self, q: str, element_id: str) -> Path:
+        name = f"{q.replace('/', '.')}.{element_id}"
+        # NB: when several nodes write to the folder (see lib/common/leases.py), two may stage the same element
+        if self.atomic_writes:
+            name = f"{name}.{node_name()}"
+        return self.base_dir / self.STAGING_DIR / name
+
+    def __staged_in(self, q: str, element: LocalElement):
+        """The staging dir of `element`, if all of its files are in it, or None."""
+        staging = self.__staging_dir(q, element.id)
+        if len(element.paths) == 0 or any(
+            Path(p).parent != staging for p in element.paths
+        ):
+            return None
+        return staging
+
+    def __write_paths(self, paths: List[Path], base: Path, move=False):
+        move = move or self.delete_local_on_write
+        # NB: files in the archive of an element that was read are copied out of it, and never moved
+        members = [p for p in paths if isinstance(p, MemberPath)]
+        for m in members:
+            m.extract(base / m.name)
+        paths = [p for p in paths if not isinstance(p, MemberPath)]
+        if self.blobs is not None:
+            return self.blobs.write_paths(paths, base, move=move)
+        for idx, e in enumerate(paths):
             if not isinstance(e, Path):
                 e = Path(e)
             # deletes LocalElement by moving
-            if self.delete_local_on_write:
-                shutil.move(e, base / e.name)
+            if move:
+                move_file(e, base / e.name, self.write_strategies)
             else:
-                shutil.copyfile(e, base / e.name)
-
-        return True
+                write_file(e, base / e.name, self.write_strategies)
+
+    def __commit_staged(self, dest: Path, element: LocalElement, staging: Path):
+        """Rename an element's staging dir into place, leaving out any files in it that are not the element's."""
+        keep = set(Path(p).name for p in element.paths)
+        for f in list(staging.iterdir()):
+            if f.name in keep:
+                count(MOVE, f.stat().st_size)
+            elif f.is_dir():
+                shutil.rmtree(f)
+            else:
+                os.remove(f)
+        self.__rename_into_place(dest, staging, element.id)
+
+    def __publish_element(self, dest: Path, element: LocalElement, move=False):
+        """Write an element to a hidden staging dir beside its place, and rename it into place once it is whole. An
+        element that is already there, say from a node whose lease on it expired, is replaced."""
+        staging = dest / f".{element.id}.{node_name()}.staging"
+        os.makedirs(staging, exist_ok=True)
+        self.__write_paths(element.paths, staging, move=move)
+        self.__rename_into_place(dest, staging, element.id)
+
+    def __publish_archive(
+        self, dest: Path, element: LocalElement, members: List[Path], move=False
+    ):
+        """Write an element whose `members` are written to tar shards rather than as files, in a staging dir beside
+        its place that is renamed into place once it is whole, as in `__publish_element`."""
+        staging = dest / f".{element.id}.{node_name()}.staging"
+        if staging.exists():
+            shutil.rmtree(staging)
+        os.makedirs(staging)
+        keep = set(m.name for m in members)
+        self.__write_paths(
+            [p for p in element.paths if Path(p).name not in keep], staging, move=move
+        )
+        write_archive(members, staging, self.archive_shard_mb)
+        if move or self.delete_local_on_write:
+            for m in members:
+                if not isinstance(m, MemberPath):
+                    os.remove(m)
+        self.__rename_into_place(dest, staging, element.id)
+
+    def __rename_into_place(self, dest: Path, staging: Path, element_id: str):
+        base = dest / element_id
+        try:
+            os.rename(staging, base)
+        except OSError:
+            # NB: a dir can only be renamed over an empty one
+            replaced = dest / f".{element_id}.{node_name()}.replaced"
+            os.rename(base, replaced)
+            os.rename(staging, base)
+            shutil.rmtree(replaced)
 
     def remove_element(self, q: str, id: str):
-        d = self.read_query(q) / id
+        dest = self.read_query(q)
+        synced = self.catalog is not None and self.catalog.is_synced(q, dest)
+        d = dest / id
         if os.path.exists(d):
             shutil.rmtree(d)
+        if self.catalog is not None:
+            self.catalog.remove(q, dest, id, synced)
+
+    def write_logs(self, logs: List[Union[dict, str]]):
+        """Queue log records (see lib/common/logs.py) to be written to the log files. They are written in the
+        background, so call `flush_logs` to wait for them."""
+        self.log_writer.write(logs)
 
-    def write_logs(self, logs: List[str]):
+    def flush_logs(self):
+        self.log_writer.flush()
+
+    def write_log_shard(self, shard: str, logs: List[Tuple[float, Union[dict, str]]]):
+        """Append timestamped log records to a shard of the logs. Each worker process in a parallel phase writes to its
+        own shard, so that workers do not contend over the log files. Records are rendered here, in the worker, so
+        that merging the shards need not parse them."""
         if len(logs) <= 0:
             return
-        with open(self.__LOGS_FILE, "a") as f:
-            for l in logs:
+        os.makedirs(self.__SHARDS_DIR, exist_ok=True)
+        with open(f"{self.__SHARDS_DIR}/{shard}.log", "a") as f:
+            for ts, l in logs:
                 if l is not None:
-                    f.write(l)
-                    f.write("\n")
+                    text, jsonl = render(as_record(l))
+                    f.write(f"{ts:.6f}\t{encode_basestring(text)}\t{jsonl}\n")
+
+    def merge_log_shards(self, prefix: str):
+        """Merge the shards whose names start with `prefix` into the log files in timestamp order, remove them, and
+        wait for the logs to be written."""
+        if not os.path.exists(self.__SHARDS_DIR):
+            return
+        shards = [
+            f"{self.__SHARDS_DIR}/{f}"
+            for f in sorted(os.listdir(self.__SHARDS_DIR))
+            if f.startswith(f"{prefix}.") and f.endswith(".log")
+        ]
+
+        def read_shard(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        # NB: neither part has a tab in it, as JSON escapes them
+                        ts, text, jsonl = line.rstrip("\n").split("\t", 2)
+                        yield float(ts), json.loads(text), jsonl
+                    except ValueError:
+                        # a line torn by a worker that was killed mid-write
+                        continue
+
+        merged = heapq.merge(*[read_shard(p) for p in shards], key=lambda x: x[0])
+        entries = ((text, jsonl) for _, text, jsonl in merged)
+        for batch in iter(lambda: list(islice(entries, EVENTS_BUFFER)), []):
+            self.log_writer.write_rendered(batch)
+        self.flush_logs()
+        for p in shards:
+            os.remove(p)
+
+    def write_events(self, events: List[dict]):
+        """Append timing events (see lib/common/timing.py) to the event log, and to the trace file in the Chrome trace
+        format. The trace is a JSON array that is left open, which trace viewers accept, so that it can be appended to
+        over a run."""
+        if len(events) <= 0:
+            return
+        started = os.path.exists(self.__TRACE_FILE)
+        with open(self.__EVENTS_FILE, "a") as f:
+            for e in events:
+                f.write(json.dumps(e))
+                f.write("\n")
+        with open(self.__TRACE_FILE, "a") as f:
+            for e in events:
+                f.write(",\n" if started else "[\n")
+                f.write(json.dumps(trace_event(e)))
+                started = True
+
+    def write_event_shard(self, shard: str, events: List[dict]):
+        """Append timing events to a shard, as `write_log_shard` does for log lines."""
+        if len(events) <= 0:
+            return
+        os.makedirs(self.__SHARDS_DIR, exist_ok=True)
+        with open(f"{self.__SHARDS_DIR}/{shard}.events", "a") as f:
+            for e in events:
+                f.write(json.dumps(e))
+                f.write("\n")
+
+    def merge_event_shards(self, prefix: str, keep=None) -> List[dict]:
+        """Merge the event shards whose names start with `prefix` into the event log and trace in the order the events
+        ended, and remove them. Returns the events for which `keep` is true."""
+        if not os.path.exists(self.__SHARDS_DIR):
+            return []
+        shards = [
+            f"{self.__SHARDS_DIR}/{f}"
+            for f in sorted(os.listdir(self.__SHARDS_DIR))
+            if f.startswith(f"{prefix}.") and f.endswith(".events")
+        ]
+
+        def read_shard(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # a line torn by a worker that was killed mid-write
+                        continue
+
+        kept, buffer = [], []
+        merged = heapq.merge(
+            *[read_shard(p) for p in shards], key=lambda e: e["ts"] + e["wall"]
+        )
+        for e in merged:
+            if keep is not None and keep(e):
+                kept.append(e)
+            buffer.append(e)
+            if len(buffer) >= EVENTS_BUFFER:
+                self.write_events(buffer)
+                buffer = []
+        self.write_events(buffer)
+        for p in shards:
+            os.remove(p)
+        return kept
 
     def write_meta(self, q: str, meta: dict):
         dest = self.read_query(q) / self.__META_FILE
@@ -192,50 +526,45 @@ class LocalStorage(Storage):
         """
 
         all_media = {}
+        for q, stage_dir in self.stages():
+            selector, analyser = Storage.read_query(self, q)
+            media = all_media.setdefault(
+                selector, {self.RETRIEVED_EXT: {}, self.ANALYSED_EXT: {}}
+            )
+            if analyser is None:
+                stage = media[self.RETRIEVED_EXT]
+            else:
+                stage = media[self.ANALYSED_EXT].setdefault(analyser, {})
+            for el_id in self.element_ids(q, stage_dir):
+                stage[el_id] = stage_dir / el_id
+
+        return all_media
+
+    def element_ids(self, q: str, stage_dir: Path) -> List[str]:
+        if self.catalog is not None:
+            return self.catalog.ids(q, stage_dir)
+        return [el.name for el in subdirs(stage_dir)]
 
+    def stages(self) -> Iterable[Tuple[str, Path]]:
+        """The query and dir of every stage in the folder: the 'data' dir of each selector, and each analyser's dir in
+        its 'derived' dir."""
         # the results from each selector sits in a dir of its name
         selectors = [
             f
-            for f in os.listdir(self.base_dir)
-            if (os.path.isdir(self.base_dir / f) and f != "logs")
+            for f in sorted(os.listdir(self.base_dir))
+            if (
+                os.path.isdir(self.base_dir / f)
+                and f not in ["logs", BLOBS_DIR]
+                and not f.startswith(".")
+            )
         ]
-
         for selector in selectors:
-            all_media[selector] = {self.RETRIEVED_EXT: {}, self.ANALYSED_EXT: {}}
-
-            # add all original elements
-            data_pass = self.base_dir / selector / self.RETRIEVED_EXT
-            _elements = [
-                f
-                for f in os.listdir(data_pass)
-                if os.path.isdir(os.path.join(data_pass, f))
-            ]
-
-            for el_id in _elements:
-                all_media[selector][self.RETRIEVED_EXT][el_id] = data_pass / el_id
-
-            # add all derived elements
+            data_dir = self.base_dir / selector / self.RETRIEVED_EXT
+            if data_dir.is_dir():
+                yield selector, data_dir
             derived_dir = self.base_dir / selector / self.ANALYSED_EXT
-
-            if not os.path.exists(derived_dir):
-                continue
-
-            analysers = [
-                f for f in os.listdir(derived_dir) if (derived_dir / f).is_dir()
-            ]
-
-            for _analyser in analysers:
-                all_media[selector][self.ANALYSED_EXT][_analyser] = {}
-                _dpath = derived_dir / _analyser
-
-                _elements = [f for f in os.listdir(_dpath) if (_dpath / f).is_dir()]
-
-                for el_id in _elements:
-                    all_media[selector][self.ANALYSED_EXT][_analyser][el_id] = (
-                        derived_dir / _analyser / el_id
-                    )
-
-        return all_media
+            for analyser in sorted(subdirs(derived_dir)):
+                yield f"{selector}/{analyser.name}", analyser
 
     def read_elements(self, qs: List[str]) -> List[LocalElement]:
         """Take a list of queries, and returns a flattened list of LocalElements for the specified folders. The order
@@ -243,10 +572,10 @@ class LocalStorage(Storage):
         els = []
         for q in qs:
             element_pth = self.read_query(q)
-            el_paths = subdirs(element_pth)
-            # TODO: cast elements properly and throw error if they don't conform
-            for el in el_paths:
-                lel = Etype.cast(el.name, files(el))
-                lel.query = q
-                els.append(lel)
+            if self.catalog is not None:
+                els += self.catalog.elements(q, element_pth)
+                continue
+            # NB: elements are cast lazily, by the workers that first use them
+            for el in subdirs(element_pth):
+                els.append(LazyLocalElement(id=el.name, query=q, el_dir=el))
         return els
@@ -0,0 +1,119 @@
+import os
+import time
+import threading
+
+# config option to turn timing off, for runs where even the cost of reading counters per element matters.
+TIMING = "timing"
+
+# the categories of timed spans.
+PHASE = "phase"
+WORKER = "worker"
+BATCH = "batch"
+ELEMENT = "element"
+
+# what a span's CPU time and bytes are counted over: the thread that runs it, or the whole process.
+THREAD = "thread"
+PROCESS = "process"
+
+IO_FILES = {THREAD: "/proc/thread-self/io", PROCESS: "/proc/self/io"}
+
+
+def timing_enabled(config) -> bool:
+    return bool(config.get(TIMING, True))
+
+
+def io_counters(scope: str = THREAD):
+    """The bytes read and written so far through read and write calls, including from the page cache and sockets, by
+    the calling thread or process. None on platforms that don't expose them."""
+    try:
+        with open(IO_FILES[scope], "r") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def cpu_time(scope: str = THREAD) -> float:
+    return time.thread_time() if scope == THREAD else time.process_time()
+
+
+class Timer:
+    """Times a span of work, as a context manager. Once the span has ended, `event` holds its start time, wall and
+    CPU time in seconds, and bytes read and written, along with any `args`.
+
+    With `counters=False` only wall time is measured. This is for spans that share their thread with others while
+    they run, such as coroutines on an event loop, where the thread's counters would include the other spans' work.
+    """
+
+    def __init__(self, name, cat, scope=THREAD, counters=True, **args):
+        self.name = name
+        self.cat = cat
+        self.scope = scope
+        self.counters = counters
+        self.args = args
+        self.event = None
+
+    def __enter__(self):
+        self.ts = time.time()
+        self.start = time.perf_counter()
+        if self.counters:
+            self.cpu = cpu_time(self.scope)
+            self.io = io_counters(self.scope)
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.start
+        cpu, read, written = None, None, None
+        if self.counters:
+            cpu = cpu_time(self.scope) - self.cpu
+            io = io_counters(self.scope)
+            if io is not None and self.io is not None:
+                read, written = io[0] - self.io[0], io[1] - self.io[1]
+        self.event = {
+            "name": self.name,
+            "cat": self.cat,
+            "ts": self.ts,
+            "wall": wall,
+            "cpu": cpu,
+            "read": read,
+            "written": written,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            **self.args,
+        }
+        return False
+
+
+def add_counters(event: dict, other: dict):
+    """Add the CPU time and bytes of `other` to `event`, where both have them."""
+    for k in ["cpu", "read", "written"]:
+        if event[k] is not None and other.get(k) is not None:
+            event[k] += other[k]
+
+
+def trace_event(event: dict) -> dict:
+    """An event as a complete ('X') event in the Chrome trace format, which Perfetto and chrome://tracing open."""
+    args = {
+        k: v
+        for k, v in event.items()
+        if k not in ["name", "cat", "ts", "wall", "pid", "tid"]
+    }
+    return {
+        "name": event["name"],
+        "cat": event["cat"],
+        "ph": "X",
+        "ts": round(event["ts"] * 1e6),
+        "dur": round(event["wall"] * 1e6),
+        "pid": event["pid"],
+        "tid": event["tid"],
+        "args": args,
+    }
+
+
+def format_event(event: dict) -> str:
+    line = f"{event['wall']:.2f}s wall"
+    if event["cpu"] is not None:
+        line += f", {event['cpu']:.2f}s CPU"
+    if event["read"] is not None:
+        line += f", {event['read'] / 1e6:.1f}MB read, {event['written'] / 1e6:.1f}MB written"
+    return line
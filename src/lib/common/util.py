@@ -1,3 +1,4 @@
+import os
 import hashlib
 import multiprocessing
 from pathlib import Path
@@ -38,9 +39,14 @@ def hashdict(_dict):
 
 
 def subdirs(path: Path) -> List[Path]:
-    """ Return a list of Paths for subdirectories in a directory """
+    """ Return a list of Paths for subdirectories in a directory, leaving out hidden ones such as staging dirs """
     if path.is_dir():
-        return [f for f in path.iterdir() if f.is_dir()]
+        # NB: scandir tells dirs apart from the dir's entries, without a stat of each
+        return [
+            path / f.name
+            for f in os.scandir(path)
+            if f.is_dir() and not f.name.startswith(".")
+        ]
     else:
         return []
 
@@ -0,0 +1,196 @@
+import sys
+import queue
+import atexit
+import traceback
+import multiprocessing
+from lib.common.workers import summary, DONE, KILLED, RETIRED
+
+# the modules that every pool worker has imported before it starts, as well as these.
+POOL_MODULES = ["lib.common.workerpool", "lib.common.analyser", "lib.common.selector"]
+
+# the message a worker sends the pool with each chunk it finishes.
+FINISHED = "finished"
+# the task id in a worker's slot before it has taken its first chunk.
+NO_TASK = -1
+
+CONTEXT = multiprocessing.get_context("forkserver")
+PRELOAD = list(POOL_MODULES)
+POOL = None
+
+
+def preload(modules: list):
+    """Import `modules` once in the forkserver that pool workers are forked from, so that each worker starts with
+    them already imported. Only takes effect if called before the first pool is started."""
+    for m in modules:
+        if m not in PRELOAD:
+            PRELOAD.append(m)
+    CONTEXT.set_forkserver_preload(PRELOAD)
+
+
+def get_pool(workers: int):
+    """The pool of `workers` workers that is shared by every phase that runs on the forkserver executor, which is
+    started on first use. The pool is restarted if a phase asks for a different number of workers."""
+    global POOL
+    if POOL is not None and POOL.workers != workers:
+        close_pool()
+    if POOL is None:
+        CONTEXT.set_forkserver_preload(PRELOAD)
+        POOL = WorkerPool(workers)
+    return POOL
+
+
+def close_pool():
+    global POOL
+    if POOL is not None:
+        POOL.close()
+        POOL = None
+
+
+atexit.register(close_pool)
+
+
+def innards_ref(module, innards):
+    """A picklable reference to a phase's function: the class that it is defined on, and the name of the phase that
+    wraps it there."""
+    for cls in type(module).__mro__:
+        for name, attr in vars(cls).items():
+            if getattr(attr, "__wrapped__", None) is innards:
+                return cls, name
+    raise ValueError(f"'{innards.__qualname__}' is not a phase of {type(module)}")
+
+
+class WorkerPool:
+    """Long-lived worker processes, forked from a forkserver that has imported the modules passed to `preload`
+    (such as the analysers in a run, and the frameworks that they import), and shared across phases and modules.
+
+    Workers build their own instance of a module the first time they are sent one of its chunks, from the module's
+    class, config, name and storage, and call its `setup_worker`. The last module a worker has built is kept for the
+    chunks that follow, so that an analyser's model is loaded once per worker rather than once per phase. A worker's
+    journal records and retries are sent back to the pool along with each finished chunk.
+
+    A worker that reaches its module's `worker_limits` or is killed is replaced, as with the processes executor. Each
+    worker writes the id of the chunk it takes to a slot in shared memory that the pool made for it when it was
+    started, so that the pool knows which chunk a killed worker had taken, however soon it was killed."""
+
+    # how long to wait for a message from workers before checking whether any have exited.
+    POLL = 0.1
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.tasks = CONTEXT.Queue()
+        self.results = CONTEXT.Queue()
+        self.next_id = 0
+        # the ids of the tasks that have been submitted and have not finished
+        self.pending = set()
+        # pid -> the latest summary of that worker
+        self.summaries = {}
+        # process -> the slot in which that worker writes the id of the last task it took
+        self.slots = {}
+        self.processes = [self.start_worker() for _ in range(workers)]
+
+    def start_worker(self):
+        slot = CONTEXT.Value("q", NO_TASK, lock=False)
+        p = CONTEXT.Process(
+            target=serve, args=(self.tasks, self.results, slot), daemon=True
+        )
+        p.start()
+        self.slots[p] = slot
+        return p
+
+    def submit(self, task: dict) -> int:
+        task_id = self.next_id
+        self.next_id += 1
+        self.pending.add(task_id)
+        self.tasks.put((task_id, task))
+        return task_id
+
+    def poll(self, block=True) -> list:
+        """The `(records, retries)` of each chunk that has finished since the last poll, waiting for at least one if
+        `block` and any chunks are pending. A chunk whose worker was killed finishes with neither."""
+        finished = []
+        while True:
+            self.__read_results(finished, self.POLL if block else 0)
+            finished += self.replace_exited()
+            if len(finished) > 0 or not block or len(self.pending) == 0:
+                return finished
+
+    def __read_results(self, finished: list, timeout: float):
+        """Handle the messages that workers have sent, waiting up to `timeout` for the first."""
+        while True:
+            try:
+                msg = self.results.get(timeout=timeout)
+            except queue.Empty:
+                return
+            timeout = 0
+            _, task_id, records, retries, worker = msg
+            self.summaries[worker["pid"]] = worker
+            if task_id in self.pending:
+                self.pending.remove(task_id)
+                finished.append((records, retries))
+
+    def replace_exited(self) -> list:
+        """Start a fresh worker in place of each that has exited, and finish the chunk that a killed worker had
+        started with no records."""
+        exited = [p for p in self.processes if p.exitcode is not None]
+        if len(exited) == 0:
+            return []
+        # NB: whatever a worker sent before it exited can be read by now
+        finished = []
+        self.__read_results(finished, 0)
+        for p in exited:
+            p.join()
+            task_id = self.slots.pop(p).value
+            if p.exitcode != RETIRED:
+                self.summaries[p.pid] = {
+                    "pid": p.pid,
+                    "elements": None,
+                    "peak_rss": None,
+                    "exit": KILLED,
+                }
+                # NB: the last task the worker took is still pending if it was killed before it could send its results
+                if task_id in self.pending:
+                    self.pending.remove(task_id)
+                    finished.append(([], []))
+            self.processes[self.processes.index(p)] = self.start_worker()
+        return finished
+
+    def take_summaries(self) -> list:
+        taken = list(self.summaries.values())
+        self.summaries = {}
+        return taken
+
+    def close(self):
+        for _ in self.processes:
+            self.tasks.put(None)
+        for p in self.processes:
+            p.join()
+
+
+def serve(tasks, results, slot):
+    """The loop that each pool worker runs: take a chunk from `tasks`, note its id in `slot`, process it on an
+    instance of its module, and send its records and retries back on `results`."""
+    key, module, elements = None, None, 0
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, task = task
+        # NB: written straight to shared memory, unlike a message, which a feeder thread may not have sent yet
+        slot.value = task_id
+        cls, config, name, disk = task["module"]
+        if key != (cls, name, disk.base_dir, task["unique_id"]):
+            key = (cls, name, disk.base_dir, task["unique_id"])
+            module = cls(config, name, disk)
+        records, retries = [], []
+        try:
+            records, retries = module.run_pool_task(task)
+        except Exception:
+            # NB: as when a worker process dies, the chunk is left for the next run
+            traceback.print_exc()
+        elements += len(task["items"])
+        reached = task["limits"].reached(elements)
+        results.put(
+            (FINISHED, task_id, records, retries, summary(elements, reached or DONE))
+        )
+        if reached is not None:
+            sys.exit(RETIRED)
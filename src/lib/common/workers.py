@@ -0,0 +1,68 @@
+import os
+import resource
+
+# how a worker came to exit.
+DONE = "done"
+ELEMENTS = "elements"
+MEMORY = "memory"
+KILLED = "killed"
+
+# the exit code of a worker process that exits at one of its limits.
+RETIRED = 3
+
+
+def rss_bytes() -> int:
+    """The calling process' resident set size, including pages that it shares with the process it was forked from."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes() -> int:
+    # NB: ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class WorkerLimits:
+    """The number of elements a worker process may process, and the resident memory it may reach, before it exits
+    and is replaced. Either limit is None where it is not set. Limits are checked between chunks, once the chunk's
+    elements have been put on the journal's queue, so that no work is lost when the worker exits."""
+
+    def __init__(self, elements=None, rss_mb=None):
+        self.elements = int(elements) if elements else None
+        self.rss = int(float(rss_mb) * (1 << 20)) if rss_mb else None
+
+    def reached(self, elements: int):
+        """Which limit a worker that has processed `elements` elements has reached, or None."""
+        if self.elements is not None and elements >= self.elements:
+            return ELEMENTS
+        if self.rss is not None and rss_bytes() >= self.rss:
+            return MEMORY
+        return None
+
+
+def summary(elements: int, exit: str) -> dict:
+    """What a worker process reports of itself when it exits."""
+    return {
+        "pid": os.getpid(),
+        "elements": elements,
+        "peak_rss": peak_rss_bytes(),
+        "exit": exit,
+    }
+
+
+def format_stats(summaries: list) -> str:
+    exits = [s["exit"] for s in summaries]
+    peaks = [s["peak_rss"] / (1 << 20) for s in summaries if s.get("peak_rss")]
+    line = (
+        f"workers: {len(summaries)} workers, {exits.count(ELEMENTS)} replaced at the element limit, "
+        f"{exits.count(MEMORY)} at the memory limit, {exits.count(KILLED)} killed"
+    )
+    if len(peaks) > 0:
+        line += (
+            f"; peak memory {sum(peaks) / len(peaks):.0f}MB mean, {max(peaks):.0f}MB max "
+            f"({', '.join(f'{p:.0f}' for p in peaks)}MB by worker)"
+        )
+    return line
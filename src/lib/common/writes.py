@@ -0,0 +1,159 @@
+import os
+import errno
+import fcntl
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+# the ways a file can be written into storage, in the order they are tried.
+REFLINK = "reflink"
+HARDLINK = "hardlink"
+COPY_RANGE = "copy_file_range"
+COPY = "copy"
+STRATEGIES = [REFLINK, HARDLINK, COPY_RANGE, COPY]
+# a file that is moved into storage, which is a rename on the same filesystem.
+MOVE = "move"
+# a file that was not written, as the folder's blob store already had one with the same content (see blobs.py).
+DEDUP = "dedup"
+# config key, at the top level of the YAML, that limits the strategies used.
+WRITE_STRATEGIES = "write_strategies"
+
+# the ioctl that clones one file's extents into another, on filesystems that support it (btrfs, XFS, bcachefs).
+FICLONE = 0x40049409
+# errors that mean a strategy doesn't work from one filesystem to another at all, rather than for one file.
+UNSUPPORTED = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS}
+
+# (source device, destination device) -> strategies that failed between them, in this process.
+FILESYSTEMS = {}
+# strategy -> [files, bytes] written with it by this process.
+STATS = {}
+LOCK = threading.Lock()
+
+
+def reflink(src, dest):
+    with open(src, "rb") as s, open(dest, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def hardlink(src, dest):
+    os.link(src, dest)
+
+
+def copy_range(src, dest):
+    """Copy within the kernel, which filesystems such as NFS 4.2 and CIFS can do on the server."""
+    with open(src, "rb") as s, open(dest, "wb") as d:
+        remaining = os.fstat(s.fileno()).st_size
+        while remaining > 0:
+            n = os.copy_file_range(s.fileno(), d.fileno(), remaining)
+            if n == 0:
+                break
+            remaining -= n
+
+
+def copy(src, dest):
+    shutil.copyfile(src, dest)
+
+
+WRITERS = {REFLINK: reflink, HARDLINK: hardlink, COPY_RANGE: copy_range, COPY: copy}
+
+
+def available_strategies(strategies=None) -> list:
+    """The strategies in `strategies` (all by default) that this platform has, in order."""
+    strategies = STRATEGIES if strategies is None else strategies
+    return [
+        s
+        for s in STRATEGIES
+        if s in strategies and (s != COPY_RANGE or hasattr(os, "copy_file_range"))
+    ]
+
+
+def may_hardlink(src) -> bool:
+    """Whether `src` can share its inode with the file written from it. Files in the temp dir are scratch files,
+    which analysers may write over in place for the next element, and so are never hardlinked."""
+    tmp = os.path.realpath(tempfile.gettempdir())
+    return not os.path.realpath(src).startswith(tmp + os.sep)
+
+
+def count(strategy: str, size: int):
+    with LOCK:
+        stats = STATS.setdefault(strategy, [0, 0])
+        stats[0] += 1
+        stats[1] += size
+
+
+def write_file(src, dest, strategies=None) -> str:
+    """Write the file at `src` to `dest` with the first of `strategies` that works, and return which it was. A
+    strategy that fails between two filesystems is not tried between them again. A file already at `dest` is removed
+    first, so that a file that shares its inode with another is never written through."""
+    if os.path.lexists(dest):
+        os.remove(dest)
+    size = os.stat(src).st_size
+    key = (os.stat(src).st_dev, os.stat(Path(dest).parent).st_dev)
+    failed = FILESYSTEMS.setdefault(key, set())
+    for strategy in available_strategies(strategies):
+        if strategy in failed or (strategy == HARDLINK and not may_hardlink(src)):
+            continue
+        try:
+            WRITERS[strategy](src, dest)
+        except OSError as e:
+            if os.path.lexists(dest):
+                os.remove(dest)
+            if strategy == COPY:
+                raise
+            if e.errno in UNSUPPORTED:
+                failed.add(strategy)
+            continue
+        count(strategy, size)
+        return strategy
+    # NB: only reached if the copy strategy was left out
+    copy(src, dest)
+    count(COPY, size)
+    return COPY
+
+
+def move_file(src, dest, strategies=None) -> str:
+    """Move the file at `src` to `dest`, which is a rename if they are on one filesystem, and otherwise a write
+    with `write_file` followed by removing `src`."""
+    size = os.stat(src).st_size
+    try:
+        os.replace(src, dest)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        strategy = write_file(src, dest, strategies)
+        os.remove(src)
+        return strategy
+    count(MOVE, size)
+    return MOVE
+
+
+def write_stats() -> dict:
+    with LOCK:
+        return {k: list(v) for k, v in STATS.items()}
+
+
+def diff_stats(after: dict, before: dict) -> dict:
+    return {
+        k: [v[0] - before.get(k, [0, 0])[0], v[1] - before.get(k, [0, 0])[1]]
+        for k, v in after.items()
+        if v != before.get(k)
+    }
+
+
+def add_stats(stats: dict, other: dict):
+    for k, v in other.items():
+        total = stats.setdefault(k, [0, 0])
+        total[0] += v[0]
+        total[1] += v[1]
+
+
+def format_stats(stats: dict) -> str:
+    mb = lambda *ks: sum(stats.get(k, [0, 0])[1] for k in ks) / 1e6
+    files = sum(v[0] for v in stats.values())
+    return (
+        f"writes: {files} files, {mb(REFLINK, HARDLINK):.1f}MB linked "
+        f"({mb(REFLINK):.1f}MB reflinked, {mb(HARDLINK):.1f}MB hardlinked), {mb(MOVE):.1f}MB moved, "
+        f"{mb(COPY_RANGE, COPY):.1f}MB copied ({mb(COPY_RANGE):.1f}MB in the kernel)"
+        + (f", {mb(DEDUP):.1f}MB deduplicated" if DEDUP in stats else "")
+    )
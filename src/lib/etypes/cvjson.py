@@ -4,9 +4,17 @@ from typing import List, Union
 from pathlib import Path
 from lib.common.etypes import Etype, Et, Pth
 from lib.common.exceptions import EtypeCastError
+from lib.common.scheduler import stream_chunks
 
 TMP = Path("/tmp")
-IMG_SFXS = [".bmp", ".jpg", ".png", ".jpeg"]
+IMG_SFXS = [".bmp", ".jpg", ".png", ".jpeg", ".webp"]
+# config option for the number of frames in each call to `get_batch_preds`, i.e. in a model's forward pass.
+FRAME_BATCH_SIZE = "frame_batch_size"
+DEFAULT_FRAME_BATCH_SIZE = 32
+
+
+def frame_batch_size(config) -> int:
+    return int(config.get(FRAME_BATCH_SIZE, DEFAULT_FRAME_BATCH_SIZE))
 
 
 def deduce_frame_no(path):
@@ -53,7 +61,7 @@ class CvJson(Et):
         return pths
 
     @staticmethod
-    def from_preds(element, get_preds):
+    def from_preds(element, get_preds, staging=None):
         """ Generate an element containing classifier predictions in a format
         appropriate for CvJson, i.e. a single JSON file 'preds.json' that
         contains an object representing which classes are predicted for each
@@ -65,23 +73,62 @@ class CvJson(Et):
         tuples `('classname', 0.8)`, where `'classname'` is a string
         representing the class predicted, and `0.8` is the normalized prediction
         probability between 0 and 1. See KerasPretrained/core.py in analysers
-        for an example. """
-        imgs = [p for p in element.paths if p.suffix in IMG_SFXS]
-        labels = {}
-        for imp in imgs:
-            frame_no, preds = deduce_frame_no(imp), get_preds(imp)
-            for pred_label, pred_conf in preds:
-                if pred_label in labels.keys():
-                    labels[pred_label]["frames"].append(frame_no)
-                    labels[pred_label]["scores"].append(pred_conf)
-                else:
-                    labels[pred_label] = {"frames": [frame_no], "scores": [pred_conf]}
+        for an example.
 
+        `staging` is a function that returns the dir to write an element's
+        'preds.json' to, such as an analyser's `staging_path`. By default, it is
+        written to a dir in /tmp. """
+        return CvJson.from_batch_preds(
+            [element], lambda imps: [get_preds(imp) for imp in imps], staging=staging
+        )[0]
+
+    @staticmethod
+    def from_batch_preds(
+        elements, get_batch_preds, batch_size=DEFAULT_FRAME_BATCH_SIZE, staging=None
+    ):
+        """ As `from_preds`, but for several elements at once, returning one
+        element of predictions for each. The images of all the elements are
+        passed to `get_batch_preds` in lists of up to `batch_size` paths, so
+        that a model's forward pass is filled even when each element only has a
+        few frames. `get_batch_preds` should return a list with the predictions
+        for each image, in the same format as `get_preds` in `from_preds`, and
+        `staging` is as in `from_preds`. """
+        imgs = [
+            (idx, imp)
+            for idx, element in enumerate(elements)
+            for imp in element.paths
+            if imp.suffix in IMG_SFXS
+        ]
+        labels = [{} for _ in elements]
+        for batch in stream_chunks(imgs, batch_size):
+            all_preds = get_batch_preds([imp for _, imp in batch])
+            for (idx, imp), preds in zip(batch, all_preds):
+                frame_no = deduce_frame_no(imp)
+                for pred_label, pred_conf in preds:
+                    if pred_label in labels[idx].keys():
+                        labels[idx][pred_label]["frames"].append(frame_no)
+                        labels[idx][pred_label]["scores"].append(pred_conf)
+                    else:
+                        labels[idx][pred_label] = {
+                            "frames": [frame_no],
+                            "scores": [pred_conf],
+                        }
+
+        return [
+            CvJson.__write_preds(element, el_labels, staging)
+            for element, el_labels in zip(elements, labels)
+        ]
+
+    @staticmethod
+    def __write_preds(element, labels, staging=None):
         meta = [p for p in element.paths if p.suffix in ".json"]
         meta = meta[0] if len(meta) > 0 else None
         out = {**prepare_json(meta), "labels": labels}
-        base = TMP / element.id
-        base.mkdir(parents=True, exist_ok=True)
+        if staging is not None:
+            base = staging(element)
+        else:
+            base = TMP / element.id
+            base.mkdir(parents=True, exist_ok=True)
         outp = base / "preds.json"
 
         with open(outp, "w") as fp:
@@ -89,5 +136,4 @@ class CvJson(Et):
 
         return Etype.Json(element.id, outp)
 
-
 etype = CvJson
@@ -2,15 +2,12 @@ import json
 import requests
 import os
 import html2text
-from pathlib import Path
-from urllib.request import urlretrieve
 from lib.common.selector import Selector
+from lib.common.logs import DEBUG
 from lib.common.etypes import Etype, LocalElementsIndex
 from lib.common.util import files
 from lib.selectors.FourChan.boards import viable_boards
 
-TMP = Path("/tmp")
-
 
 class FourChan(Selector):
     """A selector that leverages the native 4chan API.
@@ -18,12 +15,18 @@ class FourChan(Selector):
     https://github.com/4chan/4chan-API
     """
 
+    index_columns = ["id", "filename", "comment", "url"]
+
     def index(self, config):
-        results = []
         board = config["board"]
         if board not in viable_boards:
             self.error_logger("Your chosen board does not exist on 4chan!")
             quit()
+        # NB: posts are written to the index as they are scraped, rather than held until the end
+        return LocalElementsIndex(self._posts(board))
+
+    def _posts(self, board):
+        yield ["id", "thread_id", "datetime", "comment", "filename", "ext", "url"]
         # Create a HTML parser for parsing comments
         h = html2text.HTML2Text()
         h.ignore_links = False
@@ -34,7 +37,10 @@ class FourChan(Selector):
         for page_index, page in enumerate(content):
             self.logger(f"Scraping page number: {page_index+1}")
             for thread_index, threads in enumerate(page["threads"]):
-                self.logger(f"Extracting posts from thread number: {thread_index+1}")
+                self.logger(
+                    f"Extracting posts from thread number: {thread_index+1}",
+                    level=DEBUG,
+                )
                 thread_id = threads["no"]
                 req = f"https://a.4cdn.org/{board}/thread/{thread_id}.json"
                 thread_content = json.loads(requests.get(req).content)[
@@ -42,7 +48,8 @@ class FourChan(Selector):
                 ]  # thread content is a list of posts
                 for post_index, post in enumerate(thread_content):
                     self.logger(
-                        f"Extracting media and comments from post number: {post_index+1}"
+                        f"Extracting media and comments from post number: {post_index+1}",
+                        level=DEBUG,
                     )
                     post_row = []
                     post_row.append(post["no"])
@@ -75,16 +82,11 @@ class FourChan(Selector):
                         post_row.append("")
                         post_row.append("")
                         post_row.append("")
-                    results.append(post_row)
+                    yield post_row
         self.logger("Scraping metadata complete")
-        results.insert(
-            0, ["id", "thread_id", "datetime", "comment", "filename", "ext", "url"]
-        )
-        return LocalElementsIndex(results)
 
-    def retrieve_element(self, element, _):
-        base = TMP / element.id
-        base.mkdir(parents=True, exist_ok=True)
+    async def retrieve_element_async(self, element, _):
+        base = self.staging_path(element)
 
         fn = element.filename
         identifier = element.id
@@ -95,7 +97,7 @@ class FourChan(Selector):
             f.write(comment)
 
         if url != "":
-            urlretrieve(url, base / fn)
+            await self.download(url, base / fn)
 
         return Etype.cast(element.id, files(base))
 
@@ -2,6 +2,7 @@ import os
 from pathlib import Path
 from shutil import copyfile
 from lib.common.selector import Selector
+from lib.common.logs import DEBUG
 from lib.common.etypes import Etype, Index
 from lib.common.exceptions import SelectorIndexError
 
@@ -22,6 +23,7 @@ class Local(Selector):
     """
 
     out_etype = Etype.Any
+    index_columns = ["id", "path"]
 
     def __init__(self, *args):
         super().__init__(*args)
@@ -51,7 +53,7 @@ class Local(Selector):
                 fp = root / file
                 elid = root.name if (root.name != main.name) else fp.stem
                 results.append([elid, fp])
-                self.logger(f"indexed file {fp} as: {elid}")
+                self.logger(f"indexed file {fp} as: {elid}", level=DEBUG)
         if self.is_aggregate():
             # `self.results` used in `retrieve_element` for paths.
             self.results = results[1:]
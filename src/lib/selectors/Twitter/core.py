@@ -1,14 +1,11 @@
 import twint
 import json
-from urllib.request import urlretrieve
-from pathlib import Path
+import asyncio
 from lib.common.selector import Selector
 from lib.common.etypes import Etype, LocalElementsIndex
 from lib.common.util import files
 from lib.util.twint import to_serializable
 
-TMP = Path("/tmp")
-
 
 class Twitter(Selector):
     """A selector for scraping tweets.
@@ -32,9 +29,8 @@ class Twitter(Selector):
         tweets = to_serializable(twint.output.tweets_list, as_list=True)
         return LocalElementsIndex(tweets)
 
-    def retrieve_element(self, element, _):
-        base = TMP / element.id
-        base.mkdir(parents=True, exist_ok=True)
+    async def retrieve_element_async(self, element, _):
+        base = self.staging_path(element)
         with open(base / "tweet.json", "w+") as fp:
             json.dump(element.__dict__, fp)
 
@@ -45,18 +41,17 @@ class Twitter(Selector):
                 self.logger(f"{element.id} downloaded.")
                 return Etype.cast(element.id, files(base))
 
-            for url in photos:
-                fname = url.rsplit("/", 1)[-1]
-                urlretrieve(url, base / fname)
+            await asyncio.gather(
+                *[self.download(url, base / url.rsplit("/", 1)[-1]) for url in photos]
+            )
 
             self.logger(f"{element.id} downloaded (with images).")
 
         if "download_videos" in self.config and self.config.download_videos:
             if hasattr(element, "video") and element.video != "":
                 fname = element.video.rsplit("/", 1)[-1]
-                urlretrieve(element.video, base / fname)
+                await self.download(element.video, base / fname)
 
-        self.disk.delete_local_on_write = True
         return Etype.cast(element.id, files(base))
 
 
@@ -6,6 +6,7 @@ import math
 from subprocess import call, STDOUT
 from pathlib import Path
 from lib.common.selector import Selector
+from lib.common.logs import DEBUG
 from lib.common.etypes import Etype, Union, LocalElementsIndex
 from lib.common.util import files
 from lib.common.exceptions import ElementShouldSkipError
@@ -18,11 +19,13 @@ from googleapiclient.errors import HttpError
 YOUTUBE_API_SERVICE_NAME = "youtube"
 YOUTUBE_API_VERSION = "v3"
 API_KEY = os.environ.get("GOOGLE_API_KEY")
-TMP = Path("/tmp")
 
 
 class Youtube(Selector):
     out_etype = Union(Etype.Json, Etype.Video)
+    # retrieval is bound by downloads rather than CPU
+    executor = "threads"
+    index_columns = ["id", "url"]
 
     def index(self, _) -> LocalElementsIndex:
         results = self._run()
@@ -34,23 +37,22 @@ class Youtube(Selector):
         return None
 
     def pre_retrieve(self, _):
-        self.ydl = yt_dlp.YoutubeDL(
-            {
-                "outtmpl": f"{TMP}/%(id)s/%(id)s.mp4",
-                "format": "worstvideo[ext=mp4]",
-            }
-        )
+        self.ydl_opts = {
+            "format": "worstvideo[ext=mp4]",
+        }
 
     def retrieve_element(self, element, _):
-        with self.ydl:
+        base = self.staging_path(element)
+        opts = {**self.ydl_opts, "outtmpl": f"{base}/%(id)s.mp4"}
+        # NB: a YoutubeDL per element, as elements may be retrieved in threads
+        with yt_dlp.YoutubeDL(opts) as ydl:
             try:
-                result = self.ydl.extract_info(element.url)
-                meta = TMP / element.id / "meta.json"
+                result = ydl.extract_info(element.url)
+                meta = base / "meta.json"
                 with open(meta, "w+") as fp:
                     json.dump(result, fp)
                 self.logger(f"{element.id}: video and meta downloaded successfully.")
-                self.disk.delete_local_on_write = True
-                return Etype.cast(element.id, files(TMP / element.id))
+                return Etype.cast(element.id, files(base))
             except yt_dlp.utils.DownloadError:
                 raise ElementShouldSkipError(
                     f"Something went wrong downloading {element.id}. It may have been deleted."
@@ -127,7 +129,7 @@ class Youtube(Selector):
             s_res = self._youtube_search(args)
             count = 1
             while True:
-                self.logger(f"\tScraping page {count}...")
+                self.logger(f"\tScraping page {count}...", level=DEBUG)
                 count += 1
                 csv_obj = self._add_to_csv_obj(csv_obj, s_res.get("items", []))
 
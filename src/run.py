@@ -24,17 +24,51 @@ Attributes:
 
 """
 import os
+import sys
 import yaml
+import lib.common.mtmodule as mtmodule
 from validate import validate_yaml
-from lib.common.get import get_module
-from lib.common.storage import LocalStorage
+from lib.common.get import get_module, module_path
+from lib.common.storage import LocalStorage, STORAGE, LOCAL, S3
+from lib.common.workerpool import preload
+from lib.common.writes import WRITE_STRATEGIES
+from lib.common.blobs import BLOBS
+from lib.common.columnar import INDEX_FORMAT, CSV
+from lib.common.archives import (
+    ARCHIVE_MIN_FILES,
+    ARCHIVE_SHARD_MB,
+    DEFAULT_ARCHIVE_SHARD_MB,
+)
+from lib.common.logs import (
+    LOG_MAX_MB,
+    LOG_BACKUPS,
+    DEFAULT_LOG_MAX_MB,
+    DEFAULT_LOG_BACKUPS,
+)
 
 CONFIG_PATH = "/run_args.yaml"
 
 
 def make_storage(cfg: dict) -> LocalStorage:
-    # TODO: generalise `folder` here to a `storage` var that is passed from YAML
-    return LocalStorage(folder=cfg["folder"])
+    # the folder's elements are kept in it, or in an object store with the options in `storage` (see
+    # lib/common/s3storage.py), with the folder as a cache
+    options = dict(cfg.get(STORAGE) or {})
+    Storage = LocalStorage
+    if options.pop("type", LOCAL) == S3:
+        # NB: imported here, so that boto3 is only needed by folders kept in an object store
+        from lib.common.s3storage import S3Storage as Storage
+    return Storage(
+        **options,
+        folder=cfg["folder"],
+        catalog=cfg.get("catalog", False),
+        write_strategies=cfg.get(WRITE_STRATEGIES),
+        blobs=cfg.get(BLOBS, False),
+        index_format=cfg.get(INDEX_FORMAT, CSV),
+        log_max_mb=cfg.get(LOG_MAX_MB, DEFAULT_LOG_MAX_MB),
+        log_backups=cfg.get(LOG_BACKUPS, DEFAULT_LOG_BACKUPS),
+        archive_min_files=cfg.get(ARCHIVE_MIN_FILES),
+        archive_shard_mb=cfg.get(ARCHIVE_SHARD_MB, DEFAULT_ARCHIVE_SHARD_MB),
+    )
 
 
 def _run_analyser(ana: dict, base_cfg: dict, cfg: dict):
@@ -48,11 +82,25 @@ def _run_analyser(ana: dict, base_cfg: dict, cfg: dict):
     analyser.start_analysing()
 
 
-def _run_yaml():
-    with open(CONFIG_PATH, "r") as c:
+def _preload_modules(cfg: dict):
+    # NB: the forkserver pool's workers start with every module in the run imported, in case any use the pool
+    analysers = cfg.get("analyse", [])
+    if isinstance(analysers, dict):
+        analysers = [analysers]
+    modules = [module_path("analyse", ana["name"]) for ana in analysers]
+    if "select" in cfg:
+        modules.insert(0, module_path("select", cfg["select"]["name"]))
+    preload(modules)
+
+
+def _run_yaml(config_path=CONFIG_PATH):
+    with open(config_path, "r") as c:
         cfg = yaml.safe_load(c)
+    # NB: modules record the config they were run with, which is read again from the same path
+    mtmodule.CONFIG_PATH = config_path
 
     validate_yaml(cfg)
+    _preload_modules(cfg)
 
     base_cfg = {}
     if "select" not in cfg and "elements_in" in cfg:
@@ -90,4 +138,5 @@ def _run_yaml():
 
 
 if __name__ == "__main__":
-    _run_yaml()
+    # NB: a config path can be passed in place of the one the container mounts
+    _run_yaml(*sys.argv[1:2])
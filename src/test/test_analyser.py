@@ -1,9 +1,15 @@
 import pytest
 import os
 import json
+import numpy as np
 from pathlib import Path
 from lib.common.analyser import Analyser
-from lib.common.exceptions import InvalidAnalyserElements, InvalidCarry
+from lib.common.exceptions import (
+    InvalidAnalyserElements,
+    InvalidCarry,
+    ElementShouldRetryError,
+    InferenceServerError,
+)
 from lib.common.etypes import Etype
 from lib.common.mtmodule import MTModule
 from lib.common.storage import LocalStorage
@@ -35,6 +41,60 @@ class TxtCopyAnalyser(Analyser):
             return element
 
 
+class BatchCopyAnalyser(Analyser):
+    out_etype = Etype.Any
+    batch_sizes = []
+
+    def analyse_element(self, element, config):
+        out = Path(f"/tmp/{self.name}/{element.id}")
+        out.mkdir(parents=True, exist_ok=True)
+        with open(out / "copy.txt", "w") as f:
+            f.write(element.id)
+        return Etype.Any(element.id, out / "copy.txt")
+
+    def analyse_batch(self, elements, config):
+        if config.get("fail_batches"):
+            raise ElementShouldRetryError("batch too large")
+        self.batch_sizes.append(len(elements))
+        return [self.analyse_element(el, config) for el in elements]
+
+
+class ParallelBatchCopyAnalyser(BatchCopyAnalyser):
+    in_parallel = True
+
+
+class StagingCopyAnalyser(Analyser):
+    out_etype = Etype.Any
+    in_parallel = True
+
+    def analyse_element(self, element, config):
+        out = self.staging_path(element)
+        with open(out / "copy.txt", "w") as f:
+            f.write(element.id)
+        return Etype.Any(element.id, out / "copy.txt")
+
+
+class InferenceAnalyser(Analyser):
+    out_etype = Etype.Any
+    in_parallel = True
+
+    def pre_analyse(self, config):
+        if config.get("fail_load"):
+            raise Exception("no weights")
+        self.weights = np.full(4, 2.0)
+
+    def predict(self, inputs, config):
+        return [(os.getpid(), float(row @ self.weights)) for row in inputs]
+
+    def analyse_element(self, element, config):
+        rows = np.ones((3, 4)) * int(element.id[-1])
+        out = Path(f"/tmp/{self.name}/{element.id}")
+        out.mkdir(parents=True, exist_ok=True)
+        with open(out / "preds.json", "w") as f:
+            json.dump(self.infer(rows), f)
+        return Etype.Any(element.id, out / "preds.json")
+
+
 # TODO: test casting errors via an analyser with explicit etype
 @pytest.fixture
 def additionals(utils):
@@ -106,3 +166,122 @@ def test_analyse(utils, additionals):
             lines = f.readlines()
             assert len(lines) == 1
             assert lines[0] == "Hello"
+
+
+@pytest.mark.parametrize(
+    "cls,config",
+    [
+        (BatchCopyAnalyser, {"in_parallel": False}),
+        (BatchCopyAnalyser, {"in_parallel": False, "fail_batches": True}),
+        (ParallelBatchCopyAnalyser, {"executor": "threads", "workers": 2}),
+    ],
+)
+def test_analyse_batch(utils, additionals, cls, config):
+    cls.batch_sizes = []
+    for el in additionals.sel2_elements:
+        with open(f"{utils.get_element_path('sel2', el)}/item.txt", "w") as f:
+            f.write(el)
+    analyser = cls(
+        {"elements_in": ["sel2"], "batch_size": 2, **config},
+        "batchAnalyser",
+        LocalStorage(folder=utils.TEMP_ELEMENT_DIR),
+    )
+    assert analyser.analyses_batches
+    analyser.start_analysing()
+
+    if config.get("fail_batches"):
+        # every element was analysed on its own instead
+        assert cls.batch_sizes == []
+    else:
+        assert sorted(cls.batch_sizes) == [1, 2]
+    for el in additionals.sel2_elements:
+        with open(
+            f"{analyser.disk.base_dir}/sel2/{analyser.disk.ANALYSED_EXT}/batchAnalyser/{el}/copy.txt",
+            "r",
+        ) as f:
+            assert f.read() == el
+
+
+def test_staging_path(utils, additionals):
+    for el in additionals.sel2_elements:
+        with open(f"{utils.get_element_path('sel2', el)}/item.txt", "w") as f:
+            f.write(el)
+    analyser = StagingCopyAnalyser(
+        {"elements_in": ["sel2"]},
+        "stagingAnalyser",
+        LocalStorage(folder=utils.TEMP_ELEMENT_DIR),
+    )
+    staging = analyser.disk.base_dir / analyser.disk.STAGING_DIR
+    el = analyser.disk.read_elements(["sel2"])[0]
+    assert analyser.staging_path(el) == staging / f"sel2.stagingAnalyser.{el.id}"
+    analyser.start_analysing()
+    for el in additionals.sel2_elements:
+        with open(
+            f"{analyser.disk.base_dir}/sel2/{analyser.disk.ANALYSED_EXT}/stagingAnalyser/{el}/copy.txt",
+            "r",
+        ) as f:
+            assert f.read() == el
+    # every element's scratch dir was renamed into place
+    assert os.listdir(staging) == []
+
+
+def test_inference_server(utils, additionals):
+    for el in additionals.sel2_elements:
+        with open(f"{utils.get_element_path('sel2', el)}/item.txt", "w") as f:
+            f.write(el)
+    analyser = InferenceAnalyser(
+        {"elements_in": ["sel2"], "inference_slot_mb": 1},
+        "inferenceAnalyser",
+        LocalStorage(folder=utils.TEMP_ELEMENT_DIR),
+    )
+    assert analyser.uses_inference_server
+    analyser.start_analysing()
+
+    pids = set()
+    for el in additionals.sel2_elements:
+        with open(
+            f"{analyser.disk.base_dir}/sel2/{analyser.disk.ANALYSED_EXT}/inferenceAnalyser/{el}/preds.json",
+            "r",
+        ) as f:
+            preds = json.load(f)
+        assert [p[1] for p in preds] == [8.0 * int(el[-1])] * 3
+        pids |= {p[0] for p in preds}
+    # every prediction was made by the one server process
+    assert len(pids) == 1
+    assert os.getpid() not in pids
+
+    failing = InferenceAnalyser(
+        {"elements_in": ["sel2"], "fail_load": True},
+        "failingAnalyser",
+        LocalStorage(folder=utils.TEMP_ELEMENT_DIR),
+    )
+    with pytest.raises(InferenceServerError, match="no weights"):
+        failing.start_analysing()
+
+
+def test_worker_pool(utils, additionals):
+    for el in additionals.sel2_elements:
+        with open(f"{utils.get_element_path('sel2', el)}/item.txt", "w") as f:
+            f.write(el)
+    analyser = InferenceAnalyser(
+        {"elements_in": ["sel2"], "executor": "forkserver", "workers": 2},
+        "pooledAnalyser",
+        LocalStorage(folder=utils.TEMP_ELEMENT_DIR),
+    )
+    assert analyser.uses_worker_pool
+    assert not analyser.uses_inference_server
+    analyser.start_analysing()
+
+    pids = set()
+    for el in additionals.sel2_elements:
+        with open(
+            f"{analyser.disk.base_dir}/sel2/{analyser.disk.ANALYSED_EXT}/pooledAnalyser/{el}/preds.json",
+            "r",
+        ) as f:
+            preds = json.load(f)
+        assert [p[1] for p in preds] == [8.0 * int(el[-1])] * 3
+        pids |= {p[0] for p in preds}
+    # predictions are made in the pool's workers, each of which loaded the weights itself
+    assert 0 < len(pids) <= 2
+    assert os.getpid() not in pids
+    assert not hasattr(analyser, "weights")
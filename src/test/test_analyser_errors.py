@@ -42,7 +42,7 @@ def additionals(utils):
         with open(f"{utils.get_element_path(obj.selname, element)}/out.txt", "w") as f:
             f.write("something")
 
-    goodConfig = {"elements_in": [obj.selname], "dev": True}
+    goodConfig = {"elements_in": [obj.selname], "dev": True, "retry_delay_ms": 1}
 
     obj.an = ErrorThrowingAnalyser(
         goodConfig, "analyserErrorSelector", LocalStorage(folder=utils.TEMP_ELEMENT_DIR)
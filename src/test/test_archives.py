@@ -0,0 +1,98 @@
+import os
+import pickle
+import tarfile
+import pytest
+from lib.common.archives import MemberPath, readable, INDEX_FILE
+from lib.common.etypes import Etype, Union, Array
+from lib.common.scheduler import element_size
+from lib.common.storage import LocalStorage
+
+FRAMES = [f"{idx:04d}.bmp" for idx in range(1, 6)]
+
+
+@pytest.fixture
+def additionals(utils):
+    obj = lambda: None
+    # NB: shards of 4KB, which hold three of the frames below each
+    obj.disk = LocalStorage(
+        folder=utils.TEMP_ELEMENT_DIR,
+        catalog=True,
+        archive_min_files=3,
+        archive_shard_mb=0.004,
+    )
+    obj.src = obj.disk.base_dir / ".src"
+    obj.src.mkdir()
+    obj.frames = [obj.src / name for name in FRAMES]
+    for idx, p in enumerate(obj.frames):
+        with open(p, "wb") as f:
+            f.write(bytes([idx]) * 700)
+    with open(obj.src / "meta.json", "w") as f:
+        f.write("{}")
+    yield obj
+    utils.cleanup()
+
+
+def test_write_archive(additionals):
+    disk, src, frames = additionals.disk, additionals.src, additionals.frames
+    disk.write_element("sel", Etype.Any("el1", frames + [src / "meta.json"]))
+    el_dir = disk.read_query("sel") / "el1"
+    assert sorted(os.listdir(el_dir)) == [
+        "members-000000.tar",
+        "members-000001.tar",
+        INDEX_FILE,
+        "meta.json",
+    ]
+    # the shards are ordinary tars, which tools such as WebDataset read as they are
+    with tarfile.open(el_dir / "members-000000.tar") as tar:
+        assert tar.getnames() == FRAMES[:3]
+        assert tar.extractfile("0002.bmp").read() == bytes([1]) * 700
+
+    # an element with fewer files than `archive_min_files` is written as it is
+    disk.write_element("sel", Etype.Any("el2", frames[:2]))
+    assert sorted(os.listdir(disk.read_query("sel") / "el2")) == FRAMES[:2]
+
+
+@pytest.mark.parametrize("catalog", [True, False])
+def test_read_archive(additionals, catalog):
+    disk, src, frames = additionals.disk, additionals.src, additionals.frames
+    if not catalog:
+        disk.catalog = None
+    disk.write_element("sel", Etype.Any("el1", frames + [src / "meta.json"]))
+
+    el = disk.read_elements(["sel"])[0]
+    members = [p for p in el.paths if isinstance(p, MemberPath)]
+    assert [p.name for p in members] == FRAMES
+    assert sorted(p.name for p in el.paths) == FRAMES + ["meta.json"]
+    assert el.et == Union(Array(Etype.Image), Etype.Json)
+    assert all(p.parent == disk.read_query("sel") / "el1" for p in el.paths)
+
+    # members are read from their shards, as bytes or as a file
+    assert [p.read_bytes() for p in members] == [bytes([i]) * 700 for i in range(5)]
+    assert readable(members[4]).read() == bytes([4]) * 700
+    assert readable(src / "meta.json") == src / "meta.json"
+    assert element_size(el) == 5 * 700 + 2
+
+    # and can be sent to workers
+    member = pickle.loads(pickle.dumps(members[3]))
+    assert member.shard.name == "members-000001.tar"
+    assert member.read_bytes() == bytes([3]) * 700
+
+
+def test_rewrite_archive(additionals):
+    disk, frames = additionals.disk, additionals.frames
+    disk.write_element("sel", Etype.Image.array()("el1", frames))
+    el = disk.read_elements(["sel"])[0]
+
+    # the members of an element that was read are archived again by a module that passes them through
+    disk.write_element("sel/ana", Etype.Image.array()("el1", el.paths[1:]))
+    assert len(os.listdir(disk.read_query("sel/ana") / "el1")) == 3
+    read = disk.read_elements(["sel/ana"])[0]
+    assert [p.read_bytes() for p in read.paths] == [
+        bytes([i]) * 700 for i in range(1, 5)
+    ]
+
+    # or copied out of it, if there are too few to archive
+    disk.write_element("sel/few", Etype.Image.array()("el1", el.paths[:2]))
+    few = disk.read_query("sel/few") / "el1"
+    assert sorted(os.listdir(few)) == FRAMES[:2]
+    assert (few / FRAMES[1]).read_bytes() == bytes([1]) * 700
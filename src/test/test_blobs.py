@@ -0,0 +1,73 @@
+import os
+import hashlib
+import pytest
+from lib.common.blobs import hash_file, BLOBS_DIR
+from lib.common.etypes import Etype
+from lib.common.storage import LocalStorage
+from lib.common.writes import write_stats, diff_stats, DEDUP
+
+
+@pytest.fixture
+def additionals(utils):
+    obj = lambda: None
+    obj.disk = LocalStorage(folder=utils.TEMP_ELEMENT_DIR, blobs=True)
+    obj.src = obj.disk.base_dir / ".src"
+    obj.src.mkdir()
+    for name, body in [("a.jpg", "a"), ("b.jpg", "a"), ("c.jpg", "c")]:
+        with open(obj.src / name, "w") as f:
+            f.write(body * 1000)
+    yield obj
+    utils.cleanup()
+
+
+def test_hash_file(additionals):
+    path = additionals.src / "a.jpg"
+    assert hash_file(path) == hashlib.sha256(b"a" * 1000).hexdigest()
+    paths = [additionals.src / n for n in ["a.jpg", "b.jpg", "c.jpg"]]
+    assert additionals.disk.blobs.hash_files(paths) == [hash_file(p) for p in paths]
+
+
+def test_dedup(additionals):
+    disk, src = additionals.disk, additionals.src
+    before = write_stats()
+    disk.write_element("sel", Etype.Any("el1", [src / "a.jpg", src / "c.jpg"]))
+    disk.write_element("sel", Etype.Image("el2", src / "b.jpg"))
+    disk.write_element("sel/ana", Etype.Image("el1", src / "a.jpg"))
+    # the bodies of the three identical files are stored once
+    assert len(list(disk.blobs.blobs())) == 2
+    assert diff_stats(write_stats(), before)[DEDUP] == [2, 2000]
+
+    # elements are read as ordinary files in their dirs
+    els = disk.read_elements(["sel"])
+    assert [[p.name for p in el.paths] for el in els] == [["a.jpg", "c.jpg"], ["b.jpg"]]
+    assert all(
+        p.parent.parent == disk.read_query("sel") for el in els for p in el.paths
+    )
+    assert els[1].paths[0].read_text() == "a" * 1000
+    assert os.stat(els[0].paths[0]).st_ino == os.stat(els[1].paths[0]).st_ino
+    assert list(disk.read_all_media().keys()) == ["sel"]
+
+    report = disk.blobs.report()
+    assert report["stored_bytes"] == 2000
+    assert report["referenced_bytes"] == 4000
+    assert report["saved_bytes"] == 2000
+
+
+def test_gc(additionals):
+    disk, src = additionals.disk, additionals.src
+    disk.write_element("sel", Etype.Image("el1", src / "a.jpg"))
+    disk.write_element("sel", Etype.Image("el2", src / "c.jpg"))
+    disk.remove_element("sel", "el2")
+    assert disk.blobs.report()["unreferenced"] == 1
+    assert disk.blobs.gc() == 1
+    assert len(list(disk.blobs.blobs())) == 1
+    assert disk.read_elements(["sel"])[0].paths[0].read_text() == "a" * 1000
+
+
+def test_move(additionals):
+    disk, src = additionals.disk, additionals.src
+    disk.delete_local_on_write = True
+    disk.write_element("sel", Etype.Image("el1", src / "a.jpg"))
+    disk.write_element("sel", Etype.Image("el2", src / "b.jpg"))
+    assert not (src / "a.jpg").exists() and not (src / "b.jpg").exists()
+    assert len(list((disk.base_dir / BLOBS_DIR).glob("*/*"))) == 1
@@ -0,0 +1,64 @@
+import os
+import shutil
+import pytest
+from lib.common.catalog import reconcile, CATALOG_FILE
+from lib.common.etypes import Etype
+from lib.common.storage import LocalStorage
+
+
+@pytest.fixture
+def additionals(utils):
+    obj = lambda: None
+    obj.disk = LocalStorage(folder=utils.TEMP_ELEMENT_DIR, catalog=True)
+    obj.uncatalogued = LocalStorage(folder=utils.TEMP_ELEMENT_DIR, catalog=False)
+    obj.src = obj.disk.base_dir / ".src"
+    obj.src.mkdir()
+    for name in ["a.jpg", "b.jpg", "c.json", "d.txt"]:
+        with open(obj.src / name, "w") as f:
+            f.write(name)
+    yield obj
+    utils.cleanup()
+
+
+def as_tuples(els):
+    return sorted((el.id, el.query, sorted(el.paths), str(el.et)) for el in els)
+
+
+def test_write_and_read(additionals):
+    disk, src = additionals.disk, additionals.src
+    disk.write_element("sel", Etype.Image("el1", src / "a.jpg"))
+    disk.write_element("sel", Etype.Any("el2", [src / "a.jpg", src / "b.jpg"]))
+    disk.write_element("sel", Etype.Any("el3", [src / "b.jpg", src / "c.json"]))
+    disk.write_element("sel/ana", Etype.Any("el1", src / "d.txt"))
+    assert os.path.exists(disk.base_dir / CATALOG_FILE)
+
+    # elements are read from the catalog as they would be cast from disk
+    for qs in [["sel"], ["sel/ana"], ["sel", "sel/ana"]]:
+        read = disk.read_elements(qs)
+        assert as_tuples(read) == as_tuples(additionals.uncatalogued.read_elements(qs))
+    assert [str(el.et) for el in disk.read_elements(["sel"])] == [
+        "Image",
+        "Array(Image)",
+        "Union(Image, Json)",
+    ]
+    assert disk.read_all_media() == additionals.uncatalogued.read_all_media()
+
+    disk.remove_element("sel", "el2")
+    assert [el.id for el in disk.read_elements(["sel"])] == ["el1", "el3"]
+
+
+def test_served_from_catalog(additionals):
+    disk, src = additionals.disk, additionals.src
+    for idx in range(5):
+        disk.write_element("sel", Etype.Image(f"el{idx}", src / "a.jpg"))
+    assert len(disk.read_elements(["sel"])) == 5
+
+    # a file added within an element's dir is only picked up once the catalog is reconciled
+    shutil.copyfile(src / "b.jpg", disk.read_query("sel") / "el0" / "b.jpg")
+    assert len(disk.read_elements(["sel"])[0].paths) == 1
+    assert reconcile(disk) == {"sel": 5}
+    assert len(disk.read_elements(["sel"])[0].paths) == 2
+
+    # an element dir added other than through the storage is noticed straight away
+    shutil.copytree(disk.read_query("sel") / "el1", disk.read_query("sel") / "el9")
+    assert [el.id for el in disk.read_elements(["sel"])][-1] == "el9"
@@ -0,0 +1,89 @@
+import time
+import pytest
+from lib.common.columnar import write_columnar, as_lists, ColumnarIndex, CSV, COLUMNAR
+from lib.common.etypes import LocalElementsIndex
+from lib.common.storage import LocalStorage
+
+HEADER = ["id", "comment", "url"]
+ROWS = [
+    [1, "plain", "https://a"],
+    [2, "with, a comma\nand a line", ""],
+    [3, "ünïcødé ☃", None],
+    [4, "", "https://d"],
+    [5, "last", "https://e"],
+]
+
+
+@pytest.fixture
+def additionals(utils):
+    obj = lambda: None
+    obj.disk = LocalStorage(folder=utils.TEMP_ELEMENT_DIR)
+    obj.path = obj.disk.base_dir / "index.cols"
+    yield obj
+    utils.cleanup()
+
+
+def test_write_and_read(additionals):
+    # rows are written in groups of two, and may be any sequence
+    rows = [HEADER] + [tuple(r) for r in ROWS]
+    assert write_columnar(additionals.path, iter(rows), row_group_size=2) == 5
+    index = ColumnarIndex(additionals.path)
+    assert index.groups == [2, 2, 1]
+    assert len(index) == 5
+    read = list(index.rows())
+    assert [r.id for r in read] == ["1", "2", "3", "4", "5"]
+    assert read[1].comment == "with, a comma\nand a line"
+    assert read[2].comment == "ünïcødé ☃"
+    # values are read back as they would be from element_map.csv
+    assert read[2].url == ""
+
+    # only the columns that are asked for are read
+    projected = list(index.rows(["url", "id"]))
+    assert vars(projected[0]) == {"id": "1", "url": "https://a"}
+    assert list(as_lists(read))[:2] == [HEADER, ["1", "plain", "https://a"]]
+
+
+@pytest.mark.parametrize("fmt", [CSV, COLUMNAR])
+def test_elements_index(additionals, fmt):
+    disk = LocalStorage(folder=additionals.disk.base_dir, index_format=fmt)
+    disk.write_elements_index("sel", LocalElementsIndex(r for r in [HEADER] + ROWS))
+    assert disk.elements_index_format("sel") == fmt
+    rows = list(disk.read_elements_index("sel").rows)
+    assert [vars(r) for r in rows][1] == {
+        "id": "2",
+        "comment": "with, a comma\nand a line",
+        "url": "",
+    }
+    assert [vars(r) for r in disk.read_elements_index("sel", ["id"]).rows] == [
+        {"id": str(i)} for i in range(1, 6)
+    ]
+
+    # element_map.csv is written whatever the format
+    csv_file = disk.read_query("sel") / disk.ELEMENTS_INDEX_FILE
+    assert csv_file.exists()
+
+    # an index written in the other format replaces it, so that one is exported to or imported from the other
+    other = LocalStorage(
+        folder=additionals.disk.base_dir,
+        index_format=CSV if fmt == COLUMNAR else COLUMNAR,
+    )
+    other.write_elements_index("sel", LocalElementsIndex(as_lists(iter(rows))))
+    assert disk.elements_index_format("sel") != fmt
+    assert csv_file.exists()
+    assert [vars(r) for r in disk.read_elements_index("sel").rows] == [
+        vars(r) for r in rows
+    ]
+
+
+def test_csv_changed(additionals):
+    disk = LocalStorage(folder=additionals.disk.base_dir, index_format=COLUMNAR)
+    disk.write_elements_index("sel", LocalElementsIndex(r for r in [HEADER] + ROWS))
+    assert disk.elements_index_format("sel") == COLUMNAR
+
+    # an element_map.csv that is changed by hand is read in place of the columnar index written with it. NB: file
+    # times may only change with each tick of the kernel's clock
+    time.sleep(0.05)
+    with open(disk.read_query("sel") / disk.ELEMENTS_INDEX_FILE, "a") as f:
+        f.write("6,added,https://f\n")
+    assert disk.elements_index_format("sel") == CSV
+    assert [r.id for r in disk.read_elements_index("sel").rows][-1] == "6"
@@ -1,4 +1,5 @@
 import pytest
+import pickle
 from types import SimpleNamespace as Ns
 from pathlib import Path
 from lib.common.etypes import Etype, Union, Array, all_etypes, cast
@@ -23,12 +24,14 @@ def base():
     obj.im1 = Path("/tmp/1.png")
     obj.im2 = Path("/tmp/2.jpg")
     obj.im3 = Path("/tmp/3.bmp")
+    obj.im4 = Path("/tmp/4.webp")
     obj.aud1 = Path("/tmp/1.mp3")
     write_stub(obj.txt1)
     write_stub(obj.md1)
     write_stub(obj.im1)
     write_stub(obj.im2)
     write_stub(obj.im3)
+    write_stub(obj.im4)
     write_stub(obj.aud1)
     write_stub(obj.scoresjson1)
     write_stub(obj.json2)
@@ -89,6 +92,8 @@ def test_Array(base):
     assert len(has1.paths) == 1
     has3 = ImArr(base.id, [base.im1, base.im2, base.im3])
     assert len(has3.paths) == 3
+    has4 = ImArr(base.id, [base.im1, base.im2, base.im3, base.im4])
+    assert len(has4.paths) == 4
     has2 = ImArr(base.id, [base.im1, base.md1, base.txt1, base.im3])
     assert len(has2.paths) == 2
 
@@ -166,9 +171,9 @@ def test_custom_etypes(base):
     cvjson_et = CvJson(CvJson.__name__, CvJson.filter)
     assert cvjson_et in all_ets
 
-    cvj1 = cvjson_et(base.id, [base.im1, base.im2, base.scoresjson1])
+    cvj1 = cvjson_et(base.id, [base.im1, base.im2, base.im4, base.scoresjson1])
 
-    assert len(cvj1.paths) == 3
+    assert len(cvj1.paths) == 4
     assert cvj1.et == cvjson_et
 
     with pytest.raises(EtypeCastError):
@@ -177,3 +182,18 @@ def test_custom_etypes(base):
     # CvJson.filter).
     with pytest.raises(EtypeCastError):
         cvjson_et(base.id, [base.im1, base.json2])
+
+
+def test_pickle(base):
+    # elements are pickled to send them to worker processes
+    for el in [
+        cast(base.id, [base.im1]),
+        cast(base.id, [base.im1, base.im2, base.aud1]),
+        Etype.CvJson(base.id, [base.im1, base.scoresjson1]),
+    ]:
+        unpickled = pickle.loads(pickle.dumps(el))
+        assert unpickled.id == el.id
+        assert unpickled.paths == el.paths
+        assert unpickled.et == el.et
+        if not el.et.is_union:
+            assert unpickled.et.filter(el.paths) == el.et.filter(el.paths)
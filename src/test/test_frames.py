@@ -0,0 +1,38 @@
+import pytest
+from lib.analysers.Frames.core import output_args, frame_codec
+from lib.common.exceptions import InvalidAnalyserConfigError
+
+
+def test_output_args():
+    # frames are bitmaps by default, as they always have been
+    assert frame_codec({}) == "bmp"
+    assert output_args({}) == []
+
+    assert frame_codec({"codec": "JPEG"}) == "jpg"
+    assert output_args({"codec": "jpg", "quality": 100}) == [
+        "-q:v",
+        "2",
+        "-pix_fmt",
+        "yuvj420p",
+    ]
+    assert output_args({"codec": "jpg", "quality": 1})[:2] == ["-q:v", "31"]
+    assert output_args({"codec": "webp", "quality": 75}) == [
+        "-c:v",
+        "libwebp",
+        "-quality",
+        "75",
+    ]
+    # PNGs are lossless, so a quality does nothing
+    assert output_args({"codec": "png", "quality": 75}) == []
+
+    assert output_args({"codec": "webp", "max_dimension": 720})[4:] == [
+        "-vf",
+        "scale='min(iw,720)':'min(ih,720)':force_original_aspect_ratio=decrease",
+    ]
+
+
+def test_invalid_config():
+    with pytest.raises(InvalidAnalyserConfigError):
+        output_args({"codec": "gif"})
+    with pytest.raises(InvalidAnalyserConfigError):
+        output_args({"codec": "jpg", "quality": 0})
@@ -0,0 +1,35 @@
+import json
+import shutil
+import pytest
+from lib.common.etypes import Etype
+from lib.common.storage import LocalStorage
+
+pytest.importorskip("imagededup")
+from lib.analysers.ImageDedup.core import ImageDedup
+
+
+@pytest.fixture
+def additionals(utils):
+    obj = lambda: None
+    obj.disk = LocalStorage(folder=utils.TEMP_ELEMENT_DIR)
+    obj.src = obj.disk.base_dir / ".src"
+    obj.src.mkdir(parents=True)
+    for name in ["0001.jpeg", "0002.jpeg"]:
+        shutil.copyfile(utils.STUB_PATHS.imagejpg, obj.src / name)
+    with open(obj.src / "meta.json", "w") as f:
+        json.dump({"source": "test"}, f)
+    yield obj
+    utils.cleanup()
+
+
+def test_dedup_skips_other_files(additionals):
+    config = {"elements_in": ["sel"]}
+    an = ImageDedup(config, "ImageDedup", additionals.disk)
+    an.pre_analyse(config)
+    paths = sorted(additionals.src.iterdir())
+    el = Etype.Any("el1", paths)
+
+    # one of the two copies of the image is removed, and the element's metadata is neither hashed nor passed on
+    deduped = an.analyse_element(el, config)
+    assert len(deduped.paths) == 1
+    assert deduped.paths[0].name in ["0001.jpeg", "0002.jpeg"]
@@ -0,0 +1,69 @@
+import pytest
+import numpy as np
+from threading import Thread
+from lib.common.inference import InferenceServer
+from lib.common.exceptions import InferenceServerError
+
+
+class Doubler:
+    def __init__(self, config):
+        self.config = config
+
+    def pre_analyse(self, config):
+        self.factor = 2
+
+    def flush_logs(self):
+        pass
+
+    def predict(self, inputs, config):
+        if (inputs < 0).any():
+            raise Exception("negative input")
+        # each result also records how many rows the forward pass had
+        return [(float(row.sum()) * self.factor, len(inputs)) for row in inputs]
+
+
+@pytest.fixture
+def server():
+    config = {"inference_slot_mb": 1, "inference_slots": 4, "inference_wait_ms": 50}
+    server = InferenceServer(Doubler(config), config)
+    server.start()
+    yield server
+    server.close()
+
+
+def test_infer(server):
+    inputs = np.arange(12, dtype=np.float32).reshape(4, 3)
+    assert [r[0] for r in server.infer(inputs)] == [6.0, 24.0, 42.0, 60.0]
+    assert server.infer(np.zeros((0, 3))) == []
+
+
+def test_large_inputs(server):
+    # 512KB rows, so that only two fit in each 1MB slot
+    inputs = np.ones((5, 1 << 16))
+    results = server.infer(inputs)
+    assert [r[0] for r in results] == [2.0 * (1 << 16)] * 5
+
+    with pytest.raises(InferenceServerError, match="larger than a slot"):
+        server.infer(np.ones((1, 1 << 18)))
+
+
+def test_errors(server):
+    with pytest.raises(InferenceServerError, match="negative input"):
+        server.infer(-np.ones((2, 3)))
+    # the server carries on after an error
+    assert len(server.infer(np.ones((2, 3)))) == 2
+
+
+def test_dynamic_batching(server):
+    results = []
+    threads = [
+        Thread(target=lambda: results.extend(server.infer(np.ones((1, 3)))))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(results) == 8
+    # requests from different workers were run together
+    assert max(r[1] for r in results) > 1
@@ -0,0 +1,75 @@
+import pytest
+import os
+from queue import Queue
+from types import SimpleNamespace as Ns
+from lib.common.journal import (
+    journal_run,
+    journal_policy,
+    journal_record,
+    element_key,
+    read_journal,
+    RECORD_SIZE,
+)
+
+
+@pytest.fixture
+def dbfile(utils):
+    os.makedirs(utils.TEMP_ELEMENT_DIR, exist_ok=True)
+    yield f"{utils.TEMP_ELEMENT_DIR}/test.db"
+    utils.cleanup()
+
+
+def run_journal(dbfile, records, **policy):
+    q, stats_q = Queue(), Queue()
+    for r in records:
+        q.put(r)
+    q.put(None)
+    journal_run(dbfile, q, stats_q, **policy)
+    return stats_q.get()
+
+
+def test_policy():
+    assert journal_policy({}) == {"every": 1, "interval": None, "fsync": False}
+    assert journal_policy(
+        {"journal_flush_every": 50, "journal_flush_ms": 200, "journal_fsync": True}
+    ) == {"every": 50, "interval": 0.2, "fsync": True}
+
+
+def test_keys():
+    assert element_key(Ns(id="el1")) == "el1"
+    assert element_key(Ns(id="el1", query="sel1/an1")) == "sel1/an1/el1"
+    assert element_key(Ns(id="el1", query=None)) == "el1"
+    assert element_key(42) == "42"
+    assert len(journal_record(Ns(id="el1"))) == RECORD_SIZE
+    assert journal_record(Ns(id="el1", query="sel1")) != journal_record(
+        Ns(id="el1", query="sel2")
+    )
+
+
+def test_per_record(dbfile):
+    stats = run_journal(dbfile, [journal_record(i) for i in range(10)])
+    assert stats["records"] == 10
+    assert stats["commits"] == 10
+    assert stats["cpu"] >= 0
+    assert os.path.getsize(dbfile) == 10 * RECORD_SIZE
+
+
+def test_group_commit(dbfile):
+    records = [journal_record(Ns(id=str(i), query="sel1")) for i in range(30)]
+    stats = run_journal(dbfile, records, every=8, fsync=True)
+    assert stats["records"] == 30
+    # 3 full groups of 8, and the remainder committed on close
+    assert stats["commits"] == 4
+
+    done = read_journal(dbfile)
+    assert len(done) == 30
+    assert journal_record(Ns(id="29", query="sel1")) in done
+    assert journal_record(Ns(id="30", query="sel1")) not in done
+
+
+def test_torn_record(dbfile):
+    run_journal(dbfile, [journal_record(0), journal_record(1)])
+    with open(dbfile, "ab") as f:
+        f.write(b"\x01\x02")
+    assert read_journal(dbfile) == {journal_record(0), journal_record(1)}
+    assert read_journal(f"{dbfile}.missing") == set()
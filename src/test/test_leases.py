@@ -0,0 +1,170 @@
+import os
+import re
+import sys
+import time
+import yaml
+import pytest
+import subprocess
+from pathlib import Path
+from lib.common.leases import LeaseDir, LeaseKeeper, CLAIMED, HELD, DONE, LEASES_DIR
+from lib.common.storage import LocalStorage
+from lib.common.journal import journal_record
+from lib.common.util import subdirs
+from lib.common.get import get_module
+
+SRC_DIR = Path(__file__).resolve().parents[1]
+ELEMENTS = [f"el{idx:03d}" for idx in range(200)]
+SHARDED_CONFIG = {"exts": ["txt"], "shard": True, "lease_ttl_s": 2, "workers": 1}
+
+
+@pytest.fixture
+def additionals(utils):
+    obj = lambda: None
+    obj.BASE_DIR = utils.TEMP_ELEMENT_DIR
+    obj.disk = LocalStorage(folder=utils.TEMP_ELEMENT_DIR)
+    obj.leases = obj.disk.base_dir / "leases"
+    yield obj
+    utils.cleanup()
+
+
+def test_claim(additionals):
+    a = LeaseDir(additionals.leases, ttl=60, owner="a")
+    b = LeaseDir(additionals.leases, ttl=60, owner="b")
+    a.join()
+    b.join()
+    assert a.claim(b"1") == CLAIMED
+    assert b.claim(b"1") == HELD
+    assert b.claim(b"2") == CLAIMED
+    a.publish(b"1")
+    assert b.claim(b"1") == DONE
+    assert not a.lease_file(b"1").exists()
+
+    # a lease can only be released by its holder
+    a.release(b"2")
+    assert a.claim(b"2") == HELD
+
+    # the dir is kept once every node has left, until it is reset
+    a.leave()
+    assert not a.reset()
+    b.leave()
+    assert b.claim(b"1") == DONE
+    assert b.reset()
+    assert not additionals.leases.exists()
+
+
+def test_expiry(additionals):
+    a = LeaseDir(additionals.leases, ttl=60, owner="a")
+    b = LeaseDir(additionals.leases, ttl=60, owner="b")
+    a.join()
+    assert a.claim(b"1") == CLAIMED
+    assert a.claim(b"2") == CLAIMED
+    # a's lease on 1 is renewed, and its lease on 2 is left to expire
+    past = time.time() - 120
+    os.utime(a.lease_file(b"1"), (past, past))
+    os.utime(a.lease_file(b"2"), (past, past))
+    assert a.renew([b"1", b"3"]) == [b"3"]
+    assert b.claim(b"1") == HELD
+    assert b.claim(b"2") == CLAIMED
+    assert a.lease_file(b"2").read_text() == "b"
+
+
+def test_keeper(additionals):
+    leases = LeaseDir(additionals.leases, ttl=0.3, owner="a")
+    leases.join()
+    keeper = LeaseKeeper(leases)
+    keeper.start()
+    for record in [b"1", b"2", b"3"]:
+        assert leases.claim(record) == CLAIMED
+        keeper.add(record)
+    leases.publish(b"1")
+    time.sleep(0.5)
+    # the leases that are still held have been renewed, and would not be reclaimed
+    other = LeaseDir(additionals.leases, ttl=0.3, owner="b")
+    assert other.claim(b"2") == HELD
+    assert keeper.held == {b"2", b"3"}
+    # leases of elements that are not done are released when the keeper stops
+    keeper.stop()
+    assert other.claim(b"2") == CLAIMED
+    assert other.claim(b"1") == DONE
+
+
+def write_config(base_dir, node) -> Path:
+    config_path = base_dir / f"{node}.yaml"
+    with open(config_path, "w") as f:
+        yaml.dump(
+            {
+                "folder": "media/test_official",
+                "elements_in": ["sel1"],
+                "analyse": {
+                    "name": "ExtractTypes",
+                    "config": {**SHARDED_CONFIG, "node": node},
+                },
+            },
+            f,
+        )
+    return config_path
+
+
+def start_node(config_path):
+    return subprocess.Popen(
+        [sys.executable, "run.py", str(config_path)],
+        cwd=SRC_DIR,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+
+
+def finish_node(node) -> tuple:
+    """The number of elements that a node claimed, and that it found done by other nodes."""
+    out, _ = node.communicate(timeout=120)
+    assert node.returncode == 0, out
+    claimed = re.search(r"shard: (\d+) elements claimed, (\d+) done by other", out)
+    return int(claimed[1]), int(claimed[2])
+
+
+@pytest.mark.skipif(
+    (os.cpu_count() or 1) < 3, reason="run.py runs phases serially, unsharded, here"
+)
+def test_sharded_phase(additionals, utils):
+    utils.scaffold_empty("sel1", elements=ELEMENTS, selector_txt="an element")
+    disk, base_dir = additionals.disk, additionals.disk.base_dir
+    configs = {node: write_config(base_dir, node) for node in ["a", "b", "c"]}
+    # the analyser as run.py makes it for the first node. The nodes are named apart, and share its leases all the same
+    with open(configs["a"], "r") as f:
+        ana = yaml.safe_load(f)["analyse"]
+    ExtractTypes = get_module("analyse", ana["name"])
+    mod = ExtractTypes({**ana["config"], "elements_in": ["sel1"]}, ana["name"], disk)
+    leases = base_dir / LEASES_DIR / f"{mod.UNIQUE_ID}.analyse"
+
+    # a node that died holding element 3 left its lease to expire, and one holds element 4 for a moment
+    els = {el.id: el for el in disk.read_elements(["sel1"])}
+    dead = LeaseDir(leases, ttl=2, owner="dead")
+    dead.join()
+    dead.claim(journal_record(els["el003"]))
+    past = time.time() - 10
+    os.utime(dead.lease_file(journal_record(els["el003"])), (past, past))
+    dead.claim(journal_record(els["el004"]))
+    dead.leave()
+
+    # two runs of mtriage over the same folder
+    nodes = [start_node(configs[node]) for node in ["a", "b"]]
+    claimed = [finish_node(n) for n in nodes]
+    # every element is analysed once, by one of the nodes or the other
+    assert sum(c for c, _ in claimed) == len(ELEMENTS)
+    assert all(c > 0 for c, _ in claimed)
+    analysed = disk.read_query("sel1/ExtractTypes")
+    assert sorted(p.name for p in subdirs(analysed)) == ELEMENTS
+    # each node removes its journal, and the elements are kept as done
+    assert list(base_dir.glob("*.db")) == []
+    assert len(list(leases.glob("*.done"))) == len(ELEMENTS)
+
+    # so that a node that runs the phase late skips every element, until the phase is reset
+    assert finish_node(start_node(configs["c"])) == (0, len(ELEMENTS))
+    subprocess.run(
+        [sys.executable, "-m", "lib.common.leases", "media/test_official"],
+        cwd=SRC_DIR,
+        check=True,
+    )
+    assert not leases.exists()
+    assert finish_node(start_node(configs["c"])) == (len(ELEMENTS), 0)
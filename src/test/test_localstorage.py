@@ -1,7 +1,10 @@
 import pytest
+import os
 import json
+import pickle
 from pathlib import Path
 from lib.common.storage import LocalStorage
+from lib.common.etypes import Etype
 
 
 @pytest.fixture
@@ -52,3 +55,79 @@ def test_write_meta(basic):
         data = json.load(f)
     assert data.get("some") == "data"
     assert data.get("timestamp") is not None
+
+
+def test_log_shards(basic):
+    basic.write_logs(["before"])
+    basic.write_log_shard("phase.1", [(1.0, "a"), (3.0, "c"), (5.0, "multi\nline")])
+    basic.write_log_shard("phase.2", [(2.0, "b"), (4.0, "d")])
+    basic.write_log_shard("other.1", [(0.0, "not merged")])
+    basic.merge_log_shards("phase")
+
+    with open(basic._LocalStorage__LOGS_FILE, "r") as f:
+        assert f.read() == "before\na\nb\nc\nd\nmulti\nline\n"
+    shards = os.listdir(basic._LocalStorage__SHARDS_DIR)
+    assert shards == ["other.1.log"]
+
+
+def test_atomic_writes(basic):
+    basic.atomic_writes = True
+    src = basic.base_dir / ".src"
+    src.mkdir()
+    for name in ["a.txt", "b.txt"]:
+        (src / name).write_text(name)
+    basic.write_element("Youtube/Pub", Etype.Any("el1", paths=[src / "a.txt"]))
+    # a second write replaces the element whole
+    basic.write_element("Youtube/Pub", Etype.Any("el1", paths=[src / "b.txt"]))
+    dest = basic.read_query("Youtube/Pub")
+    assert os.listdir(dest) == ["el1"]
+    assert os.listdir(dest / "el1") == ["b.txt"]
+
+    # elements that are still being staged are not read
+    (dest / ".el2.node.staging").mkdir()
+    assert [el.id for el in basic.read_elements(["Youtube/Pub"])] == ["el1"]
+    assert list(basic.read_all_media()["Youtube"]["derived"]["Pub"]) == ["el1"]
+
+
+def test_staging_path(basic):
+    staging = basic.staging_path("Youtube/Pub", "el1")
+    assert staging.is_dir() and os.listdir(staging) == []
+    for name in ["a.txt", "b.txt", "c.part"]:
+        (staging / name).write_text(name)
+    inode = os.stat(staging / "a.txt").st_ino
+    # an element made in its staging dir is renamed into place, without the files that aren't the element's
+    el = Etype.Any("el1", paths=[staging / "a.txt", staging / "b.txt"])
+    basic.write_element("Youtube/Pub", el)
+    dest = basic.read_query("Youtube/Pub") / "el1"
+    assert sorted(os.listdir(dest)) == ["a.txt", "b.txt"]
+    assert os.stat(dest / "a.txt").st_ino == inode
+    assert not staging.exists()
+
+    # a second attempt at the element starts with an empty dir, and replaces it whole
+    staging = basic.staging_path("Youtube/Pub", "el1")
+    (staging / "d.txt").write_text("d")
+    basic.write_element("Youtube/Pub", Etype.Any("el1", paths=[staging / "d.txt"]))
+    assert os.listdir(dest) == ["d.txt"]
+    assert [el.id for el in basic.read_elements(["Youtube/Pub"])] == ["el1"]
+
+
+def test_lazy_elements(basic):
+    disk = LocalStorage(folder=base, catalog=False)
+    el_dir = disk.read_query("Youtube") / "el1"
+    (el_dir / "a.jpg").write_text("a")
+    (el_dir / "b.jpg").write_text("b")
+    el = disk.read_elements(["Youtube"])[0]
+    assert (el.id, el.query) == ("el1", "Youtube")
+    # nothing is listed or cast until the element's paths or etype are used, as in a worker
+    assert not el.is_resolved
+    el = pickle.loads(pickle.dumps(el))
+    assert not el.is_resolved
+    assert str(el.et) == "Array(Image)"
+    assert sorted(p.name for p in el.paths) == ["a.jpg", "b.jpg"]
+    assert el.is_resolved
+
+    # paths that are set replace those on disk, but the etype is still cast from disk
+    el = disk.read_elements(["Youtube"])[0]
+    el.paths = [el_dir / "a.jpg"]
+    assert str(el.et) == "Array(Image)"
+    assert el.paths == [el_dir / "a.jpg"]
@@ -0,0 +1,107 @@
+import os
+import gzip
+import json
+import pickle
+import pytest
+from types import SimpleNamespace as Ns
+from lib.common.logs import LogWriter, record, DEBUG
+from lib.common.mtmodule import MTModule
+from lib.common.storage import LocalStorage
+
+
+class LoggingClass(MTModule):
+    in_parallel = False
+
+    @MTModule.phase("logkey")
+    def run(self, gen):
+        for el in gen:
+            self.logger(f"element {el.id}", element=el)
+            self.logger("detail", level=DEBUG)
+        self.error_logger("failed")
+
+
+@pytest.fixture
+def additionals(utils):
+    obj = lambda: None
+    obj.disk = LocalStorage(folder=utils.TEMP_ELEMENT_DIR)
+    obj.logs_dir = obj.disk.base_dir / "logs"
+    yield obj
+    utils.cleanup()
+
+
+def element(id):
+    return Ns(id=id)
+
+
+def test_records(additionals, capsys):
+    mod = LoggingClass({"verbosity": "info"}, "logmod", additionals.disk)
+    mod.run(element(i) for i in ["a", "b"])
+
+    with open(additionals.logs_dir / "logs.jsonl", "r") as f:
+        records = [json.loads(l) for l in f]
+    assert [(r["level"], r["element"], r["msg"]) for r in records] == [
+        ("info", "a", "element a"),
+        ("debug", None, "detail"),
+        ("info", "b", "element b"),
+        ("debug", None, "detail"),
+        ("error", None, "failed"),
+    ]
+    assert all(r["module"] == "logmod" and r["phase"] == "logkey" for r in records)
+    assert records == sorted(records, key=lambda r: r["ts"])
+
+    # the text log is rendered as it always has been
+    with open(additionals.logs_dir / "logs.txt", "r") as f:
+        lines = f.read().split("\n")
+    assert lines[0] == "logmod: logkey: a: element a"
+    assert lines[1] == "logmod: logkey: detail"
+    assert lines[6] == "ERROR: logmod: logkey: failed"
+
+    # debug records are not printed at the default verbosity
+    out = capsys.readouterr().out
+    assert "element a" in out and "detail" not in out and "failed" in out
+
+
+def test_verbosity(additionals, capsys):
+    mod = LoggingClass(
+        {"verbosity": "error", "timing": False}, "logmod", additionals.disk
+    )
+    mod.run(element(i) for i in ["a"])
+    out = capsys.readouterr().out
+    assert out == "\033[91mERROR: logmod: logkey: failed\033[0m\n"
+
+    mod = LoggingClass(
+        {"verbosity": "debug", "timing": False}, "logmod", additionals.disk
+    )
+    mod.run(element(i) for i in ["a"])
+    assert "logmod: logkey: detail" in capsys.readouterr().out
+
+
+def test_writer(additionals):
+    writer = LogWriter(additionals.logs_dir, max_mb=0.001, backups=2)
+    for idx in range(30):
+        writer.write([record("x" * 100, element=str(idx))])
+        writer.flush()
+    rotated = sorted(f for f in os.listdir(additionals.logs_dir) if f.endswith(".gz"))
+    assert rotated == [
+        "logs.jsonl.1.gz",
+        "logs.jsonl.2.gz",
+        "logs.txt.1.gz",
+        "logs.txt.2.gz",
+    ]
+    with gzip.open(additionals.logs_dir / "logs.jsonl.1.gz", "rt") as f:
+        records = [json.loads(l) for l in f]
+    if os.path.exists(additionals.logs_dir / "logs.jsonl"):
+        with open(additionals.logs_dir / "logs.jsonl", "r") as f:
+            records += [json.loads(l) for l in f]
+    # the newest records are kept, in order
+    assert [r["element"] for r in records] == [
+        str(i) for i in range(30 - len(records), 30)
+    ]
+
+    # the writer's thread is started again in the process that unpickles it
+    writer = pickle.loads(pickle.dumps(writer))
+    assert writer.thread is None
+    writer.write(["plain"])
+    writer.flush()
+    with open(additionals.logs_dir / "logs.txt", "r") as f:
+        assert f.read().endswith("plain\n")
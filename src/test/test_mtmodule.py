@@ -1,8 +1,13 @@
 import pytest
 import os
+import json
+import signal
+import asyncio
 from pathlib import Path
-from lib.common.exceptions import ImproperLoggedPhaseError
+from lib.common.exceptions import ImproperLoggedPhaseError, InvalidSchedulerConfigError
 from lib.common.mtmodule import MTModule
+from lib.common.executors import EXECUTORS
+from lib.common.timing import ELEMENT, PHASE
 from lib.common.storage import LocalStorage
 from test.utils import scaffold_empty
 
@@ -11,6 +16,111 @@ class EmptyMTModule(MTModule):
     pass
 
 
+# NB: classes used in phases on every executor are defined here, as the forkserver pool's workers import them
+class ParallelClass(MTModule):
+    in_parallel = True
+
+    @MTModule.phase("somekey", remove_db=False)
+    def func(self, gen):
+        for el in gen:
+            self.logger(f"element {el}")
+        return "no error"
+
+
+class SizedElement:
+    def __init__(self, id, size):
+        self.id, self.size = id, size
+
+    def __str__(self):
+        return self.id
+
+
+class BatchedClass(MTModule):
+    in_parallel = True
+
+    @MTModule.phase("batchkey", batched=True, remove_db=False)
+    def func(self, gen):
+        batch = list(gen)
+        self.logger(f"batch of {len(batch)}")
+
+
+class FlakyClass(MTModule):
+    in_parallel = True
+
+    @MTModule.phase("flakykey")
+    def func(self, gen):
+        for el in gen:
+            attempt = self.attempt_of(el)
+            # odd elements succeed on their third attempt, 13 never does
+            if el == 13 or (el % 2 == 1 and attempt < 3):
+                if not self.retry_later(el):
+                    self.logger(f"gave up on {el}")
+                continue
+            self.logger(f"element {el} on attempt {attempt}")
+
+
+class RetryingClass(MTModule):
+    in_parallel = True
+
+    @MTModule.phase("retrykey")
+    def func(self, gen):
+        for el in gen:
+            if not self.retry_later(el):
+                self.logger(f"gave up on {el[:4]}")
+
+
+class TimedClass(MTModule):
+    in_parallel = True
+
+    @MTModule.phase("timedkey")
+    def func(self, gen):
+        for el in gen:
+            with self.timed(str(el), ELEMENT):
+                with open(self.disk.base_dir / f"{el}.bin", "wb") as f:
+                    f.write(b"x" * 10000)
+
+
+class CrashingClass(MTModule):
+    in_parallel = True
+
+    @MTModule.phase("crashkey", remove_db=False)
+    def func(self, gen):
+        for el in gen:
+            if el == 7:
+                os.kill(os.getpid(), signal.SIGKILL)
+            (self.disk.base_dir / f"{el}.done").touch()
+
+
+class KilledEarlyClass(MTModule):
+    in_parallel = True
+
+    @MTModule.phase("earlykey", remove_db=False)
+    def func(self, gen):
+        for el in gen:
+            # NB: killed as soon as it takes its chunk, before it could have sent any message about it
+            if el % 4 == 0:
+                os.kill(os.getpid(), signal.SIGKILL)
+            (self.disk.base_dir / f"{el}.done").touch()
+
+
+class PooledClass(MTModule):
+    in_parallel = True
+
+    def setup_worker(self):
+        with open(self.disk.base_dir / f"{os.getpid()}.setup", "a") as f:
+            f.write("x")
+
+    @MTModule.phase("firstkey")
+    def first(self, gen):
+        for el in gen:
+            self.logger(f"first {el} in {os.getpid()}")
+
+    @MTModule.phase("secondkey")
+    def second(self, gen):
+        for el in gen:
+            self.logger(f"second {el} in {os.getpid()}")
+
+
 @pytest.fixture
 def additionals(utils):
     obj = lambda: None
@@ -96,7 +206,7 @@ def test_parallel_phase_decorator(additionals):
     dbfile = f"{gc.disk.base_dir}/{gc.UNIQUE_ID}.db"
     with open(dbfile, "rb") as f:
         _bytes = f.read()
-        assert len(_bytes) == 800  # 2 4-byte entries per item for 100 items
+        assert len(_bytes) == 1600  # one 16-byte digest per item for 100 items
 
     os.remove(dbfile)
 
@@ -114,3 +224,293 @@ def test_parallel_phase_decorator(additionals):
     # test function with argument
     eg_gen = (a for a in range(0, 100))
     assert gc.func_w_arg(eg_gen, 10) == "no error"
+
+
+@pytest.mark.parametrize("executor", EXECUTORS)
+def test_executors(additionals, executor):
+    mod = ParallelClass(
+        {"executor": executor, "workers": 3},
+        "my_parallel_mod",
+        storage=LocalStorage(folder=additionals.BASE_DIR),
+    )
+    assert mod.func(a for a in range(40)) == "no error"
+    with open(f"{additionals.BASE_DIR}/logs/logs.txt", "r") as f:
+        lines = f.readlines()
+    assert sorted(lines) == sorted(
+        [f"my_parallel_mod: somekey: element {a}\n" for a in range(40)]
+    )
+
+    # resumes from the journal, whichever executor wrote it
+    assert mod.func(a for a in range(60)) == "no error"
+    with open(f"{additionals.BASE_DIR}/logs/logs.txt", "r") as f:
+        assert len(f.readlines()) == 60
+    assert os.path.getsize(f"{mod.disk.base_dir}/{mod.UNIQUE_ID}.db") == 60 * 16
+
+
+def test_invalid_schedule(additionals):
+    # an unknown schedule fails the phase, rather than being run in order
+    mod = ParallelClass(
+        {"schedule": "shortest_first"},
+        "my_parallel_mod",
+        storage=LocalStorage(folder=additionals.BASE_DIR),
+    )
+    with pytest.raises(InvalidSchedulerConfigError):
+        mod.func(a for a in range(10))
+
+
+@pytest.mark.parametrize(
+    "schedule,order",
+    [
+        ({"somekey": "longest_first"}, ["large", "medium", "small"]),
+        ({"otherkey": "longest_first"}, ["small", "large", "medium"]),
+    ],
+)
+def test_phase_schedule(additionals, schedule, order):
+    # a schedule set for a phase applies to that phase alone
+    mod = ParallelClass(
+        {"schedule": schedule, "executor": "threads", "workers": 1},
+        "my_parallel_mod",
+        storage=LocalStorage(folder=additionals.BASE_DIR),
+    )
+    sizes = [("small", 10), ("large", 1000), ("medium", 100)]
+    mod.func(SizedElement(name, size) for name, size in sizes)
+    with open(f"{additionals.BASE_DIR}/logs/logs.txt", "r") as f:
+        assert f.readlines() == [
+            f"my_parallel_mod: somekey: element {n}\n" for n in order
+        ]
+
+    mod.config["schedule"] = {"somekey": "shortest_first"}
+    with pytest.raises(InvalidSchedulerConfigError):
+        mod.func(SizedElement(name, size) for name, size in sizes)
+
+
+def test_async_phase(additionals):
+    class AsyncClass(MTModule):
+        in_parallel = True
+
+        @MTModule.phase("asynckey", executor="asyncio")
+        async def func(self, gen):
+            for el in gen:
+                await asyncio.sleep(0.01)
+                self.logger(f"element {el}")
+
+    mod = AsyncClass(
+        {"workers": 20}, "my_async_mod", LocalStorage(folder=additionals.BASE_DIR)
+    )
+    mod.func(a for a in range(40))
+    with open(f"{additionals.BASE_DIR}/logs/logs.txt", "r") as f:
+        assert len(f.readlines()) == 40
+
+
+@pytest.mark.parametrize("executor", EXECUTORS)
+def test_batched_phase(additionals, executor):
+    mod = BatchedClass(
+        {"executor": executor, "batch_size": 8},
+        "my_batched_mod",
+        LocalStorage(folder=additionals.BASE_DIR),
+    )
+    mod.func(a for a in range(20))
+    with open(f"{additionals.BASE_DIR}/logs/logs.txt", "r") as f:
+        sizes = sorted(int(l.split(" ")[-1]) for l in f.readlines())
+    assert sizes == [4, 8, 8]
+    # journal records are kept per element, not per batch
+    assert os.path.getsize(f"{mod.disk.base_dir}/{mod.UNIQUE_ID}.db") == 20 * 16
+
+
+@pytest.mark.parametrize("executor", EXECUTORS)
+def test_retry_later(additionals, executor):
+    mod = FlakyClass(
+        {"executor": executor, "retry_delay_ms": 10, "retry_attempts": 4},
+        "my_flaky_mod",
+        LocalStorage(folder=additionals.BASE_DIR),
+    )
+    mod.func(a for a in range(20))
+    with open(f"{additionals.BASE_DIR}/logs/logs.txt", "r") as f:
+        lines = sorted(l.split(": ")[-1] for l in f.readlines())
+    expected = [f"element {a} on attempt {1 if a % 2 == 0 else 3}\n" for a in range(20)]
+    expected.remove("element 13 on attempt 3\n")
+    assert lines == sorted(expected + ["gave up on 13\n"])
+    # 9 odd elements retried twice, and 13 three times
+    assert mod.retry_stats["retries"] == 21
+    assert mod.retry_stats["elements"] == 10
+    assert mod.retry_stats["delay"] > 0
+
+
+def test_retries_fill_pipe(additionals):
+    mod = RetryingClass(
+        {
+            "executor": "processes",
+            "workers": 2,
+            "chunk_size": 100,
+            "retry_attempts": 2,
+            "retry_delay_ms": 1,
+        },
+        "my_retrying_mod",
+        LocalStorage(folder=additionals.BASE_DIR),
+    )
+    # NB: elements of about the size of a LocalElement, enough of whose retries are sent back from the last chunks to
+    # fill the retry queue's pipe, which the workers can't exit until the phase has read
+    mod.func(f"{a:04d}" + "x" * 500 for a in range(2000))
+    with open(f"{additionals.BASE_DIR}/logs/logs.txt", "r") as f:
+        lines = f.readlines()
+    assert sorted(int(l.split(" ")[-1]) for l in lines) == list(range(2000))
+    assert mod.retry_stats["retries"] == 2000
+
+
+@pytest.mark.parametrize("executor", EXECUTORS)
+def test_timed_phase(additionals, executor):
+    mod = TimedClass(
+        {"executor": executor, "workers": 3},
+        "my_timed_mod",
+        LocalStorage(folder=additionals.BASE_DIR),
+    )
+    mod.func(a for a in range(20))
+    with open(f"{additionals.BASE_DIR}/logs/events.jsonl", "r") as f:
+        events = [json.loads(l) for l in f.readlines()]
+    elements = [e for e in events if e["cat"] == ELEMENT]
+    assert sorted(int(e["name"]) for e in elements) == list(range(20))
+    for e in elements:
+        assert e["module"] == "my_timed_mod"
+        assert e["phase"] == "timedkey"
+        assert e["written"] >= 10000
+    # the phase is recorded last, with the bytes written by all of its workers
+    assert events[-1]["cat"] == PHASE
+    assert events[-1] == mod.phase_event
+    assert events[-1]["written"] >= 20 * 10000
+    assert events[-1]["wall"] >= max(e["wall"] for e in elements)
+
+    # the trace is an open JSON array of the same events
+    with open(f"{additionals.BASE_DIR}/logs/trace.json", "r") as f:
+        trace = json.loads(f.read() + "]")
+    assert len(trace) == len(events)
+    assert all(e["ph"] == "X" for e in trace)
+    shards = f"{additionals.BASE_DIR}/logs/shards"
+    assert not os.path.exists(shards) or os.listdir(shards) == []
+
+
+def test_timing_off(additionals):
+    class TimedClass(MTModule):
+        @MTModule.phase("timedkey")
+        def func(self, els):
+            for el in els:
+                with self.timed(str(el), ELEMENT):
+                    pass
+
+    mod = TimedClass(
+        {"timing": False}, "my_timed_mod", LocalStorage(folder=additionals.BASE_DIR)
+    )
+    mod.func(list(range(5)))
+    assert mod.phase_event is None
+    assert not os.path.exists(f"{additionals.BASE_DIR}/logs/events.jsonl")
+
+
+@pytest.mark.parametrize(
+    "limits,reason",
+    [({"worker_max_elements": 4}, "elements"), ({"worker_max_rss_mb": 1}, "memory")],
+)
+def test_worker_recycling(additionals, limits, reason):
+    class LeakyClass(MTModule):
+        in_parallel = True
+
+        @MTModule.phase("leakykey", remove_db=False)
+        def func(self, gen):
+            for el in gen:
+                self.logger(f"element {el} in {os.getpid()}")
+
+    mod = LeakyClass(
+        {"executor": "processes", "workers": 2, **limits},
+        "my_leaky_mod",
+        LocalStorage(folder=additionals.BASE_DIR),
+    )
+    mod.func(a for a in range(20))
+    with open(f"{additionals.BASE_DIR}/logs/logs.txt", "r") as f:
+        lines = f.readlines()
+    assert sorted(int(l.split(" ")[-3]) for l in lines) == list(range(20))
+    # each element is processed once, and checkpointed before its worker is replaced
+    assert os.path.getsize(f"{mod.disk.base_dir}/{mod.UNIQUE_ID}.db") == 20 * 16
+    pids = set(l.split(" ")[-1] for l in lines)
+    assert len(pids) >= (5 if reason == "elements" else 10)
+    assert len(mod.worker_stats) >= len(pids)
+    assert reason in [s["exit"] for s in mod.worker_stats]
+    assert all(s["peak_rss"] > 0 for s in mod.worker_stats)
+
+
+@pytest.mark.parametrize("executor", ["processes", "forkserver"])
+def test_killed_worker(additionals, executor):
+    mod = CrashingClass(
+        {"executor": executor, "workers": 2},
+        "my_crashing_mod",
+        LocalStorage(folder=additionals.BASE_DIR),
+    )
+    mod.func(a for a in range(20))
+    # the elements queued after the killed worker's are processed by its replacement
+    done = sorted(int(p.stem) for p in mod.disk.base_dir.glob("*.done"))
+    assert done == [a for a in range(20) if a != 7]
+    # the killed worker's element is left for the next run
+    assert os.path.getsize(f"{mod.disk.base_dir}/{mod.UNIQUE_ID}.db") <= 19 * 16
+    assert [s["exit"] for s in mod.worker_stats].count("killed") == 1
+
+
+@pytest.mark.parametrize("executor", ["threads", "asyncio"])
+def test_raising_chunk(additionals, executor):
+    class RaisingClass(MTModule):
+        in_parallel = True
+
+        @MTModule.phase("raisekey", remove_db=False)
+        def func(self, gen):
+            for el in gen:
+                self.logger(f"starting {el}")
+                if el % 5 == 0:
+                    raise ValueError(f"bad element {el}")
+                self.logger(f"element {el}")
+
+    # NB: with a single worker, a thread that died would leave nothing to take from the work queue
+    mod = RaisingClass(
+        {"executor": executor, "workers": 1, "queue_size": 1},
+        "my_raising_mod",
+        LocalStorage(folder=additionals.BASE_DIR),
+    )
+    mod.func(a for a in range(20))
+    with open(f"{additionals.BASE_DIR}/logs/logs.txt", "r") as f:
+        lines = f.readlines()
+    assert sorted(l for l in lines if ": element " in l) == sorted(
+        f"my_raising_mod: raisekey: element {a}\n" for a in range(20) if a % 5 != 0
+    )
+    assert len([l for l in lines if "Worker lost a chunk" in l]) == 4
+    # the logs of a chunk that raised are kept
+    assert len([l for l in lines if ": starting " in l]) == 20
+    # the chunks that raised are left for the next run
+    assert os.path.getsize(f"{mod.disk.base_dir}/{mod.UNIQUE_ID}.db") == 16 * 16
+
+
+def test_killed_pool_worker(additionals):
+    mod = KilledEarlyClass(
+        {"executor": "forkserver", "workers": 2},
+        "my_early_mod",
+        LocalStorage(folder=additionals.BASE_DIR),
+    )
+    mod.func(a for a in range(20))
+    done = sorted(int(p.stem) for p in mod.disk.base_dir.glob("*.done"))
+    assert done == [a for a in range(20) if a % 4 != 0]
+    assert [s["exit"] for s in mod.worker_stats].count("killed") == 5
+
+
+def test_forkserver_pool(additionals):
+    mod = PooledClass(
+        {"executor": "forkserver", "workers": 3},
+        "my_pooled_mod",
+        LocalStorage(folder=additionals.BASE_DIR),
+    )
+    mod.first(a for a in range(20))
+    mod.second(a for a in range(20))
+    with open(f"{additionals.BASE_DIR}/logs/logs.txt", "r") as f:
+        lines = [l.split(": ")[-1].split(" ") for l in f.readlines()]
+    for phase in ["first", "second"]:
+        assert sorted(int(l[1]) for l in lines if l[0] == phase) == list(range(20))
+    # both phases run in the same workers, which each set up the module once
+    pids = set(l[-1].strip() for l in lines)
+    assert len(pids) <= 3
+    setups = list(mod.disk.base_dir.glob("*.setup"))
+    assert set(p.stem for p in setups) == pids
+    assert all(p.read_text() == "x" for p in setups)
+    assert os.getpid() not in [int(p) for p in pids]
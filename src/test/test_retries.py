@@ -0,0 +1,58 @@
+import time
+from lib.common.retries import (
+    RetryQueue,
+    retry_policy,
+    backoff_delay,
+    format_stats,
+)
+
+
+def test_policy():
+    assert retry_policy({}) == {"attempts": 5, "delay": 0.5, "max_delay": 60.0}
+    assert retry_policy(
+        {"retry_attempts": 3, "retry_delay_ms": 100, "retry_max_delay_ms": 1000}
+    ) == {"attempts": 3, "delay": 0.1, "max_delay": 1.0}
+
+
+def test_backoff():
+    # without jitter, the delay doubles with each attempt, up to the maximum
+    delays = [backoff_delay(a, 1, 10, rand=lambda: 1) for a in range(2, 8)]
+    assert delays == [1, 2, 4, 8, 10, 10]
+    # with the most jitter, half of the delay is left
+    assert backoff_delay(4, 1, 10, rand=lambda: 0) == 2
+    for _ in range(100):
+        assert 2 <= backoff_delay(4, 1, 10) <= 4
+
+
+def test_queue():
+    q = RetryQueue({"attempts": 5, "delay": 0.02, "max_delay": 1})
+    q.push((b"late", "el1", 4))
+    q.push((b"early", "el2", 2))
+    q.push((b"early", "el2", 3))
+    assert len(q) == 3
+    assert q.pop_due() == []
+
+    q.wait()
+    assert q.pop_due()[0] == (b"early", "el2", 2)
+    time.sleep(0.08)
+    assert [r for r, _, _ in q.pop_due()] == [b"early", b"late"]
+    assert len(q) == 0
+
+    stats = q.stats()
+    assert stats["retries"] == 3
+    assert stats["elements"] == 2
+    assert 0.01 + 0.02 + 0.04 <= stats["delay"] <= 0.02 + 0.04 + 0.08
+    assert stats["max_delay"] <= 0.08
+    assert format_stats(stats).startswith("retries: 3 retries of 2 elements")
+
+
+def test_retry_after():
+    q = RetryQueue({"attempts": 5, "delay": 0.02, "max_delay": 1})
+    # an element that was asked to wait does, if longer than its backoff, but no longer than the longest delay
+    q.push((b"asked", "el1", 2), after=0.5)
+    q.push((b"greedy", "el2", 2), after=3600)
+    q.push((b"short", "el3", 2), after=0)
+    delays = sorted(due - time.monotonic() for due, _, _ in q.heap)
+    assert delays[0] <= 0.02
+    assert 0.4 <= delays[1] <= 0.5
+    assert 0.9 <= delays[2] <= 1
@@ -163,3 +163,11 @@ def test_validate():
 def test_config_types():
     validate_yaml(GOOD_ANALYSE_DICT)
     validate_yaml(GOOD_SELECT_ANALYSE)
+
+
+def test_validate_storage():
+    bad_storage = {**GOOD_ANALYSE_DICT, "storage": {"type": "ftp"}}
+    write_and_validate(bad_storage, "type of 'local' or 's3'")
+
+    no_bucket = {**GOOD_ANALYSE_DICT, "storage": {"type": "s3"}}
+    write_and_validate(no_bucket, "must specify a 'bucket'")
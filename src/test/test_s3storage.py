@@ -0,0 +1,217 @@
+import os
+import pickle
+import socket
+import time
+import shutil
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from lib.common.analyser import Analyser
+from lib.common.etypes import Etype, LocalElementsIndex
+from lib.common.s3storage import S3Storage, RemoteElement, FETCHED_DIR
+
+# NB: moto is in src/build/test.requirements.txt, which images built with `./mtriage dev build --test` have
+ThreadedMotoServer = pytest.importorskip("moto.server").ThreadedMotoServer
+
+BUCKET = "mtriage"
+
+
+class UpperAnalyser(Analyser):
+    out_etype = Etype.Any
+    in_parallel = True
+
+    def analyse_element(self, element, config):
+        out = self.staging_path(element) / "upper.txt"
+        with open(out, "w") as f:
+            f.write(element.paths[0].read_text().upper())
+        return Etype.Any(element.id, out)
+
+
+@pytest.fixture(scope="module")
+def endpoint():
+    # NB: a moto server stands in for S3 over HTTP, so that requests are made as they would be to S3 or MinIO
+    for k in ["AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"]:
+        os.environ[k] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    yield f"http://127.0.0.1:{port}"
+    server.stop()
+
+
+@pytest.fixture
+def additionals(utils, endpoint):
+    utils.setup()
+    obj = lambda: None
+    options = {
+        "bucket": BUCKET,
+        "prefix": "test",
+        "endpoint_url": endpoint,
+        "multipart_threshold_mb": 5,
+        "multipart_chunk_mb": 5,
+        "list_page_size": 2,
+    }
+    obj.disk = S3Storage(folder=utils.TEMP_ELEMENT_DIR, **options)
+    obj.disk.s3.client.create_bucket(Bucket=BUCKET)
+    # another node, with a folder of its own
+    obj.node = S3Storage(folder=f"{utils.TEMP_ELEMENT_DIR}_node", **options)
+    obj.src = obj.disk.base_dir / ".src"
+    obj.src.mkdir()
+    for name, body in [("a", "a"), ("b", "b"), ("c", "c")]:
+        for ext in [".txt", ".jpg"]:
+            with open(obj.src / f"{name}{ext}", "w") as f:
+                f.write(body * 100)
+    yield obj
+    client = obj.disk.s3.client
+    for o in client.list_objects_v2(Bucket=BUCKET).get("Contents", []):
+        client.delete_object(Bucket=BUCKET, Key=o["Key"])
+    shutil.rmtree(obj.node.base_dir)
+    utils.cleanup()
+
+
+def test_write_and_read(additionals):
+    disk, node, src = additionals.disk, additionals.node, additionals.src
+    disk.write_element("sel", Etype.Any("el1", [src / "a.txt", src / "b.txt"]))
+    disk.write_element("sel", Etype.Any("el2", src / "c.txt"))
+    disk.write_element("sel/ana", Etype.Any("el1", src / "a.txt"))
+    assert disk.s3.client.list_objects_v2(Bucket=BUCKET)["KeyCount"] == 4
+
+    # elements are listed a page at a time, and their files are only downloaded as they are used
+    els = node.read_elements(["sel"])
+    assert len(els) == 2 and isinstance(els[0], RemoteElement)
+    assert [els[0].id, els[0].size, els[1].id, els[1].size] == ["el1", 200, "el2", 100]
+    assert not (node.read_query("sel") / "el1").exists()
+    assert sorted(p.name for p in els[0].paths) == ["a.txt", "b.txt"]
+    assert els[1].paths[0].read_text() == "c" * 100
+    assert els[1].paths[0].parent == node.read_query("sel") / "el2"
+
+    # the node that wrote the elements reads them from its own folder
+    assert len(list((disk.base_dir / FETCHED_DIR).iterdir())) == 3
+    el = pickle.loads(pickle.dumps(disk.read_elements(["sel/ana"])[0]))
+    assert [p.read_text() for p in el.paths] == ["a" * 100]
+
+    assert node.read_all_media() == {
+        "sel": {
+            "data": {
+                "el1": node.read_query("sel") / "el1",
+                "el2": node.read_query("sel") / "el2",
+            },
+            "derived": {"ana": {"el1": node.read_query("sel/ana") / "el1"}},
+        }
+    }
+
+
+def test_prefetch(additionals):
+    disk, node, src = additionals.disk, additionals.node, additionals.src
+    for idx in range(5):
+        disk.write_element("sel", Etype.Any(f"el{idx}", src / "a.txt"))
+    node.prefetch_ahead = 2
+    els = node.read_elements(["sel"])
+    first = next(iter(els))
+    assert first.id == "el0"
+    for f in list(node.s3.fetches.values()):
+        f.result()
+    fetched = sorted(os.listdir(node.base_dir / FETCHED_DIR))
+    assert fetched == ["sel.el0", "sel.el1", "sel.el2"]
+    assert [el.id for el in els] == [f"el{idx}" for idx in range(5)]
+
+
+def test_lock_removed(additionals):
+    disk, node, src = additionals.disk, additionals.node, additionals.src
+    disk.write_element("sel", Etype.Any("el1", src / "a.txt"))
+    el = node.read_elements(["sel"])[0]
+    # another process is downloading the element, and this one waits on it
+    lock = node.base_dir / FETCHED_DIR / ".sel.el1.lock"
+    os.makedirs(lock.parent, exist_ok=True)
+    lock.touch()
+    with ThreadPoolExecutor(1) as pool:
+        waiting = pool.submit(node.fetch, el)
+        time.sleep(0.2)
+        assert not waiting.done()
+        # the other process lets go of its lock without having fetched the element, so this one fetches it itself
+        os.remove(lock)
+        waiting.result(timeout=30)
+    assert el.paths[0].read_text() == "a" * 100
+    assert not lock.exists()
+
+
+def test_replace_and_remove(additionals):
+    disk, node, src = additionals.disk, additionals.node, additionals.src
+    disk.write_element("sel", Etype.Any("el1", [src / "a.txt", src / "b.txt"]))
+    assert len(node.read_elements(["sel"])[0].paths) == 2
+
+    # an element that is written again replaces the one in the store, and other nodes download it again
+    disk.write_element("sel", Etype.Any("el1", src / "c.txt"))
+    el = node.read_elements(["sel"])[0]
+    assert [p.name for p in el.paths] == ["c.txt"]
+
+    disk.remove_element("sel", "el1")
+    assert node.read_elements(["sel"]) == []
+
+
+def test_multipart(additionals):
+    disk, node, src = additionals.disk, additionals.node, additionals.src
+    with open(src / "big.bin", "wb") as f:
+        f.write(os.urandom(11 << 20))
+    disk.write_element("sel", Etype.Any("el1", src / "big.bin"))
+    key = disk.key(disk.read_query("sel") / "el1" / "big.bin")
+    # NB: the ETag of an object uploaded in parts ends with their number
+    etag = disk.s3.client.head_object(Bucket=BUCKET, Key=key)["ETag"]
+    assert etag.strip('"').endswith("-3")
+    el = node.read_elements(["sel"])[0]
+    with open(el.paths[0], "rb") as a, open(src / "big.bin", "rb") as b:
+        assert a.read() == b.read()
+
+
+@pytest.mark.parametrize("index_format", ["csv", "columnar"])
+def test_elements_index(additionals, index_format):
+    disk, node = additionals.disk, additionals.node
+    disk.index_format = index_format
+    rows = [["id", "url", "comment"], [1, "a.com", "x"], [2, "b.com", "y"]]
+    disk.write_elements_index("sel", LocalElementsIndex(rows))
+    assert node.elements_index_format("sel") == index_format
+
+    read = node.read_elements_index("sel", ["id", "url"])
+    assert [vars(r) for r in read.rows] == [
+        {"id": "1", "url": "a.com"},
+        {"id": "2", "url": "b.com"},
+    ]
+    if index_format == "columnar":
+        # only the columns that are read are downloaded
+        cols = node.read_query("sel") / node.ELEMENTS_INDEX_COLUMNS
+        assert sorted(os.listdir(cols)) == [
+            "0.0.data.npy",
+            "0.0.offsets.npy",
+            "0.1.data.npy",
+            "0.1.offsets.npy",
+            "meta.json",
+        ]
+
+
+def test_analyse(additionals):
+    disk, node, src = additionals.disk, additionals.node, additionals.src
+    for idx in range(4):
+        disk.write_element("sel", Etype.Any(f"el{idx}", src / "b.txt"))
+    # the elements are downloaded by the node's worker processes, or ahead of them
+    UpperAnalyser({"elements_in": ["sel"]}, "upper", node).start_analysing()
+    els = disk.read_elements(["sel/upper"])
+    assert sorted(el.id for el in els) == [f"el{idx}" for idx in range(4)]
+    assert all(el.paths[0].read_text() == "B" * 100 for el in els)
+
+
+def test_archived(additionals):
+    disk, node, src = additionals.disk, additionals.node, additionals.src
+    disk.archive_min_files = 3
+    disk.write_element("sel", Etype.Any("el1", [src / f"{n}.txt" for n in "abc"]))
+    disk.write_element("sel", Etype.Any("el1", [src / f"{n}.jpg" for n in "abc"]))
+    # the shards and index of an archived element are stored in place of its files
+    objects = disk.s3.client.list_objects_v2(Bucket=BUCKET)["Contents"]
+    assert sorted(o["Key"].split("/")[-1] for o in objects) == [
+        "members-000000.tar",
+        "members.idx",
+    ]
+    el = node.read_elements(["sel"])[0]
+    assert [p.name for p in el.paths] == ["a.jpg", "b.jpg", "c.jpg"]
+    assert el.paths[1].read_bytes() == b"b" * 100
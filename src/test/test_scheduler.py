@@ -0,0 +1,98 @@
+import pytest
+import os
+from pathlib import Path
+from lib.common.etypes import Etype
+from lib.common.exceptions import InvalidSchedulerConfigError
+from lib.common.scheduler import (
+    phase_option,
+    executor_for,
+    worker_count,
+    chunk_size,
+    element_size,
+    order_elements,
+    schedule_for,
+    worker_limits,
+    IO_WORKERS,
+)
+from lib.common.util import MAX_CPUS
+
+
+@pytest.fixture
+def elements(utils):
+    base = Path(utils.TEMP_ELEMENT_DIR)
+    base.mkdir(parents=True, exist_ok=True)
+    els = []
+    for name, size in [("small", 10), ("large", 1000), ("medium", 100)]:
+        fp = base / f"{name}.mp4"
+        with open(fp, "wb") as f:
+            f.truncate(size)
+        els.append(Etype.Any(name, paths=[fp]))
+    yield els
+    utils.cleanup()
+
+
+def test_options():
+    assert worker_count({}) == MAX_CPUS + 1
+    assert worker_count({"workers": 3}) == 3
+    assert chunk_size({}) == 1
+    assert chunk_size({"chunk_size": 16}) == 16
+    assert chunk_size({"chunk_size": 0}) == 1
+
+
+def test_phase_options():
+    config = {"executor": {"retrieve": "threads"}, "workers": 8}
+    assert phase_option(config, "executor", "retrieve") == "threads"
+    assert phase_option(config, "executor", "analyse") is None
+    assert phase_option(config, "workers", "analyse") == 8
+
+    assert executor_for({}) == "processes"
+    assert executor_for({}, default="asyncio") == "asyncio"
+    assert executor_for(config, "retrieve", default="asyncio") == "threads"
+    assert executor_for(config, "analyse", default="asyncio") == "asyncio"
+    with pytest.raises(InvalidSchedulerConfigError):
+        executor_for({"executor": "fibers"})
+
+    assert worker_count({}, executor="threads") == IO_WORKERS
+    assert worker_count({"workers": {"retrieve": 64}}, "retrieve", "threads") == 64
+
+
+def test_schedule():
+    assert schedule_for({}) == "in_order"
+    assert schedule_for({"schedule": {"analyse": "longest_first"}}, "analyse") == (
+        "longest_first"
+    )
+    with pytest.raises(InvalidSchedulerConfigError):
+        schedule_for({"schedule": "shortest_first"})
+
+
+def test_worker_limits():
+    limits = worker_limits({})
+    assert limits.elements is None and limits.rss is None
+    assert limits.reached(10**6) is None
+
+    config = {"worker_max_elements": {"analyse": 100}, "worker_max_rss_mb": 512}
+    limits = worker_limits(config, "analyse")
+    assert limits.elements == 100
+    assert limits.rss == 512 << 20
+    assert limits.reached(99) is None
+    assert limits.reached(100) == "elements"
+    assert worker_limits(config, "retrieve").elements is None
+    assert worker_limits({"worker_max_rss_mb": 1}).reached(0) == "memory"
+
+
+def test_element_size(elements):
+    assert [element_size(e) for e in elements] == [10, 1000, 100]
+    # rows from an element index have no paths
+    assert element_size(lambda: None) == 0
+
+
+def test_order_elements(elements):
+    assert order_elements(elements, {}) == elements
+    longest_first = order_elements(elements, {"schedule": "longest_first"})
+    assert [e.id for e in longest_first] == ["large", "medium", "small"]
+    per_phase = order_elements(
+        elements, {"schedule": {"analyse": "longest_first"}}, "analyse"
+    )
+    assert [e.id for e in per_phase] == ["large", "medium", "small"]
+    with pytest.raises(InvalidSchedulerConfigError):
+        order_elements(elements, {"schedule": "shortest_first"})
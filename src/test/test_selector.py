@@ -1,6 +1,9 @@
 import pytest
 import os
 import csv
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from abc import ABC
 from pathlib import Path
 from lib.common.selector import Selector
@@ -12,7 +15,7 @@ from lib.common.exceptions import (
 )
 from lib.common.etypes import Etype, LocalElementsIndex
 from lib.common.storage import LocalStorage
-from test.utils import scaffold_elementmap, STUB_PATHS, list_files
+from test.utils import scaffold_elementmap, STUB_PATHS, list_files, TMP_DIR
 
 
 class EmptySelector(Selector):
@@ -38,6 +41,91 @@ class EmptySelector(Selector):
         return Etype.cast(row.id, row.path)
 
 
+class AsyncSelector(Selector):
+    out_etype = Etype.Any
+    in_parallel = True
+
+    def index(self, config):
+        return LocalElementsIndex(
+            rows=scaffold_elementmap([f"el{i}" for i in range(12)])
+        )
+
+    async def retrieve_element_async(self, row, config):
+        base = TMP_DIR / "async" / row.id
+        base.mkdir(parents=True, exist_ok=True)
+        await self.download(f"{config['url']}/{row.id}", base / "media.bin")
+        return Etype.cast(row.id, base / "media.bin")
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = SlowHandler
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        time.sleep(0.05)
+        body = self.path.encode() * 100
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with cls.lock:
+            cls.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class RateLimitedHandler(BaseHTTPRequestHandler):
+    # NB: connections are kept open, so that those that are reused can be counted
+    protocol_version = "HTTP/1.1"
+    asked = set()
+    clients = set()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = RateLimitedHandler
+        with cls.lock:
+            cls.clients.add(self.client_address)
+            first = self.path not in cls.asked
+            cls.asked.add(self.path)
+        # each file is refused the first time that it is asked for
+        status, body = (429, b"") if first else (200, self.path.encode() * 100)
+        self.send_response(status)
+        if first:
+            self.send_header("Retry-After", "1")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(handler):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+@pytest.fixture
+def server():
+    httpd = serve(SlowHandler)
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+@pytest.fixture
+def limited_server():
+    httpd = serve(RateLimitedHandler)
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
 @pytest.fixture
 def additionals(utils):
     obj = lambda: None
@@ -58,6 +146,21 @@ def test_cannot_instantiate(utils):
         Selector({}, "empty", utils.TEMP_ELEMENT_DIR)
 
 
+def test_retrieve_methods(utils):
+    class NoRetrieveSelector(Selector):
+        def index(self, config):
+            return None
+
+    class BothRetrieveSelector(EmptySelector):
+        async def retrieve_element_async(self, row, config):
+            return None
+
+    # a selector implements exactly one of the two ways to retrieve elements
+    for cls in [NoRetrieveSelector, BothRetrieveSelector]:
+        with pytest.raises(TypeError, match="exactly one of 'retrieve_element'"):
+            cls({}, "empty", LocalStorage(folder=utils.TEMP_ELEMENT_DIR))
+
+
 def test_init(utils, additionals):
     assert Path(utils.TEMP_ELEMENT_DIR) == additionals.emptySelector.disk.base_dir
     assert "empty" == additionals.emptySelector.name
@@ -81,6 +184,46 @@ def test_retrieve(additionals, utils):
         assert os.path.isfile(img)
 
 
+def test_retrieve_async(utils, server):
+    utils.setup()
+    selector = AsyncSelector(
+        {"url": server, "workers": 8, "per_host": 3},
+        "async",
+        LocalStorage(folder=utils.TEMP_ELEMENT_DIR),
+    )
+    assert selector.retrieves_async
+    selector.start_indexing()
+    selector.start_retrieving()
+    pth = selector.disk.read_query("async")
+    for i in range(12):
+        with open(pth / f"el{i}/media.bin", "rb") as f:
+            assert f.read() == f"/el{i}".encode() * 100
+    # all elements were in flight at once, but only 'per_host' requests to the one server
+    assert SlowHandler.max_in_flight == 3
+    utils.cleanup()
+
+
+def test_retrieve_rate_limited(utils, limited_server):
+    utils.setup()
+    selector = AsyncSelector(
+        {"url": limited_server, "workers": 8, "per_host": 3, "retry_delay_ms": 1},
+        "async",
+        LocalStorage(folder=utils.TEMP_ELEMENT_DIR),
+    )
+    selector.start_indexing()
+    selector.start_retrieving()
+    pth = selector.disk.read_query("async")
+    for i in range(12):
+        with open(pth / f"el{i}/media.bin", "rb") as f:
+            assert f.read() == f"/el{i}".encode() * 100
+    # each element was retried once, as late as the server asked
+    assert selector.retry_stats["retries"] == 12
+    assert selector.retry_stats["delay"] >= 12
+    # the first attempts share a session, as do the retries, each with no more connections than requests in flight
+    assert len(RateLimitedHandler.clients) <= 2 * 3
+    utils.cleanup()
+
+
 # the values that are returned from retrieve need to be managed in Python differently according to what kind of data
 # they represent.
 #
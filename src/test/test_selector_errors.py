@@ -13,7 +13,7 @@ from test.utils import scaffold_elementmap
 import pdb
 
 
-class BasicErrorSelector(Selector):
+class ErrorSelector(Selector):
     out_etype = Etype.Any
 
     def __init__(self, *args):
@@ -28,7 +28,7 @@ class BasicErrorSelector(Selector):
             elements = ["skip", "retry3", "retryN", "pass"]
             return LocalElementsIndex(rows=scaffold_elementmap(elements))
 
-    def retrieve_element(self, element, config) -> LocalElement:
+    def raise_for(self, element):
         if element.id == "skip":
             raise ElementShouldSkipError("test")
         elif element.id == "retry3" and self.retryCount < 3:
@@ -36,8 +36,12 @@ class BasicErrorSelector(Selector):
             raise ElementShouldRetryError("test")
         elif element.id == "retryN":
             raise ElementShouldRetryError("test")
-        else:
-            return None
+
+
+class BasicErrorSelector(ErrorSelector):
+    def retrieve_element(self, element, config) -> LocalElement:
+        self.raise_for(element)
+        return None
 
 
 class RetrieveErrorSelector(BasicErrorSelector):
@@ -49,6 +53,12 @@ class RetrieveErrorSelector(BasicErrorSelector):
             f.write("something")
 
 
+class AsyncErrorSelector(ErrorSelector):
+    async def retrieve_element_async(self, element, config):
+        self.raise_for(element)
+        return None
+
+
 class BadIndexSelector(Selector):
     out_etype = Etype.Any
 
@@ -70,16 +80,22 @@ def additionals(utils):
     )
 
     castModule = "castErrorSelector"
-    castConfig = {"dev": True}
+    castConfig = {"dev": True, "retry_delay_ms": 1}
     obj.castErrorSelector = BasicErrorSelector(
         castConfig, castModule, LocalStorage(folder=utils.TEMP_ELEMENT_DIR)
     )
 
     retrieveModule = "retrieveErrorSelector"
-    retrieveConfig = {"dev": True}
+    retrieveConfig = {"dev": True, "retry_delay_ms": 1}
     obj.retrieveErrorSelector = RetrieveErrorSelector(
         retrieveConfig, retrieveModule, LocalStorage(folder=utils.TEMP_ELEMENT_DIR)
     )
+    asyncModule = "asyncErrorSelector"
+    obj.asyncErrorSelector = AsyncErrorSelector(
+        {"dev": True, "retry_delay_ms": 1},
+        asyncModule,
+        LocalStorage(folder=utils.TEMP_ELEMENT_DIR),
+    )
     yield obj
     utils.cleanup()
 
@@ -118,6 +134,15 @@ def test_integration_1(utils, additionals):
     assert not os.path.exists(pass_path)
 
 
+def test_integration_async(utils, additionals):
+    additionals.asyncErrorSelector.start_indexing()
+    additionals.asyncErrorSelector.start_retrieving()
+
+    assert additionals.asyncErrorSelector.retryCount == 3
+    for el in ["skip", "retryN", "retry3", "pass"]:
+        assert not os.path.exists(utils.get_element_path("asyncErrorSelector", el))
+
+
 def integration_2(utils, additionals):
     additionals.retrieveErrorSelector.start_indexing()
     additionals.retrieveErrorSelector.start_retrieving(in_parallel=False)
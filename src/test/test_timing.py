@@ -0,0 +1,71 @@
+import os
+import time
+from lib.common.timing import (
+    Timer,
+    io_counters,
+    add_counters,
+    trace_event,
+    format_event,
+    ELEMENT,
+    PROCESS,
+)
+
+
+def test_timer(tmp_path):
+    with Timer("el1", ELEMENT, attempt=2) as t:
+        with open(tmp_path / "out.bin", "wb") as f:
+            f.write(b"x" * 4096)
+        with open(tmp_path / "out.bin", "rb") as f:
+            f.read()
+        sum(range(100000))
+    e = t.event
+    assert e["name"] == "el1"
+    assert e["cat"] == ELEMENT
+    assert e["attempt"] == 2
+    assert e["pid"] == os.getpid()
+    assert e["wall"] > 0
+    assert 0 < e["cpu"] <= e["wall"] + 0.01
+    assert e["written"] >= 4096
+    assert e["read"] >= 4096
+
+
+def test_wall_only():
+    with Timer("el1", ELEMENT, counters=False) as t:
+        time.sleep(0.01)
+    assert t.event["wall"] >= 0.01
+    assert t.event["cpu"] is None
+    assert t.event["read"] is None
+    assert "CPU" not in format_event(t.event)
+
+
+def test_counters():
+    assert io_counters() is not None
+    assert io_counters(PROCESS)[0] >= io_counters()[0]
+    e = {"cpu": 1.0, "read": 10, "written": None}
+    add_counters(e, {"cpu": 0.5, "read": 5, "written": 3})
+    assert e == {"cpu": 1.5, "read": 15, "written": None}
+
+
+def test_trace_event():
+    e = {
+        "name": "el1",
+        "cat": ELEMENT,
+        "ts": 10.5,
+        "wall": 0.25,
+        "cpu": 0.1,
+        "read": 0,
+        "written": 100,
+        "pid": 1,
+        "tid": 2,
+        "phase": "analyse",
+    }
+    assert trace_event(e) == {
+        "name": "el1",
+        "cat": ELEMENT,
+        "ph": "X",
+        "ts": 10500000,
+        "dur": 250000,
+        "pid": 1,
+        "tid": 2,
+        "args": {"cpu": 0.1, "read": 0, "written": 100, "phase": "analyse"},
+    }
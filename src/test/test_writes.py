@@ -0,0 +1,111 @@
+import os
+import errno
+import pytest
+from lib.common import writes
+from lib.common.writes import (
+    write_file,
+    move_file,
+    write_stats,
+    diff_stats,
+    REFLINK,
+    HARDLINK,
+    COPY_RANGE,
+    COPY,
+    MOVE,
+)
+from lib.common.etypes import Etype
+from lib.common.mtmodule import MTModule
+from lib.common.storage import LocalStorage
+
+
+class WritingClass(MTModule):
+    in_parallel = True
+
+    @MTModule.phase("writekey")
+    def func(self, gen):
+        for el in gen:
+            path = self.disk.base_dir / f".{el}.txt"
+            path.write_text("x" * 1000)
+            self.disk.write_element("sel", Etype.Any(f"el{el}", path))
+
+
+@pytest.fixture
+def additionals(utils):
+    obj = lambda: None
+    obj.BASE_DIR = utils.TEMP_ELEMENT_DIR
+    obj.disk = LocalStorage(folder=utils.TEMP_ELEMENT_DIR)
+    obj.src = obj.disk.base_dir / "a.txt"
+    obj.src.write_text("a" * 1000)
+    obj.tmp = "/tmp/mtriage_write.txt"
+    with open(obj.tmp, "w") as f:
+        f.write("b" * 1000)
+    yield obj
+    utils.cleanup()
+
+
+def test_write_file(additionals):
+    src, dest = additionals.src, additionals.disk.base_dir / "b.txt"
+    before = write_stats()
+    # a file within the folder is linked rather than copied
+    assert write_file(src, dest) in [REFLINK, HARDLINK]
+    assert dest.read_text() == src.read_text()
+    assert write_file(src, dest, [COPY]) == COPY
+    assert os.stat(dest).st_ino != os.stat(src).st_ino
+    stats = diff_stats(write_stats(), before)
+    assert sum(n for n, _ in stats.values()) == 2
+    assert sum(size for _, size in stats.values()) == 2000
+
+
+def test_no_write_through(additionals):
+    src, dest = additionals.src, additionals.disk.base_dir / "b.txt"
+    assert write_file(src, dest, [HARDLINK]) == HARDLINK
+    assert os.stat(dest).st_ino == os.stat(src).st_ino
+    # a file written over one that shares its inode leaves the other as it was
+    write_file(additionals.tmp, dest)
+    assert dest.read_text() == "b" * 1000
+    assert src.read_text() == "a" * 1000
+
+
+def test_temp_files_not_hardlinked(additionals):
+    dest = additionals.disk.base_dir / "b.txt"
+    assert write_file(additionals.tmp, dest, [HARDLINK, COPY_RANGE, COPY]) != HARDLINK
+    assert os.stat(dest).st_ino != os.stat(additionals.tmp).st_ino
+
+
+def test_unsupported_cached(additionals, monkeypatch):
+    calls = []
+
+    def unsupported(src, dest):
+        calls.append(src)
+        raise OSError(errno.EOPNOTSUPP, "not supported")
+
+    monkeypatch.setitem(writes.WRITERS, REFLINK, unsupported)
+    monkeypatch.setattr(writes, "FILESYSTEMS", {})
+    for name in ["b.txt", "c.txt", "d.txt"]:
+        dest = additionals.disk.base_dir / name
+        assert write_file(additionals.src, dest, [REFLINK, COPY]) == COPY
+    # a strategy that isn't supported between two filesystems is only tried once
+    assert len(calls) == 1
+
+
+def test_move_file(additionals):
+    dest = additionals.disk.base_dir / "b.txt"
+    assert move_file(additionals.src, dest) == MOVE
+    assert not additionals.src.exists()
+    assert dest.read_text() == "a" * 1000
+
+
+@pytest.mark.parametrize("executor", ["processes", "threads"])
+def test_phase_stats(additionals, executor):
+    mod = WritingClass(
+        {"timing": True, "executor": executor},
+        "my_writing_mod",
+        LocalStorage(folder=additionals.BASE_DIR),
+    )
+    mod.func(a for a in range(10))
+    assert len(mod.disk.read_elements(["sel"])) == 10
+    # the files written by every worker are counted once
+    stats = mod.phase_event["writes"]
+    assert sum(n for n, _ in stats.values()) == 10
+    assert sum(size for _, size in stats.values()) == 10000
+    assert COPY not in stats
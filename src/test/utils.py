@@ -67,8 +67,14 @@ def cleanup():
     if Path(TEMP_ELEMENT_DIR).exists():
         shutil.rmtree(TEMP_ELEMENT_DIR)
     if TMP_DIR.exists():
-        shutil.rmtree(TMP_DIR)
-        TMP_DIR.mkdir()
+        # NB: multiprocessing's own temp dir holds the sockets of the forkserver and managers, which outlive a test
+        for p in TMP_DIR.iterdir():
+            if p.name.startswith("pymp-"):
+                continue
+            if p.is_dir() and not p.is_symlink():
+                shutil.rmtree(p)
+            else:
+                p.unlink()
 
 
 def listOfDictsEqual(l1, l2):
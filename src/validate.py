@@ -54,6 +54,18 @@ def validate_yaml(cfg: dict) -> bool:
     if "folder" not in keys or not isinstance(cfg["folder"], str):
         raise InvalidYamlError("The folder attribute must exist and be a string")
 
+    if "storage" in keys:
+        storage = cfg["storage"]
+        if not isinstance(storage, dict) or storage.get("type", "local") not in [
+            "local",
+            "s3",
+        ]:
+            raise InvalidYamlError(
+                "The storage attribute must be a dict with a type of 'local' or 's3'"
+            )
+        if storage.get("type") == "s3" and "bucket" not in storage:
+            raise InvalidYamlError("An 's3' storage must specify a 'bucket'")
+
     if "phase" in keys or "module" in keys:
         # confirm good phase yaml
         if "module" not in keys:
@@ -94,6 +94,15 @@ class TestBuild(unittest.TestCase):
         pipfile = [x for x in pipfile if x != "\n"]
         self.assertListEqual(pipfile, expected_pipfile)
 
+    def test_test_deps(self):
+        args = parse_args(["dev", "build", "--dry"])
+        cmd, dfile, pipfile = build(args)
+        self.assertNotIn("moto[server]\n", pipfile)
+
+        args = parse_args(["dev", "build", "--test", "--dry"])
+        cmd, dfile, pipfile = build(args)
+        self.assertIn("moto[server]\n", pipfile)
+
     def test_custom_tags(self):
         args = parse_args(["dev", "build", "--tag", "CUSTOM_TAG", "--dry"])
         cmd, dfile, pipfile = build(args)